@@ -1,31 +1,126 @@
 # app.py - Backend aplikace
 import os
 import requests
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, g
 from flask import send_from_directory
 from dotenv import load_dotenv
 import json
 import re
-from urllib.parse import urljoin
-from bs4 import BeautifulSoup
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Načtení proměnných prostředí ze souboru .env
 load_dotenv()
 
-app = Flask(__name__)
+# Lokální moduly čtou svá nastavení z prostředí, proto se importují až po load_dotenv()
+from cache import PersistentCache, PrefixCache
+from singleflight import SingleFlight
+import upstream
+from upstream import SEARCH_API_URL
+from scraper import (unique_autocomplete_items, build_search_result, image_page_candidates, ImageProbe,
+                     details_page_candidates, has_details, build_details, search_result_details, decode_page,
+                     autocomplete_barcode_match)
+from extractor import parse_details_page
+from nutrition import aggregate_recipes, numeric_details, NUTRIENT_UNITS
+from barcode_index import BarcodeIndex, BARCODE_INDEX_PATH, normalize_ean
+import ean_decoder
+import metrics
+import prewarm
+import scheduler
 
-#  URL pro autocomplete API KalorickýchTabulky.cz
-SEARCH_API_URL = "https://www.kaloricketabulky.cz/autocomplete/foodstuff-activity-meal"
-# Základní URL pro detailní stránky
-BASE_WEB_URL = "https://www.kaloricketabulky.cz"
+app = Flask(__name__)
 
-# Výchozí HTTP hlavičky pro simulaci prohlížeče
-DEFAULT_HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-    'Accept': 'application/json, text/plain, */*',
-    'Referer': 'https://www.kaloricketabulky.cz/'
-}
+# Maximální počet souběžně dohledávaných obrázků (sdílený pool pro celý worker)
+SEARCH_IMAGE_WORKERS = int(os.getenv('SEARCH_IMAGE_WORKERS', '8'))
+# Výchozí pořadí streamovaných výsledků:
+# 'stable' = pořadí podle autocomplete API, 'completion' = každý řádek hned, jakmile je hotový
+SEARCH_STREAM_ORDER = os.getenv('SEARCH_STREAM_ORDER', 'stable')
+SEARCH_STREAM_ORDERS = ('stable', 'completion')
+# Nutriční hodnoty v řádcích výsledků vyhledávání:
+# 'none' = jen název, energie a obrázek, 'macros' = navíc protein/carbs/fat, 'full' = navíc celý slovník 'details'
+SEARCH_DETAILS = os.getenv('SEARCH_DETAILS', 'none')
+SEARCH_DETAILS_MODES = ('none', 'macros', 'full')
+
+# Hledání obrázku čte detailní stránku po částech a skončí u prvního obrázku nebo po tomto počtu bajtů
+IMAGE_PROBE_MAX_BYTES = int(os.getenv('IMAGE_PROBE_MAX_BYTES', str(512 * 1024)))
+IMAGE_PROBE_CHUNK_SIZE = int(os.getenv('IMAGE_PROBE_CHUNK_SIZE', str(8 * 1024)))
+
+# Pool vláken pro dohledávání obrázků k výsledkům vyhledávání
+image_executor = ThreadPoolExecutor(max_workers=SEARCH_IMAGE_WORKERS, thread_name_prefix='image')
+
+# Dávkové /get_details_batch: počet souběžně načítaných detailů (sdílený pool) a maximální velikost dávky
+DETAILS_BATCH_WORKERS = int(os.getenv('DETAILS_BATCH_WORKERS', '8'))
+DETAILS_BATCH_MAX_ITEMS = int(os.getenv('DETAILS_BATCH_MAX_ITEMS', '100'))
+details_executor = ThreadPoolExecutor(max_workers=DETAILS_BATCH_WORKERS, thread_name_prefix='details')
+
+# Formát detailů: 'text' = řetězce jako na webu ("12,5 g", "N/A"), 'numeric' = čísla v základních jednotkách
+DETAILS_FORMAT = os.getenv('DETAILS_FORMAT', 'text')
+DETAILS_FORMATS = ('text', 'numeric')
+
+# Cache výsledků /get_details podle (slug, food_type) - v paměti (LRU) a v SQLite na disku
+DETAILS_CACHE_TTL = int(os.getenv('DETAILS_CACHE_TTL', str(24 * 60 * 60)))  # sekundy
+DETAILS_CACHE_MAX_BYTES = int(os.getenv('DETAILS_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+DETAILS_CACHE_MAX_DISK_BYTES = int(os.getenv('DETAILS_CACHE_MAX_DISK_BYTES', str(256 * 1024 * 1024)))
+details_cache = PersistentCache('details', ttl=DETAILS_CACHE_TTL, max_bytes=DETAILS_CACHE_MAX_BYTES,
+                                max_disk_bytes=DETAILS_CACHE_MAX_DISK_BYTES)
+
+# Perzistentní index slug -> {image_url, food_type}, aby /search nemusel znovu scrapovat detailní stránky
+IMAGE_INDEX_TTL = int(os.getenv('IMAGE_INDEX_TTL', str(30 * 24 * 60 * 60)))  # sekundy
+# Slugy, u kterých se obrázek nenašel, zkusíme znovu dříve
+IMAGE_INDEX_NEGATIVE_TTL = int(os.getenv('IMAGE_INDEX_NEGATIVE_TTL', str(24 * 60 * 60)))
+IMAGE_INDEX_MAX_BYTES = int(os.getenv('IMAGE_INDEX_MAX_BYTES', str(4 * 1024 * 1024)))
+IMAGE_INDEX_MAX_DISK_BYTES = int(os.getenv('IMAGE_INDEX_MAX_DISK_BYTES', str(64 * 1024 * 1024)))
+image_index = PersistentCache('images', ttl=IMAGE_INDEX_TTL, max_bytes=IMAGE_INDEX_MAX_BYTES,
+                              max_disk_bytes=IMAGE_INDEX_MAX_DISK_BYTES)
+
+# Cache odpovědí autocomplete API podle normalizovaného dotazu (zpřesněné dotazy se řeší lokálně)
+AUTOCOMPLETE_CACHE_TTL = int(os.getenv('AUTOCOMPLETE_CACHE_TTL', str(60 * 60)))  # sekundy
+AUTOCOMPLETE_CACHE_MAX_ENTRIES = int(os.getenv('AUTOCOMPLETE_CACHE_MAX_ENTRIES', '5000'))
+# Maximální počet položek, které autocomplete API vrací (0 = zjistí se z odpovědí)
+AUTOCOMPLETE_RESULT_LIMIT = int(os.getenv('AUTOCOMPLETE_RESULT_LIMIT', '0'))
+autocomplete_cache = PrefixCache(ttl=AUTOCOMPLETE_CACHE_TTL, max_entries=AUTOCOMPLETE_CACHE_MAX_ENTRIES,
+                                 result_limit=AUTOCOMPLETE_RESULT_LIMIT)
+
+# Index čárových kódů EAN -> slug, food_type (binární soubor sdílený workery přes mmap)
+barcode_index = BarcodeIndex(BARCODE_INDEX_PATH)
+# Kódy mimo index, ke kterým se potravina dohledala přes autocomplete API podle názvu
+BARCODE_CACHE_TTL = int(os.getenv('BARCODE_CACHE_TTL', str(30 * 24 * 60 * 60)))  # sekundy
+BARCODE_CACHE_NEGATIVE_TTL = int(os.getenv('BARCODE_CACHE_NEGATIVE_TTL', str(24 * 60 * 60)))
+BARCODE_CACHE_MAX_BYTES = int(os.getenv('BARCODE_CACHE_MAX_BYTES', str(1024 * 1024)))
+BARCODE_CACHE_MAX_DISK_BYTES = int(os.getenv('BARCODE_CACHE_MAX_DISK_BYTES', str(16 * 1024 * 1024)))
+barcode_cache = PersistentCache('barcodes', ttl=BARCODE_CACHE_TTL, max_bytes=BARCODE_CACHE_MAX_BYTES,
+                                max_disk_bytes=BARCODE_CACHE_MAX_DISK_BYTES)
+# Maximální počet kódů v jednom požadavku /search_by_barcode_batch
+BARCODE_BATCH_MAX_ITEMS = int(os.getenv('BARCODE_BATCH_MAX_ITEMS', '500'))
+# /decode_barcode: maximální počet snímků v jednom požadavku a velikost jednoho snímku
+BARCODE_FRAMES_MAX = int(os.getenv('BARCODE_FRAMES_MAX', '8'))
+BARCODE_FRAME_MAX_BYTES = int(os.getenv('BARCODE_FRAME_MAX_BYTES', str(4 * 1024 * 1024)))
+# Největší tělo požadavku (všechny snímky /decode_barcode + rezerva na multipart hlavičky). Větší tělo se
+# odmítne s 413 dřív, než se načte do paměti - i u přenosu bez Content-Length
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', str(BARCODE_FRAMES_MAX * BARCODE_FRAME_MAX_BYTES + 64 * 1024)))
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+# Souběžné požadavky na stejný autocomplete dotaz, stejnou stránku s obrázkem nebo stejné detaily
+# sdílí v rámci workeru jedno stahování a parsování
+autocomplete_flight = SingleFlight('autocomplete')
+image_flight = SingleFlight('images')
+details_flight = SingleFlight('details')
+
+# Ladicí režim: hlavička Server-Timing u /get_details a /search_by_barcode a objekt _timing v řádcích /search
+# (lze zapnout i pro jeden požadavek parametrem "timing": true)
+DEBUG_TIMING = os.getenv('DEBUG_TIMING', 'false').lower() in ('1', 'true', 'yes')
+SERVER_TIMING_ROUTES = ('/get_details', '/search_by_barcode')
+
+# Počítadla zásahů cache pro /metrics (sčítají se napříč workery)
+metrics.register_cache('details', lambda: {'hit': details_cache.hits, 'miss': details_cache.misses})
+metrics.register_cache('images', lambda: {'hit': image_index.hits, 'miss': image_index.misses})
+metrics.register_cache('autocomplete', lambda: {'hit': autocomplete_cache.hits, 'prefix_hit': autocomplete_cache.prefix_hits,
+                                                'miss': autocomplete_cache.misses})
+metrics.register_cache('barcode_index', lambda: {'hit': barcode_index.hits, 'miss': barcode_index.lookups - barcode_index.hits})
+metrics.register_cache('barcodes', lambda: {'hit': barcode_cache.hits, 'miss': barcode_cache.misses})
+# Sdílená stahování se počítají jako zásah "cache" rozpracovaných požadavků
+for flight in (autocomplete_flight, image_flight, details_flight):
+    metrics.register_cache(f'in_flight_{flight.name}', lambda flight=flight: {'hit': flight.shared, 'miss': flight.leaders})
 
 # Získání Firebase konfiguračních proměnných z prostředí
 app_id = os.getenv('__APP_ID', 'default-app-id')
@@ -68,6 +163,32 @@ except Exception as e:
     print(f"Neočekávaná chyba při zpracování Firebase konfigurace: {e}")
     firebase_config_json_for_frontend = '{}'
 
+def timing_requested(data):
+    """Zda se mají pro požadavek měřit časy fází (DEBUG_TIMING, nebo parametr "timing": true)."""
+    return DEBUG_TIMING or (isinstance(data, dict) and data.get('timing') is True)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Měření fází se nastavuje u každého požadavku, aby vlákno nepřevzalo měření předchozího
+    g.timing = metrics.start_timing(request.url_rule is not None and request.url_rule.rule in metrics.TIMED_ROUTES
+                                    and timing_requested(request.get_json(silent=True)))
+
+@app.after_request
+def record_request_duration(response):
+    """Zaznamená dobu zpracování měřených rout; NDJSON stream měří až metrics.timed_stream()."""
+    route = request.url_rule.rule if request.url_rule else None
+    if route in metrics.TIMED_ROUTES and response.mimetype != 'application/json-stream':
+        metrics.observe_request(route, response.status_code, time.perf_counter() - g.request_started)
+    if route in SERVER_TIMING_ROUTES and g.get('timing') is not None:
+        response.headers['Server-Timing'] = g.timing.server_timing()
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metriky ve formátu Prometheus (součet za všechny workery)."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/favicon.ico')
 def favicon():
     return send_from_directory(os.path.join(app.root_path, 'static'),
@@ -81,140 +202,250 @@ def index():
                            app_id=app_id,
                            firebase_config_json=firebase_config_json_for_frontend)
 
+def probe_image(url, read_full=False):
+    """
+    Stáhne detailní stránku po částech a vrátí (URL náhledu prvního obrázku nebo None, HTML stránky nebo None).
+    Spojení se zavře hned po nalezení obrázku nebo po IMAGE_PROBE_MAX_BYTES bajtech, pokud není read_full.
+    HTML se vrací jen tehdy, když byla stránka přečtena celá - lze ji pak použít i pro /get_details.
+    Souběžná hledání na stejné URL sdílí jedno stažení.
+    """
+    return image_flight.do((url, read_full), fetch_image_probe, url, read_full)
+
+def fetch_image_probe(url, read_full=False):
+    """Vlastní stažení stránky pro probe_image()."""
+    started = time.perf_counter()
+    chunks = []
+    try:
+        with upstream.get(url, kind='image', stream=True) as response:
+            response.raise_for_status()
+            probe = ImageProbe(response.encoding, max_bytes=None if read_full else IMAGE_PROBE_MAX_BYTES)
+            for chunk in response.iter_content(chunk_size=IMAGE_PROBE_CHUNK_SIZE):
+                chunks.append(chunk)
+                if probe.feed(chunk) and not read_full:
+                    return probe.image_url, None
+            probe.finish()
+            return probe.image_url, decode_page(b''.join(chunks), response.encoding)
+    finally:
+        downloaded_bytes = sum(map(len, chunks))
+        metrics.inc('kalkulacka_upstream_bytes_total', downloaded_bytes, kind='image')
+        metrics.add_timing('upstream', time.perf_counter() - started)
+        metrics.add_timing_count('bytes', downloaded_bytes)
+
+def remember_page_details(slug, food_type, fetched_pages):
+    """
+    Zpracuje detailní stránky stažené při hledání obrázku a uloží je do details_cache,
+    aby následné /get_details pro stejný výsledek nemuselo stránku stahovat znovu.
+    fetched_pages: {food_type: (url, html)}. Vrací detaily pro food_type výsledku, nebo None.
+    """
+    # Bez nalezeného obrázku frontend pošle food_type None a /get_details zkusí nejprve /potraviny/
+    page_type = food_type or 'potravina'
+    if page_type not in fetched_pages:
+        return None
+    url, html = fetched_pages[page_type]
+    parse_started = time.perf_counter()
+    scraped_data = parse_details_page(html, url, is_recipe_page=(page_type == 'recept'))
+    metrics.observe('kalkulacka_parse_duration_seconds', time.perf_counter() - parse_started, page=page_type)
+    if not has_details(scraped_data):
+        return None
+    details = build_details(scraped_data)
+    details_cache.set((slug, page_type), details)
+    if page_type == 'potravina':
+        details_cache.set((slug, None), details)
+    return details
+
+def scrape_item_image(food_url_slug, include_details=False):
+    """
+    Dohledá obrázek položky na detailní stránce receptu nebo potraviny a uloží výsledek do image_index.
+    S include_details se stránka čte celá a její detaily se rovnou uloží pro /get_details.
+    Vrací (URL obrázku nebo None, food_type nebo None, detaily nebo None, zda některý pokus selhal
+    jinou chybou než HTTP - timeout, spojení...).
+    """
+    image_url = None
+    food_type = None
+    fetched_pages = {} # food_type -> (url, html) celých stažených detailních stránek
+    probe_failed = False
+
+    for attempt, (current_image_fetch_url, current_food_type) in enumerate(image_page_candidates(food_url_slug)):
+        if attempt:
+            metrics.add_timing_count('retries')
+        try:
+            # Tempo požadavků hlídá společný rozpočet v upstream.get(); při vyčerpaném rozpočtu se obrázek
+            # odloží (RateLimited) a do indexu se neuloží, takže se dohledá při dalším hledání
+            image_url, page_html = probe_image(current_image_fetch_url, read_full=include_details)
+            if page_html is not None:
+                fetched_pages[current_food_type] = (current_image_fetch_url, page_html)
+            if image_url:
+                food_type = current_food_type # Set food_type based on successful URL
+                break # Image found, exit loop
+        except requests.exceptions.HTTPError as e:
+            # Jen 404 znamená, že stránka v této sekci není; 5xx nebo 429 je přechodná chyba a nic se neindexuje
+            if e.response is None or e.response.status_code != 404:
+                probe_failed = True
+        except requests.exceptions.RequestException as e:
+            probe_failed = True
+        except Exception as e:
+            probe_failed = True
+
+    # Do indexu uložíme nalezený obrázek i jistotu, že žádný není (ale ne výsledek přechodné chyby)
+    if image_url:
+        image_index.set(food_url_slug, {"image_url": image_url, "food_type": food_type})
+    elif not probe_failed:
+        image_index.set(food_url_slug, {"image_url": None, "food_type": None}, ttl=IMAGE_INDEX_NEGATIVE_TTL)
+
+    try:
+        details = remember_page_details(food_url_slug, food_type, fetched_pages)
+    except Exception as e:
+        details = None
+    return image_url, food_type, details, probe_failed
+
+def resolve_search_item(item, details_mode='none'):
+    """
+    Sestaví jeden řádek výsledku vyhledávání z položky autocomplete API.
+    Pokud má položka obrázek, pokusí se ho dohledat na detailní stránce receptu nebo potraviny.
+    Stažené detailní stránky se rovnou zpracují pro /get_details; s details_mode 'macros' nebo 'full'
+    se nutriční hodnoty přidají i do řádku výsledku.
+    Běží ve vlákně z image_executor, proto nesmí vyhazovat výjimky.
+    """
+    include_details = details_mode != 'none'
+    food_has_image = item.get('hasImage', False)
+    food_url_slug = item.get('url') # This already contains /potraviny/ or /recepty/
+
+    image_url = None
+    food_type = None # Initialize food_type
+    details = None
+
+    if food_has_image and food_url_slug:
+        prewarm.record('image', food_url_slug)
+    indexed_image = image_index.get(food_url_slug) if food_has_image and food_url_slug else None
+    if indexed_image is not None:
+        # Slug už známe z dřívějšího vyhledávání - detailní stránky nestahujeme
+        image_url = indexed_image.get("image_url")
+        food_type = indexed_image.get("food_type")
+
+    elif food_has_image and food_url_slug:
+        image_url, food_type, details, _ = scrape_item_image(food_url_slug, include_details)
+
+    result = build_search_result(item, image_url, food_type)
+    if include_details:
+        if details is None and food_url_slug:
+            # Detaily k řádku vyhledávání jsou doplněk - nesmí zdržet /get_details ani čárové kódy
+            with scheduler.priority('enrichment'):
+                details = load_details(food_url_slug, food_type)
+        result.update(search_result_details(details, details_mode))
+    return result
+
+def timed_search_item(item, details_mode='none'):
+    """resolve_search_item() s měřením fází - řádek výsledku dostane objekt _timing (ladicí režim)."""
+    timing = metrics.start_timing()
+    try:
+        result = resolve_search_item(item, details_mode)
+    finally:
+        metrics.start_timing(False)  # vlákno z image_executor slouží i dalším požadavkům
+    result["_timing"] = timing.as_dict()
+    return result
+
+class AutocompleteFormatError(ValueError):
+    """Autocomplete API vrátilo něco jiného než seznam položek."""
+
+
+def fetch_autocomplete(query):
+    """
+    Vrátí položky autocomplete API pro dotaz - z cache, nebo z API (3 pokusy).
+    Při selhání komunikace vyhodí requests.exceptions.RequestException, při neočekávané odpovědi
+    AutocompleteFormatError nebo ValueError (neplatný JSON).
+    """
+    autocomplete_data = autocomplete_cache.get(query)
+    if autocomplete_data is not None:
+        return autocomplete_data
+    # Stejný dotaz od více uživatelů najednou se na API posílá jen jednou
+    return autocomplete_flight.do(PrefixCache.normalize(query), fetch_autocomplete_uncached, query)
+
+def fetch_autocomplete_uncached(query):
+    """Stáhne položky autocomplete API pro dotaz (3 pokusy) a uloží je do cache."""
+    # Přidejte timeout a opakování při chybě:
+    max_retries = 3
+    retry_delay = 0.5  # sekundy
+
+    for attempt in range(max_retries):
+        try:
+            autocomplete_response = upstream.get(SEARCH_API_URL, kind='autocomplete', params={'query': query})
+            autocomplete_response.raise_for_status()
+            break
+        except requests.exceptions.RequestException as e:
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(retry_delay)
+            metrics.inc('kalkulacka_upstream_sleep_seconds_total', retry_delay, kind='autocomplete')
+            metrics.add_timing_count('retries')
+    autocomplete_data = autocomplete_response.json()
+
+    if not isinstance(autocomplete_data, list):
+        raise AutocompleteFormatError("Server vrátil neočekávaný formát autocomplete dat (není seznam).")
+
+    autocomplete_cache.set(query, autocomplete_data)
+    return autocomplete_data
+
 @app.route('/search', methods=['POST'])
 def search_food():
     """
     Zpracovává vyhledávací požadavek z frontendu a streamuje výsledky.
-    Nejprve volá autocomplete API a poté se pokouší scrapovat obrázky z detailních stránek potravin nebo receptů.
+    Nejprve volá autocomplete API a poté souběžně (v image_executor) scrapuje obrázky z detailních stránek potravin nebo receptů.
+    Volitelný parametr 'order' ('stable' nebo 'completion') určuje pořadí streamovaných řádků,
+    parametr 'details' ('none', 'macros' nebo 'full') přidá do řádků nutriční hodnoty.
+    S parametrem 'timing': true (nebo DEBUG_TIMING) má každý řádek objekt _timing s časy fází.
     """
     # Přidejte podporu pro přímé předání názvu bez formuláře
     if request.is_json:
         query = request.json.get('query')
+        stream_order = request.json.get('order') or SEARCH_STREAM_ORDER
+        details_mode = request.json.get('details') or SEARCH_DETAILS
     else:
         query = request.form.get('query')
+        stream_order = request.form.get('order') or SEARCH_STREAM_ORDER
+        details_mode = request.form.get('details') or SEARCH_DETAILS
     
     if not query:
         return jsonify({"error": "Prosím, zadejte hledaný výraz."}), 400
 
+    if stream_order not in SEARCH_STREAM_ORDERS:
+        return jsonify({"error": f"Neplatné pořadí výsledků: {stream_order}. Povolené hodnoty: {', '.join(SEARCH_STREAM_ORDERS)}."}), 400
+
+    if details_mode not in SEARCH_DETAILS_MODES:
+        return jsonify({"error": f"Neplatný režim detailů: {details_mode}. Povolené hodnoty: {', '.join(SEARCH_DETAILS_MODES)}."}), 400
+
+    include_timing = g.timing is not None
+    prewarm.record('query', PrefixCache.normalize(query))
+
     def generate_results():
         """Generátorová funkce pro postupné odesílání výsledků."""
         try:
-            params = {'query': query}
-
-            # Krok 1: Vyhledání pomocí autocomplete API
-            # time.sleep(0.5)
-            # Přidejte timeout a opakování při chybě:
-            max_retries = 3
-            retry_delay = 0.5  # sekundy
-
-            for attempt in range(max_retries):
-                try:
-                    autocomplete_response = requests.get(SEARCH_API_URL, headers=DEFAULT_HEADERS, params=params, timeout=10)
-                    autocomplete_response.raise_for_status()
-                    break
-                except requests.exceptions.RequestException as e:
-                    if attempt == max_retries - 1:
-                        yield json.dumps({"error": f"Chyba při komunikaci s API: {str(e)}"}) + '\n'
-                        return
-                    time.sleep(retry_delay)
-            autocomplete_response = requests.get(SEARCH_API_URL, headers=DEFAULT_HEADERS, params=params, timeout=10)
-            autocomplete_response.raise_for_status()
-            autocomplete_data = autocomplete_response.json()
-
-            if not isinstance(autocomplete_data, list):
-                yield json.dumps({"error": "Server vrátil neočekávaný formát autocomplete dat (není seznam)."}) + '\n'
+            # Krok 1: Vyhledání pomocí autocomplete API (nebo z cache, pokud dotaz či jeho prefix známe)
+            try:
+                autocomplete_data = fetch_autocomplete(query)
+            except requests.exceptions.RequestException as e:
+                yield json.dumps({"error": f"Chyba při komunikaci s API: {str(e)}"}) + '\n'
+                return
+            except AutocompleteFormatError as e:
+                yield json.dumps({"error": str(e)}) + '\n'
                 return
 
-            # Přidáme filtr pro odstranění duplicitních výsledků
-            seen_names = set()
-            unique_results = []
-            
-            for item in autocomplete_data:
-                food_name = item.get("title", "Neznámá potravina").strip()
-                
-                # Přeskočíme prázdné názvy
-                if not food_name:
-                    continue
-                
-                # Normalizujeme název pro lepší porovnávání
-                normalized_name = food_name.lower()
-                
-                # Přeskočíme duplicitní výsledky
-                if normalized_name in seen_names:
-                    continue
-                
-                seen_names.add(normalized_name)
-                unique_results.append(item)
-
-            # Procházení UNIKÁTNÍCH výsledků z autocomplete API
-            for item in unique_results:
-                food_name = item.get("title", "Neznámá potravina")
-                food_value = item.get('value', 'N/A')
-
-                is_liquid = False
-                liquid_keywords = ['mléko', 'kefír', 'jogurtový nápoj', 'džus', 'šťáva', 'voda', 'nápoj', 'limonáda', 'sirup', 'polévka', 'vývar']
-                for keyword in liquid_keywords:
-                    if keyword in food_name.lower():
-                        is_liquid = True
-                        break
-
-                energy_unit_suffix = "kcal"
-                if is_liquid:
-                    energy_unit_suffix = "kcal/100 ml"
+            unique_results = unique_autocomplete_items(autocomplete_data)
+
+            # Krok 2: Souběžné dohledání obrázků pro UNIKÁTNÍ výsledky z autocomplete API
+            resolve_item = timed_search_item if include_timing else resolve_search_item
+            futures = [image_executor.submit(resolve_item, item, details_mode) for item in unique_results]
+            try:
+                if stream_order == 'completion':
+                    finished_futures = as_completed(futures)
                 else:
-                    energy_unit_suffix = "kcal/100 g"
-                    
-
-                food_calories = f"{food_value} {energy_unit_suffix}"
-
-                food_has_image = item.get('hasImage', False)
-                food_url_slug = item.get('url') # This already contains /potraviny/ or /recepty/
-
-                image_url = None
-                food_type = None # Initialize food_type
-
-                if food_has_image and food_url_slug:
-                    potential_image_urls_and_types = []
-
-                    # Priorita: 1. /recepty/, 2. /potraviny/
-                    potential_image_urls_and_types.append((urljoin(BASE_WEB_URL, '/recepty/' + food_url_slug.lstrip('/')), 'recept'))
-                    potential_image_urls_and_types.append((urljoin(BASE_WEB_URL, '/potraviny/' + food_url_slug.lstrip('/')), 'potravina'))
-
-                    # Remove duplicates while preserving order
-                    unique_urls_and_types = []
-                    seen_urls = set()
-                    for url, type_val in potential_image_urls_and_types:
-                        if url not in seen_urls:
-                            unique_urls_and_types.append((url, type_val))
-                            seen_urls.add(url)
-
-                    for current_image_fetch_url, current_food_type in unique_urls_and_types:
-                        try:
-                            time.sleep(0.1)  # Krátké čekání mezi požadavky
-                            detail_response = requests.get(current_image_fetch_url, headers=DEFAULT_HEADERS, timeout=5)
-                            detail_response.raise_for_status()
-
-                            detail_soup = BeautifulSoup(detail_response.text, 'html.parser')
-                            img_tag = detail_soup.find('img', src=lambda src: src and src.startswith('/file/image/'))
-
-                            if img_tag and img_tag.get('src'):
-                                image_url = f"https://www.kaloricketabulky.cz{img_tag['src']}?w=100"
-                                food_type = current_food_type # Set food_type based on successful URL
-                                break # Image found, exit loop
-                        except requests.exceptions.HTTPError as e:
-                            pass # Suppress detailed error for 404s during image search
-                        except requests.exceptions.RequestException as e:
-                            pass
-                        except Exception as e:
-                            pass
-
-                yield json.dumps({
-                    "name": food_name,
-                    "calories": food_calories,
-                    "image_url": image_url,
-                    "slug": food_url_slug, # Still send the original slug for get_details
-                    "food_type": food_type # Send the determined food_type
-                }) + '\n'
+                    finished_futures = futures
+
+                for future in finished_futures:
+                    yield json.dumps(future.result()) + '\n'
+            finally:
+                # Klient se mohl odpojit - zrušíme práci, která ještě nezačala
+                for future in futures:
+                    future.cancel()
 
         except requests.exceptions.RequestException as e:
             yield json.dumps({"error": f"Chyba při komunikaci s autocomplete API: {e}"}) + '\n'
@@ -223,377 +454,482 @@ def search_food():
         except Exception as e:
             yield json.dumps({"error": f"Nastala neočekávaná chyba: {e}"}) + '\n'
 
-    return Response(generate_results(), mimetype='application/json-stream')
+    return Response(metrics.timed_stream('/search', generate_results(), g.request_started),
+                    mimetype='application/json-stream')
+
+
+def scrape_with_requests_only(url, is_recipe_flag):
+    """Načte stránku pomocí requests a parsuje nutriční hodnoty."""
+    try:
+        response = upstream.get(url, kind='detail')
+        response.raise_for_status()
+        parse_started = time.perf_counter()
+        scraped_data = parse_details_page(response.text, url, is_recipe_page=is_recipe_flag)
+        metrics.observe('kalkulacka_parse_duration_seconds', time.perf_counter() - parse_started,
+                        page='recept' if is_recipe_flag else 'potravina')
+        return scraped_data
+    except requests.exceptions.RequestException as e:
+        return None
+    except Exception as e:
+        return None
 
+def load_details(slug, food_type):
+    """
+    Vrátí detailní nutriční hodnoty pro slug z cache, nebo je scrapuje z webu a uloží do cache.
+    Vrací None, pokud se detaily nepodařilo získat.
+    """
+    # Nejprve zkusíme cache - opakované dotazy na populární potraviny nemusí chodit na web
+    cache_key = (slug, food_type)
+    cached_details = details_cache.get(cache_key)
+    if cached_details is not None:
+        return cached_details
+    # Souběžné požadavky na stejnou potravinu sdílí jedno stažení a parsování stránky. Klíč obsahuje
+    # třídu priority, aby /get_details nečekal na stažení spuštěné s nízkou prioritou kvůli řádku vyhledávání
+    return details_flight.do(cache_key + (scheduler.request_class('detail'),), fetch_details, slug, food_type)
+
+def fetch_details(slug, food_type):
+    """Scrapuje detaily z webu a uloží je do cache (None při neúspěchu)."""
+    scraped_data = None
+    for attempt, (target_url, is_recipe_flag) in enumerate(details_page_candidates(slug, food_type)):
+        if attempt:
+            metrics.add_timing_count('retries')
+        # Attempt with requests/BeautifulSoup4
+        scraped_data = scrape_with_requests_only(target_url, is_recipe_flag)
+        if has_details(scraped_data):
+            break
+
+    if not has_details(scraped_data):
+        return None
+    details = build_details(scraped_data)
+    details_cache.set((slug, food_type), details)
+    return details
+
+def refresh_item_image(slug):
+    """Znovu dohledá obrázek populární položky pro image_index (obnova na pozadí)."""
+    _, _, _, probe_failed = scrape_item_image(slug)
+    return not probe_failed
+
+def refresh_details(slug, food_type):
+    """Znovu scrapuje detaily populární potraviny do details_cache (obnova na pozadí)."""
+    return fetch_details(slug, food_type) is not None
+
+# Populární dotazy, obrázky a detaily se obnovují dřív, než vyprší (autocomplete cache je v paměti každého workeru)
+prewarm.register('query', autocomplete_cache.expires_at, fetch_autocomplete_uncached, shared=False)
+prewarm.register('image', image_index.expires_at, refresh_item_image)
+prewarm.register('details', lambda slug, food_type: details_cache.expires_at((slug, food_type)), refresh_details)
+
+def format_details(details, details_format):
+    """Vrátí detaily v požadovaném formátu (cache vždy obsahuje textovou podobu)."""
+    if details_format == 'numeric':
+        return numeric_details(details)
+    return details
+
+def details_format_error(details_format):
+    """Vrátí chybovou zprávu pro neznámý formát detailů, jinak None."""
+    if details_format not in DETAILS_FORMATS:
+        return f"Neplatný formát detailů: {details_format}. Povolené hodnoty: {', '.join(DETAILS_FORMATS)}."
+    return None
 
 @app.route('/get_details', methods=['POST'])
 def get_details():
     """
     Získá detailní nutriční hodnoty (bílkoviny, sacharidy, tuky) pro daný slug.
     Používá requests/BeautifulSoup4.
+    Volitelný parametr 'format' ('text' nebo 'numeric') určuje podobu hodnot v odpovědi.
     """
     slug = request.json.get('slug')
     food_type_from_frontend = request.json.get('food_type')
+    details_format = request.json.get('format') or DETAILS_FORMAT
     if not slug:
         return jsonify({"error": "Chybí slug pro získání detailů."}), 400
+    format_error = details_format_error(details_format)
+    if format_error:
+        return jsonify({"error": format_error}), 400
 
-    details = {
-        "total_kcal": "N/A", "total_kj": "N/A", "protein": "N/A", "protein_rdi": "N/A",
-        "carbs": "N/A", "carbs_rdi": "N/A", "sugar": "N/A", "fat": "N/A", "fat_rdi": "N/A",
-        "saturated_fat": "N/A", "trans_fat": "N/A", "monounsaturated_fat": "N/A",
-        "polyunsaturated_fat": "N/A", "cholesterol": "N/A", "fiber": "N/A", "fiber_rdi": "N/A",
-        "salt": "N/A", "calcium": "N/A", "sodium": "N/A", "water": "N/A", "phe": "N/A",
-        "source_url": None
-    }
-
-    def extract_value_and_unit_from_text(text_content):
-        """
-        Pomocná funkce pro extrakci číselné hodnoty a jednotky z textového řetězce.
-        Odstraní mezery a nahradí desetinnou čárku tečkou.
-        Prioritizuje jednotky hmotnosti/energie před procenty.
-        """
-        if not isinstance(text_content, str):
-            return {"value": "N/A", "unit": ""}
-
-        # Regex to find a number which can include spaces as thousand separators
-        # and a comma or dot as a decimal separator, followed by a unit.
-        # \d+ : one or more digits
-        # (?:[\s\u00A0]\d{3})* : non-capturing group for optional thousand separators (space or non-breaking space followed by 3 digits)
-        # (?:[.,]\d+)? : non-capturing group for optional decimal part (comma or dot followed by digits)
-        # \s* : optional whitespace before unit
-        # (g|mg|kJ|kcal) : the unit
-        match_non_percentage = re.search(r'(\d+(?:[\s\u00A0]\d{3})*(?:[.,]\d+)?)\s*(g|mg|kJ|kcal)', text_content, re.IGNORECASE)
-
-        if match_non_percentage:
-            value_part_raw = match_non_percentage.group(1)
-            unit_part = match_non_percentage.group(2)
-
-            # Clean the raw value part: remove all spaces (thousand separators) and replace comma with dot for float conversion
-            value_part_cleaned = value_part_raw.replace(' ', '').replace('\u00A0', '').replace(',', '.')
-
-            # Validate if it's actually a number after cleaning
-            try:
-                float(value_part_cleaned) # Try converting to float to ensure it's a valid number
-                return {"value": value_part_cleaned, "unit": unit_part}
-            except ValueError:
-                pass # Not a valid number, fall through to percentage or N/A
-
-        # If not a g/mg/kJ/kcal unit, check for percentage (as before)
-        match_percentage = re.search(r'(\d+\.?\d*)\s*(%)', text_content, re.IGNORECASE)
-        if match_percentage:
-            value_part = match_percentage.group(1)
-            unit_part = match_percentage.group(2)
-            return {"value": "N/A", "unit": ""} # Changed to N/A for % values as per user's previous request to only show g/mg/kJ/kcal
-
-        return {"value": "N/A", "unit": ""}
+    details = load_details(slug, food_type_from_frontend)
 
+    if details is not None:
+        prewarm.record('details', slug, food_type_from_frontend)
+        return jsonify(format_details(details, details_format))
+    else:
+        return jsonify({"error": f"Nepodařilo se získat detaily pro {slug} po všech pokusech pouze s requests."}), 500
 
-    def parse_nutrients_from_soup(soup_obj, is_recipe_page=False):
-        """Parsuje nutriční hodnoty z BeautifulSoup objektu."""
-        scraped_data = {key: "N/A" for key in details.keys() if key not in ["source_url", "total_kcal", "total_kj"]}
+def batch_details_line(index, slug, food_type, details_format='text'):
+    """Načte detaily jedné položky dávky a vrátí její NDJSON řádek (chyba se hlásí jen u dané položky)."""
+    line = {"index": index, "slug": slug, "food_type": food_type}
+    try:
+        details = load_details(slug, food_type)
+    except Exception as e:
+        details = None
+    if details is not None:
+        line["details"] = format_details(details, details_format)
+    else:
+        line["error"] = f"Nepodařilo se získat detaily pro {slug} po všech pokusech pouze s requests."
+    return line
 
-        # --- Energetická hodnota (kcal, kJ) ---
+@app.route('/get_details_batch', methods=['POST'])
+def get_details_batch():
+    """
+    Dávková obdoba /get_details: přijme {"items": [{"slug": ..., "food_type": ...}, ...]},
+    načte detaily souběžně (v details_executor) a streamuje je jako NDJSON v pořadí dokončení.
+    Každý řádek obsahuje index položky v požadavku a buď 'details', nebo 'error'.
+    Volitelný parametr 'format' má stejný význam jako u /get_details.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):  # pole nebo skalár místo objektu -> chybějící položky (400)
+        payload = {}
+    items = payload.get('items')
+    details_format = payload.get('format') or DETAILS_FORMAT
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Chybí seznam položek pro získání detailů."}), 400
+    if len(items) > DETAILS_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Příliš mnoho položek v dávce (maximum je {DETAILS_BATCH_MAX_ITEMS})."}), 400
+    format_error = details_format_error(details_format)
+    if format_error:
+        return jsonify({"error": format_error}), 400
+
+    def generate_details():
+        """Generátorová funkce pro postupné odesílání detailů."""
+        futures = []
         try:
-            if is_recipe_page:
-                # Pro recepty: Hledáme span s ng-if="data.energy==null" pro kcal
-                kcal_span = soup_obj.find('span', attrs={'ng-if': 'data.energy==null'})
-                if kcal_span:
-                    parent_div = kcal_span.find_parent('div')
-                    if parent_div:
-                        full_kcal_text = parent_div.get_text(strip=True)
-                        parsed_kcal = extract_value_and_unit_from_text(full_kcal_text)
-                        if parsed_kcal["value"] != "N/A":
-                            scraped_data["total_kcal"] = f"{parsed_kcal['value'].replace('.', ',')} kcal"
-                        else:
-                            scraped_data["total_kcal"] = "N/A"
-                    else:
-                        scraped_data["total_kcal"] = "N/A"
-                else:
-                    scraped_data["total_kcal"] = "N/A"
-
-                # Pro recepty: Hledáme span s ng-if="data.energyAlt==null" pro kJ
-                kj_span = soup_obj.find('span', attrs={'ng-if': 'data.energyAlt==null'})
-                if kj_span:
-                    parent_div = kj_span.find_parent('div')
-                    if parent_div:
-                        full_kj_text = parent_div.get_text(strip=True)
-                        parsed_kj = extract_value_and_unit_from_text(full_kj_text)
-                        if parsed_kj["value"] != "N/A":
-                            scraped_data["total_kj"] = f"{parsed_kj['value'].replace('.', ',')} kJ"
-                        else:
-                            scraped_data["total_kj"] = "N/A"
-                    else:
-                        scraped_data["total_kj"] = "N/A"
-                else:
-                    scraped_data["total_kj"] = "N/A"
-
-            else: # Pro potraviny
-                kcal_input = soup_obj.find('input', id='calculatedEnergyValueInit')
-                if kcal_input and kcal_input.get('value'):
-                    scraped_data["total_kcal"] = f"{kcal_input['value']} kcal"
-                else:
-                    energy_sum_div = soup_obj.find('div', class_=lambda x: x and ('text-sum' in x or 'text-sum-xs' in x))
-                    if energy_sum_div:
-                        scraped_data["total_kcal"] = energy_sum_div.get_text(strip=True)
-
-                kj_div = None
-                all_subtitle_divs = soup_obj.find_all('div', class_='text-subtitle')
-                for div in all_subtitle_divs:
-                    if 'kJ' in div.get_text() or 'Energetická hodnota' in div.get_text():
-                        kj_div = div
-                        break
-
-                if kj_div:
-                    kj_text_raw = kj_div.get_text(strip=True)
-                    parsed_kj = extract_value_and_unit_from_text(kj_text_raw)
-                    if parsed_kj["value"] != "N/A":
-                        scraped_data["total_kj"] = f"{parsed_kj['value'].replace('.', ',')} kJ"
-                    else:
-                        scraped_data["total_kj"] = "N/A"
-                else:
-                    scraped_data["total_kj"] = "N/A"
-
-        except Exception as e:
-            pass
-
-
-        # --- Hledání všech živin (hlavních i podkategorií) ---
-        # Find the main content block where nutrients are listed
-        main_nutrient_block = soup_obj.find('div', class_='block-background', attrs={'flex': '50'})
-        if not main_nutrient_block:
-            return scraped_data # Return what we have (energy values)
-
-        # Find all direct children of this block that are potential nutrient rows
-        # These are divs with classes 'text-subtitle', 'text-nutrient', or 'text-desc'
-        # We need to be careful with text-desc as it can be RDI or a sub-nutrient value
-        nutrient_rows = main_nutrient_block.find_all('div', recursive=False, class_=lambda x: x and any(cls in x for cls in ['text-subtitle', 'text-nutrient', 'text-desc']))
-
-        temp_nutrients = {} # Store {nutrient_name: {value_text, rdi_text}}
-        current_main_nutrient = None # To link RDI to the correct main nutrient
+            for index, item in enumerate(items):
+                slug = item.get('slug') if isinstance(item, dict) else None
+                food_type = item.get('food_type') if isinstance(item, dict) else None
+                if not slug:
+                    yield json.dumps({"index": index, "slug": slug, "food_type": food_type,
+                                      "error": "Chybí slug pro získání detailů."}) + '\n'
+                    continue
+                futures.append(details_executor.submit(batch_details_line, index, slug, food_type, details_format))
 
-        for i, row in enumerate(nutrient_rows):
-            row_text_raw = row.get_text(strip=True)
+            for future in as_completed(futures):
+                yield json.dumps(future.result()) + '\n'
+        finally:
+            # Klient se mohl odpojit - zrušíme práci, která ještě nezačala
+            for future in futures:
+                future.cancel()
 
-            # Check if it's a main nutrient label (text-subtitle with an icon or specific keywords)
-            if 'text-subtitle' in row.get('class', []):
-                # Remove md-icon tag before getting text to clean nutrient name
-                icon_tag = row.find('md-icon', class_='material-icons')
-                if icon_tag:
-                    icon_tag.extract() # Remove the icon tag from the soup object
+    return Response(generate_details(), mimetype='application/json-stream')
 
-                nutrient_name = row.find('div', class_='flex-auto').get_text(strip=True) if row.find('div', class_='flex-auto') else row_text_raw.strip()
+def recipe_ingredient_lists(payload):
+    """
+    Vrátí (seznam seznamů ingrediencí, zda jde o dávku receptů) z těla požadavku /aggregate_recipe,
+    nebo (None, False), pokud tělo nemá očekávaný tvar (i když to není JSON objekt).
+    """
+    if not isinstance(payload, dict):
+        return None, False
+    if isinstance(payload.get('ingredients'), list):
+        return [payload['ingredients']], False
+    recipes = payload.get('recipes')
+    if not isinstance(recipes, list):
+        return None, False
+    ingredient_lists = []
+    for recipe in recipes:
+        ingredients = recipe.get('ingredients') if isinstance(recipe, dict) else recipe
+        if not isinstance(ingredients, list):
+            return None, False
+        ingredient_lists.append(ingredients)
+    return ingredient_lists, True
+
+@app.route('/aggregate_recipe', methods=['POST'])
+def aggregate_recipe():
+    """
+    Sečte nutriční hodnoty ingrediencí receptu (obdoba agregace v showRecipeDetailsModal()).
+    Přijme {"ingredients": [...]} a vrátí součty, hodnoty na 100 g a celkovou hmotnost,
+    nebo {"recipes": [{"ingredients": [...]}, ...]} a vrátí výsledek pro každý recept.
+    """
+    ingredient_lists, is_batch = recipe_ingredient_lists(request.get_json(silent=True) or {})
+    if ingredient_lists is None:
+        return jsonify({"error": "Chybí seznam ingrediencí receptu."}), 400
+
+    try:
+        results = aggregate_recipes(ingredient_lists)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if is_batch:
+        return jsonify({"recipes": results, "units": NUTRIENT_UNITS})
+    return jsonify(dict(results[0], units=NUTRIENT_UNITS))
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Vrátí počítadla zásahů a minutí cache (pro ladění výkonu)."""
+    return jsonify({
+        "details": details_cache.stats(),
+        "images": image_index.stats(),
+        "autocomplete": autocomplete_cache.stats(),
+        "barcodes": barcode_index.stats(),
+        "barcode_lookups": barcode_cache.stats(),
+        "in_flight": {flight.name: flight.stats() for flight in (autocomplete_flight, image_flight, details_flight)},
+        "prewarm": prewarm.stats(),
+        "upstream_priority": upstream.upstream_gate.stats(),
+    })
+
+# Záložní mapování EAN kódů na názvy potravin pro kódy, které nejsou v indexu čárových kódů
+# (potravina se k názvu jednou dohledá přes autocomplete API a uloží do barcode_cache)
+EAN_TO_FOOD_MAPPING = {
+    # Mléčné výrobky
+    '8594001000108': 'Tatranka čokoládová',
+    '8594001000207': 'Tatranka oříšková',
+    '8594001000306': 'Tatranka kokosová',
+    '8594001000405': 'Tatranka lískooříšková',
+    '8594001320106': 'Pribináček vanilkový',
+    '8594001320205': 'Pribináček čokoládový',
+    '8594001320304': 'Pribináček jahodový',
+
+    # Nápoje
+    '8594002000104': 'Coca-Cola',
+    '8594002000203': 'Coca-Cola Zero',
+    '8594002000302': 'Fanta',
+    '8594002000401': 'Sprite',
+
+    # Čokolády
+    '8594003000105': 'Studentská pečeť',
+    '8594003000204': 'Orion',
+    '8594003000303': 'Figaro',
+    '8594003000402': 'Horalky',
+
+    # Mléko a jogurty
+    '8594004000103': 'Jogurt Hollandia jahoda',
+    '8594004000202': 'Jogurt Hollandia vanilka',
+    '8594004000301': 'Mléko polotučné',
+
+    # Pečivo a trvanlivé potraviny
+    '8594005000102': 'Chléb konzumní kmínový',
+    '8594005000201': 'Rohlík',
+    '8594005000300': 'Dalamánek',
+
+    # Přidejte další běžné EAN kódy podle potřeby
+}
 
-                # Check for specific keywords to confirm it's a main nutrient label
-                if any(k in nutrient_name for k in ['Bílkoviny', 'Sacharidy', 'Tuky', 'Vláknina', 'Sůl', 'Vápník', 'Sodík', 'Voda', 'PHE']):
-                    current_main_nutrient = nutrient_name
+def known_barcode(barcode):
+    """
+    Vrátí záznam {slug, food_type, name} pro kód z indexu nebo z cache dohledaných kódů, jinak None.
+    Záznam indexu jen s názvem (bez slugu) se vrátí, dokud ho resolve_barcode_entry() nedohledá do cache.
+    """
+    entry = barcode_index.lookup(barcode)
+    if entry is not None and entry.get("slug"):
+        return entry
+    cached = barcode_cache.get(barcode)
+    return cached if cached is not None else entry
 
-                    # The value is typically in the last div child of this row
-                    value_div_candidate = row.find_all('div')[-1]
-                    value_text = "N/A"
-                    if value_div_candidate:
-                        # Get all text content from the value_div_candidate
-                        value_text = value_div_candidate.get_text(strip=True)
+def barcode_food_name(barcode, entry):
+    """
+    Název, podle kterého se kód dohledá přes autocomplete API: u záznamu indexu bez slugu jeho název,
+    u neznámého kódu název ze záložního mapování. None, pokud není co dohledávat.
+    """
+    if entry is None:
+        return EAN_TO_FOOD_MAPPING.get(barcode)
+    return entry.get("name") if not entry.get("slug") else None
+
+def barcode_result(barcode, entry, details, details_format):
+    """Vrátí (tělo odpovědi, HTTP status) /search_by_barcode pro dohledaný záznam a jeho detaily."""
+    if entry is None:
+        return {"error": f"Čárový kód {barcode} nebyl nalezen v databázi. Zkuste vyhledat ručně."}, 404
+    if details is None:
+        return {"error": f"Nepodařilo se získat detaily pro {entry['slug']} po všech pokusech pouze s requests."}, 500
+    return {
+        "barcode": barcode,
+        "slug": entry["slug"],
+        "food_type": entry.get("food_type"),
+        "name": entry.get("name"),
+        "details": format_details(details, details_format),
+    }, 200
+
+def resolve_barcode_entry(barcode):
+    """
+    Vrátí záznam {slug, food_type, name} pro kód. Známé kódy se řeší lokálně (index, cache),
+    kódy z indexu bez slugu a ze záložního mapování se jednou dohledají přes autocomplete API podle názvu
+    a výsledek se uloží do cache. Vrací None, pokud kód neznáme.
+    """
+    entry = known_barcode(barcode)
+    if entry is not None and entry.get("slug"):
+        return entry
+
+    food_name = barcode_food_name(barcode, entry)
+    if not food_name:
+        return None
+    entry = autocomplete_barcode_match(fetch_autocomplete(food_name))
+    if entry is None:
+        barcode_cache.set(barcode, {"slug": None}, ttl=BARCODE_CACHE_NEGATIVE_TTL)
+        return None
+    barcode_cache.set(barcode, entry)
+    return entry
+
+def resolve_barcode(barcode, details_format):
+    """Vrátí (tělo odpovědi, HTTP status) pro čárový kód - záznam, jeho detaily, nebo chybu."""
+    try:
+        entry = resolve_barcode_entry(barcode)
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Chyba při komunikaci s API: {e}"}, 502
+    except AutocompleteFormatError as e:
+        return {"error": str(e)}, 502
+    except ValueError as e:
+        return {"error": f"Chyba při parsování JSON odpovědi z autocomplete API: {e}"}, 502
+
+    details = load_details(entry["slug"], entry.get("food_type")) if entry is not None else None
+    return barcode_result(barcode, entry, details, details_format)
 
-                    temp_nutrients[current_main_nutrient] = {"value": value_text, "rdi": "N/A"}
-                else:
-                    pass
+@app.route('/search_by_barcode', methods=['POST'])
+def search_by_barcode():
+    """
+    Vyhledá potravinu podle čárového kódu (EAN) a rovnou vrátí její nutriční hodnoty v jedné JSON odpovědi.
+    Cesta EAN -> slug -> detaily vede přes lokální index a cache; na web se chodí jen při jejich minutí.
+    Volitelný parametr 'format' má stejný význam jako u /get_details.
+    """
+    barcode = request.json.get('barcode')
+    details_format = request.json.get('format') or DETAILS_FORMAT
+    if not barcode:
+        return jsonify({"error": "Chybí čárový kód pro vyhledávání."}), 400
+    format_error = details_format_error(details_format)
+    if format_error:
+        return jsonify({"error": format_error}), 400
 
-            # Check if it's a sub-nutrient (text-nutrient)
-            elif 'text-nutrient' in row.get('class', []):
-                # Find all direct div children of the current row
-                direct_div_children = row.find_all('div', recursive=False)
+    payload, status = resolve_barcode(barcode, details_format)
+    if status == 200:
+        prewarm.record('details', payload["slug"], payload["food_type"])
+    return jsonify(payload), status
 
-                sub_nutrient_name = "N/A"
-                value_text = "N/A"
+def unique_barcodes(barcodes):
+    """
+    Vrátí seznam (kód, indexy v požadavku) bez duplicit. Různé zápisy téhož EAN
+    (mezery, UPC-A / GTIN-14) se sloučí; zpracuje se první zápis.
+    """
+    groups = {}
+    for index, barcode in enumerate(barcodes):
+        code = str(barcode).strip() if isinstance(barcode, (str, int)) and not isinstance(barcode, bool) else ''
+        key = normalize_ean(code) or code
+        if key in groups:
+            groups[key][1].append(index)
+        else:
+            groups[key] = (code, [index])
+    return list(groups.values())
+
+def local_barcode_result(barcode, details_format):
+    """
+    Vrátí (tělo, status), pokud lze kód vyřešit bez webu (známý kód s detaily v cache,
+    nebo kód, který určitě neznáme), jinak None.
+    """
+    entry = known_barcode(barcode)
+    if entry is None or not entry.get("slug"):
+        if barcode_food_name(barcode, entry):
+            return None  # dohledá se přes autocomplete API
+        return barcode_result(barcode, None, None, details_format)
+    details = details_cache.get((entry["slug"], entry.get("food_type")))
+    if details is None:
+        return None
+    return barcode_result(barcode, entry, details, details_format)
+
+def barcode_batch_line(barcode, indexes, result):
+    """Sestaví NDJSON řádek dávkového vyhledávání z výsledku (tělo, status)."""
+    payload, status = result
+    return dict(payload, barcode=barcode, indexes=indexes, status=status)
+
+def resolve_barcode_line(barcode, indexes, details_format):
+    """Vyřeší kód (i přes web) a vrátí jeho NDJSON řádek. Běží v details_executor, nesmí vyhazovat výjimky."""
+    try:
+        result = resolve_barcode(barcode, details_format)
+    except Exception as e:
+        result = ({"error": f"Nastala neočekávaná chyba: {e}"}, 500)
+    return barcode_batch_line(barcode, indexes, result)
+
+@app.route('/search_by_barcode_batch', methods=['POST'])
+def search_by_barcode_batch():
+    """
+    Dávková obdoba /search_by_barcode (např. celá účtenka): přijme {"barcodes": [...]}, sloučí duplicity,
+    kódy známé lokálně odešle hned a ostatní dohledá souběžně (v details_executor).
+    Streamuje NDJSON řádek pro každý unikátní kód s 'status', 'indexes' (pozice v požadavku)
+    a buď 'details', nebo 'error'.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):  # pole nebo skalár místo objektu -> chybějící kódy (400)
+        payload = {}
+    barcodes = payload.get('barcodes')
+    details_format = payload.get('format') or DETAILS_FORMAT
+    if not isinstance(barcodes, list) or not barcodes:
+        return jsonify({"error": "Chybí seznam čárových kódů pro vyhledávání."}), 400
+    if len(barcodes) > BARCODE_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Příliš mnoho čárových kódů v dávce (maximum je {BARCODE_BATCH_MAX_ITEMS})."}), 400
+    format_error = details_format_error(details_format)
+    if format_error:
+        return jsonify({"error": format_error}), 400
+
+    def generate_barcodes():
+        """Generátorová funkce pro postupné odesílání výsledků."""
+        futures = []
+        try:
+            for barcode, indexes in unique_barcodes(barcodes):
+                if not barcode:
+                    yield json.dumps(barcode_batch_line(barcode, indexes, ({"error": "Chybí čárový kód pro vyhledávání."}, 400))) + '\n'
+                    continue
+                result = local_barcode_result(barcode, details_format)
+                if result is not None:
+                    yield json.dumps(barcode_batch_line(barcode, indexes, result)) + '\n'
+                    continue
+                futures.append(details_executor.submit(resolve_barcode_line, barcode, indexes, details_format))
 
-                if len(direct_div_children) >= 2:
-                    # The first div child should contain the name
-                    sub_nutrient_name = direct_div_children[0].get_text(strip=True)
-                    # The last div child should contain the value
-                    value_text = direct_div_children[-1].get_text(strip=True)
+            for future in as_completed(futures):
+                yield json.dumps(future.result()) + '\n'
+        finally:
+            # Klient se mohl odpojit - zrušíme práci, která ještě nezačala
+            for future in futures:
+                future.cancel()
 
-                if sub_nutrient_name and sub_nutrient_name != "N/A": # Ensure we actually got a name
-                    temp_nutrients[sub_nutrient_name] = {"value": value_text, "rdi": "N/A"}
-                else:
-                    pass
-
-            # Check if it's an RDI (text-desc)
-            elif 'text-desc' in row.get('class', []): # Removed "Doporučený denní příjem" from condition to catch all text-desc
-                # Check if it's an RDI row
-                if 'Doporučený denní příjem' in row_text_raw:
-                    if current_main_nutrient and current_main_nutrient in temp_nutrients:
-                        # The RDI value is usually directly within this 'text-desc' div, or its last child div
-                        rdi_value_text = row_text_raw.replace('Doporučený denní příjem:', '').strip()
-                        if rdi_value_text:
-                            temp_nutrients[current_main_nutrient]["rdi"] = rdi_value_text
-                    else:
-                        pass
-                else:
-                    pass
-
-
-        # Now, populate scraped_data from temp_nutrients
-        for nutrient_name, data in temp_nutrients.items():
-            parsed_value = extract_value_and_unit_from_text(data['value'])
-            display_value = f"{parsed_value['value'].replace('.', ',')} {parsed_value['unit']}".strip() if parsed_value['value'] != "N/A" else "N/A"
-
-            parsed_rdi = extract_value_and_unit_from_text(data['rdi'])
-            rdi_display_value = f"{parsed_rdi['value'].replace('.', ',')} {parsed_rdi['unit']}".strip() if parsed_rdi['value'] != "N/A" else "N/A"
-
-
-            # Assign values based on name_text
-            if "Bílkoviny" in nutrient_name:
-                scraped_data["protein"] = display_value
-                scraped_data["protein_rdi"] = rdi_display_value
-            elif "Sacharidy" in nutrient_name:
-                scraped_data["carbs"] = display_value
-                scraped_data["carbs_rdi"] = rdi_display_value
-            elif "Cukry" in nutrient_name:
-                scraped_data["sugar"] = display_value
-            elif "Tuky" in nutrient_name:
-                scraped_data["fat"] = display_value
-                scraped_data["fat_rdi"] = rdi_display_value
-            elif "Nasycené mastné kyseliny" in nutrient_name:
-                scraped_data["saturated_fat"] = display_value
-            elif "Trans mastné kyseliny" in nutrient_name:
-                scraped_data["trans_fat"] = display_value
-            elif "Mononenasycené" in nutrient_name:
-                scraped_data["monounsaturated_fat"] = display_value
-            elif "Polynenasycené" in nutrient_name:
-                scraped_data["polyunsaturated_fat"] = display_value
-            elif "Cholesterol" in nutrient_name:
-                scraped_data["cholesterol"] = display_value
-            elif "Vláknina" in nutrient_name:
-                scraped_data["fiber"] = display_value
-                scraped_data["fiber_rdi"] = rdi_display_value
-            elif "Sůl" in nutrient_name:
-                scraped_data["salt"] = display_value
-            elif "Vápník" in nutrient_name:
-                scraped_data["calcium"] = display_value
-            elif "Sodík" in nutrient_name:
-                scraped_data["sodium"] = display_value
-            elif "Voda" in nutrient_name:
-                scraped_data["water"] = display_value
-            elif "PHE" in nutrient_name:
-                scraped_data["phe"] = display_value
+    return Response(generate_barcodes(), mimetype='application/json-stream')
 
-        return scraped_data
+def decode_request_too_large(content_length, mimetype):
+    """Chyba pro /decode_barcode, pokud deklarovaná délka těla překračuje limit (samotný obrázek má limit snímku), jinak None."""
+    limit = BARCODE_FRAME_MAX_BYTES if mimetype.startswith('image/') else MAX_REQUEST_BYTES
+    if content_length is not None and content_length > limit:
+        return f"Požadavek je příliš velký (maximum je {limit} B)."
+    return None
 
-    def scrape_with_requests_only(url, is_recipe_flag):
-        """Načte stránku pomocí requests a parsuje nutriční hodnoty."""
+def decode_frames(frames):
+    """
+    Dekóduje EAN kódy ze seznamu snímků (bajty JPEG/PNG) a vrátí (tělo odpovědi, HTTP status).
+    Chyba jednoho snímku (neplatný obrázek, příliš velký) se hlásí jen u něj.
+    """
+    if not ean_decoder.decoder_available():
+        return {"error": "Dekódování čárových kódů na serveru není dostupné (chybí numpy nebo Pillow)."}, 501
+    if not frames:
+        return {"error": "Chybí snímek s čárovým kódem."}, 400
+    if len(frames) > BARCODE_FRAMES_MAX:
+        return {"error": f"Příliš mnoho snímků v požadavku (maximum je {BARCODE_FRAMES_MAX})."}, 400
+
+    frame_results = []
+    barcodes = []
+    for index, data in enumerate(frames):
+        if len(data) > BARCODE_FRAME_MAX_BYTES:
+            frame_results.append({"index": index, "error": f"Snímek je příliš velký (maximum je {BARCODE_FRAME_MAX_BYTES} B)."})
+            continue
         try:
-            response = requests.get(url, headers=DEFAULT_HEADERS, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            scraped_data = parse_nutrients_from_soup(soup, is_recipe_page=is_recipe_flag)
-            scraped_data["source_url"] = url
-            return scraped_data
-        except requests.exceptions.RequestException as e:
-            return None
-        except Exception as e:
-            return None
+            codes = ean_decoder.decode_image(data)
+        except ValueError as e:
+            frame_results.append({"index": index, "error": str(e)})
+            continue
+        frame_results.append({"index": index, "barcodes": codes})
+        barcodes.extend(code for code in codes if code not in barcodes)
 
-    scraped_data = None
-    target_url = None
-    is_recipe_flag = False
-
-    if food_type_from_frontend == 'potravina':
-        target_url = urljoin(BASE_WEB_URL, '/potraviny/' + slug.lstrip('/'))
-        is_recipe_flag = False
-    elif food_type_from_frontend == 'recept':
-        target_url = urljoin(BASE_WEB_URL, '/recepty/' + slug.lstrip('/'))
-        is_recipe_flag = True
-    else:
-        # Fallback if food_type_from_frontend is not explicitly provided or recognized
-        # Try /potraviny/ first
-        target_url = urljoin(BASE_WEB_URL, '/potraviny/' + slug.lstrip('/'))
-        is_recipe_flag = False
-
-    # Attempt with requests/BeautifulSoup4
-    scraped_data = scrape_with_requests_only(target_url, is_recipe_flag)
-
-    # If requests failed to get total_kcal and food_type was not explicit, try the other type with requests
-    if (scraped_data is None or scraped_data.get("total_kcal") == "N/A") and food_type_from_frontend not in ['potravina', 'recept']:
-        if is_recipe_flag: # If current attempt was recipe, try foodstuff
-            target_url_alt = urljoin(BASE_WEB_URL, '/potraviny/' + slug.lstrip('/'))
-            scraped_data = scrape_with_requests_only(target_url_alt, False)
-        else: # If current attempt was foodstuff, try recipe
-            target_url_alt = urljoin(BASE_WEB_URL, '/recepty/' + slug.lstrip('/'))
-            scraped_data = scrape_with_requests_only(target_url_alt, True)
-
-        # Update target_url and is_recipe_flag if the alternative scrape was successful
-        if scraped_data and scraped_data.get("total_kcal") != "N/A":
-            target_url = target_url_alt
-            is_recipe_flag = not is_recipe_flag # Flip the flag
-
-    if scraped_data and scraped_data.get("total_kcal") != "N/A":
-        details.update(scraped_data)
-        return jsonify(details)
-    else:
-        return jsonify({"error": f"Nepodařilo se získat detaily pro {slug} po všech pokusech pouze s requests."}), 500
+    return {"barcode": barcodes[0] if barcodes else None, "barcodes": barcodes, "frames": frame_results}, 200
 
-@app.route('/search_by_barcode', methods=['POST'])
-def search_by_barcode():
+@app.route('/decode_barcode', methods=['POST'])
+def decode_barcode():
     """
-    Vyhledá potravinu podle čárového kódu (EAN)
+    Dekóduje EAN-13 / EAN-8 ze snímku kamery na serveru (místo dekódování v prohlížeči).
+    Přijme jeden nebo více souborů 'frame' (multipart/form-data), případně samotný obrázek v těle
+    požadavku (Content-Type image/jpeg nebo image/png). Vrátí první nalezený kód, všechny kódy a výsledky po snímcích.
     """
-    barcode = request.json.get('barcode')
-    if not barcode:
-        return jsonify({"error": "Chybí čárový kód pro vyhledávání."}), 400
-    
-    # Rozšířené mapování EAN kódů na názvy potravin
-    ean_to_food_mapping = {
-        # Mléčné výrobky
-        '8594001000108': 'Tatranka čokoládová',
-        '8594001000207': 'Tatranka oříšková',
-        '8594001000306': 'Tatranka kokosová',
-        '8594001000405': 'Tatranka lískooříšková',
-        '8594001320106': 'Pribináček vanilkový',
-        '8594001320205': 'Pribináček čokoládový',
-        '8594001320304': 'Pribináček jahodový',
-        
-        # Nápoje
-        '8594002000104': 'Coca-Cola',
-        '8594002000203': 'Coca-Cola Zero',
-        '8594002000302': 'Fanta',
-        '8594002000401': 'Sprite',
-        
-        # Čokolády
-        '8594003000105': 'Studentská pečeť',
-        '8594003000204': 'Orion',
-        '8594003000303': 'Figaro',
-        '8594003000402': 'Horalky',
-        
-        # Mléko a jogurty
-        '8594004000103': 'Jogurt Hollandia jahoda',
-        '8594004000202': 'Jogurt Hollandia vanilka',
-        '8594004000301': 'Mléko polotučné',
-        
-        # Pečivo a trvanlivé potraviny
-        '8594005000102': 'Chléb konzumní kmínový',
-        '8594005000201': 'Rohlík',
-        '8594005000300': 'Dalamánek',
-        
-        # Přidejte další běžné EAN kódy podle potřeby
-    }
-    
-    food_name = ean_to_food_mapping.get(barcode)
-    
-    if food_name:
-        # Pokud najdeme mapování, použijeme ho pro vyhledávání
-        return search_food_by_name(food_name)
+    too_large = decode_request_too_large(request.content_length, request.mimetype)
+    if too_large:
+        return jsonify({"error": too_large}), 413
+    uploads = request.files.getlist('frame')
+    if uploads:
+        frames = [upload.read() for upload in uploads]
+    elif request.mimetype.startswith('image/'):
+        frames = [request.get_data()]
     else:
-        # Pokud nemáme mapování, zkusíme vyhledat přímo podle EAN
-        # nebo vrátíme chybovou zprávu
-        return jsonify({"error": f"Čárový kód {barcode} nebyl nalezen v databázi. Zkuste vyhledat ručně."}), 404
+        frames = []
 
-def search_food_by_name(food_name):
-    """
-    Pomocná funkce pro vyhledávání potraviny podle názvu
-    """
-    # Simulujeme POST požadavek na /search s názvem potraviny
-    with app.test_request_context('/search', method='POST', data={'query': food_name}):
-        return search_food()
+    payload, status = decode_frames(frames)
+    return jsonify(payload), status
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,607 @@
+# asgi.py - Asynchronní (ASGI) verze aplikace pro vysokou souběžnost
+# Spuštění: hypercorn asgi:app (viz Procfile.asgi)
+# Jeden proces zvládne stovky souběžných streamovaných vyhledávání, protože čekání na
+# kaloricketabulky.cz neblokuje vlákno. Formát odpovědí (včetně NDJSON streamu) je stejný jako v app.py.
+import os
+import json
+import time
+import asyncio
+import httpx
+from quart import Quart, render_template, request, jsonify, Response, send_from_directory, g
+
+# Sdílené nastavení, cache a Firebase konfigurace s WSGI verzí aplikace
+import app as wsgi_app
+from upstream import SEARCH_API_URL, DEFAULT_HEADERS, UPSTREAM_TIMEOUTS, UPSTREAM_POOL_MAXSIZE
+from scraper import (unique_autocomplete_items, build_search_result, image_page_candidates, ImageProbe,
+                     details_page_candidates, has_details, build_details, search_result_details, decode_page,
+                     autocomplete_barcode_match)
+from extractor import parse_details_page
+from nutrition import aggregate_recipes, NUTRIENT_UNITS
+from cache import PrefixCache
+import metrics
+import prewarm
+import ratelimit
+import scheduler
+from singleflight import AsyncSingleFlight
+
+app = Quart(__name__)
+app.config['MAX_CONTENT_LENGTH'] = wsgi_app.MAX_REQUEST_BYTES
+
+# Maximální počet současně otevřených spojení na kaloricketabulky.cz v rámci procesu
+ASYNC_UPSTREAM_MAX_CONNECTIONS = int(os.getenv('ASYNC_UPSTREAM_MAX_CONNECTIONS', '100'))
+# Maximální počet souběžně dohledávaných obrázků v rámci procesu (napříč všemi vyhledáváními)
+ASYNC_SEARCH_IMAGE_CONCURRENCY = int(os.getenv('ASYNC_SEARCH_IMAGE_CONCURRENCY', '32'))
+
+# Vytváří se při startu serveru, protože musí patřit do jeho event loopu
+http_client = None
+image_semaphore = None
+details_semaphore = None
+
+# Nejvyšší počet souběžných požadavků na web v rámci procesu (brána s prioritami). Musí být menší než
+# ASYNC_SEARCH_IMAGE_CONCURRENCY, jinak se brána doplňováním obrázků nikdy nezaplní a obrázky nečekají za detaily.
+ASYNC_UPSTREAM_MAX_IN_FLIGHT = int(os.getenv('ASYNC_UPSTREAM_MAX_IN_FLIGHT', str(scheduler.UPSTREAM_MAX_IN_FLIGHT)))
+
+# Asynchronní obdoba upstream.upstream_gate - přednost detailů a čárových kódů před obrázky
+upstream_gate = scheduler.AsyncPriorityGate('upstream', ASYNC_UPSTREAM_MAX_IN_FLIGHT, scheduler.UPSTREAM_RESERVED_SLOTS)
+scheduler.register_metrics(upstream_gate)
+
+# Asynchronní obdoba single-flight instancí z app.py (stejné názvy v /cache_stats i /metrics)
+autocomplete_flight = AsyncSingleFlight('autocomplete')
+image_flight = AsyncSingleFlight('images')
+details_flight = AsyncSingleFlight('details')
+for flight in (autocomplete_flight, image_flight, details_flight):
+    metrics.register_cache(f'in_flight_{flight.name}', lambda flight=flight: {'hit': flight.shared, 'miss': flight.leaders})
+
+
+@app.before_serving
+async def create_http_client():
+    global http_client, image_semaphore, details_semaphore
+    http_client = httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        limits=httpx.Limits(max_connections=ASYNC_UPSTREAM_MAX_CONNECTIONS,
+                            max_keepalive_connections=UPSTREAM_POOL_MAXSIZE),
+    )
+    image_semaphore = asyncio.Semaphore(ASYNC_SEARCH_IMAGE_CONCURRENCY)
+    details_semaphore = asyncio.Semaphore(wsgi_app.DETAILS_BATCH_WORKERS)
+
+
+@app.after_serving
+async def close_http_client():
+    await http_client.aclose()
+
+
+def upstream_timeout(kind):
+    """Timeout httpx odpovídající upstream.UPSTREAM_TIMEOUTS pro daný druh požadavku."""
+    connect_timeout, read_timeout = UPSTREAM_TIMEOUTS[kind]
+    return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+
+class RateLimited(httpx.HTTPError):
+    """Asynchronní obdoba upstream.RateLimited."""
+
+
+async def wait_for_budget(kind, url):
+    """Vezme token ze společného rozpočtu požadavků (ratelimit.py), při vyčerpání vyhodí RateLimited."""
+    if not await ratelimit.acquire_async(kind, scheduler.request_class(kind)):
+        raise RateLimited(f"Vyčerpaný rozpočet požadavků ({kind}), požadavek odložen: {url}")
+
+
+async def upstream_get(url, kind='detail', **kwargs):
+    """Asynchronní obdoba upstream.get() se stejnými timeouty a rozpočtem podle druhu požadavku."""
+    kwargs.setdefault('timeout', upstream_timeout(kind))
+    await wait_for_budget(kind, url)
+    async with upstream_gate.slot(kind):
+        started = time.perf_counter()
+        try:
+            response = await http_client.get(url, **kwargs)
+        except httpx.HTTPError:
+            metrics.observe_upstream(kind, url, 'error', time.perf_counter() - started)
+            raise
+    elapsed = time.perf_counter() - started
+    metrics.observe_upstream(kind, url, response.status_code, elapsed, len(response.content))
+    metrics.add_timing('upstream', elapsed)
+    metrics.add_timing_count('bytes', len(response.content))
+    return response
+
+
+async def probe_image(url, read_full=False):
+    """Asynchronní obdoba app.probe_image() - vrací (URL obrázku nebo None, HTML celé stránky nebo None)."""
+    return await image_flight.do((url, read_full), fetch_image_probe, url, read_full)
+
+
+async def fetch_image_probe(url, read_full=False):
+    """Vlastní stažení stránky pro probe_image()."""
+    await wait_for_budget('image', url)
+    async with upstream_gate.slot('image'):
+        started = time.perf_counter()
+        status, elapsed = 'error', None
+        chunks = []
+        try:
+            async with http_client.stream('GET', url, timeout=upstream_timeout('image')) as response:
+                status, elapsed = response.status_code, time.perf_counter() - started
+                response.raise_for_status()
+                probe = ImageProbe(response.encoding, max_bytes=None if read_full else wsgi_app.IMAGE_PROBE_MAX_BYTES)
+                async for chunk in response.aiter_bytes(wsgi_app.IMAGE_PROBE_CHUNK_SIZE):
+                    chunks.append(chunk)
+                    if probe.feed(chunk) and not read_full:
+                        return probe.image_url, None
+                probe.finish()
+                return probe.image_url, decode_page(b''.join(chunks), response.encoding)
+        finally:
+            # Stejně jako upstream.get(): doba do přijetí hlaviček, stažené bajty se počítají zvlášť
+            metrics.observe_upstream('image', url, status, elapsed if elapsed is not None else time.perf_counter() - started,
+                                     sum(map(len, chunks)))
+            metrics.add_timing('upstream', time.perf_counter() - started)
+            metrics.add_timing_count('bytes', sum(map(len, chunks)))
+
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+    data = await request.get_json(silent=True) if request.is_json else None
+    g.timing = metrics.start_timing(request.url_rule is not None and request.url_rule.rule in metrics.TIMED_ROUTES
+                                    and wsgi_app.timing_requested(data))
+
+
+@app.after_request
+async def record_request_duration(response):
+    """Asynchronní obdoba app.record_request_duration()."""
+    route = request.url_rule.rule if request.url_rule else None
+    if route in metrics.TIMED_ROUTES and response.mimetype != 'application/json-stream':
+        metrics.observe_request(route, response.status_code, time.perf_counter() - g.request_started)
+    if route in wsgi_app.SERVER_TIMING_ROUTES and g.get('timing') is not None:
+        response.headers['Server-Timing'] = g.timing.server_timing()
+    return response
+
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    """Metriky ve formátu Prometheus (součet za všechny workery)."""
+    return Response(await asyncio.to_thread(metrics.render), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/favicon.ico')
+async def favicon():
+    return await send_from_directory(os.path.join(app.root_path, 'static'),
+                                     'favicon.ico', mimetype='image/vnd.microsoft.icon')
+
+@app.route('/')
+async def index():
+    """Vykreslí hlavní HTML stránku aplikace."""
+    return await render_template('index.html',
+                                 app_id=wsgi_app.app_id,
+                                 firebase_config_json=wsgi_app.firebase_config_json_for_frontend)
+
+
+async def resolve_search_item(item, details_mode='none'):
+    """Asynchronní obdoba app.resolve_search_item() - dohledá obrázek a sestaví řádek výsledku."""
+    include_details = details_mode != 'none'
+    food_has_image = item.get('hasImage', False)
+    food_url_slug = item.get('url')
+
+    image_url = None
+    food_type = None
+    fetched_pages = {}
+    details = None
+
+    if food_has_image and food_url_slug:
+        prewarm.record('image', food_url_slug)
+    indexed_image = await asyncio.to_thread(wsgi_app.image_index.get, food_url_slug) if food_has_image and food_url_slug else None
+    if indexed_image is not None:
+        image_url = indexed_image.get("image_url")
+        food_type = indexed_image.get("food_type")
+
+    elif food_has_image and food_url_slug:
+        probe_failed = False
+
+        for attempt, (current_image_fetch_url, current_food_type) in enumerate(image_page_candidates(food_url_slug)):
+            if attempt:
+                metrics.add_timing_count('retries')
+            try:
+                async with image_semaphore:
+                    image_url, page_html = await probe_image(current_image_fetch_url, read_full=include_details)
+                if page_html is not None:
+                    fetched_pages[current_food_type] = (current_image_fetch_url, page_html)
+                if image_url:
+                    food_type = current_food_type
+                    break
+            except httpx.HTTPStatusError as e:
+                # 404 při hledání obrázku je běžná, jiný status je přechodná chyba
+                if e.response.status_code != 404:
+                    probe_failed = True
+            except Exception as e:
+                probe_failed = True
+
+        if image_url:
+            await asyncio.to_thread(wsgi_app.image_index.set, food_url_slug, {"image_url": image_url, "food_type": food_type})
+        elif not probe_failed:
+            await asyncio.to_thread(wsgi_app.image_index.set, food_url_slug, {"image_url": None, "food_type": None},
+                                    ttl=wsgi_app.IMAGE_INDEX_NEGATIVE_TTL)
+
+        try:
+            details = await asyncio.to_thread(wsgi_app.remember_page_details, food_url_slug, food_type, fetched_pages)
+        except Exception as e:
+            details = None
+
+    result = build_search_result(item, image_url, food_type)
+    if include_details:
+        if details is None and food_url_slug:
+            with scheduler.priority('enrichment'):
+                details = await load_details(food_url_slug, food_type)
+        result.update(search_result_details(details, details_mode))
+    return result
+
+
+async def timed_search_item(item, details_mode='none'):
+    """Asynchronní obdoba app.timed_search_item() - měření patří jen tomuto asyncio tasku."""
+    timing = metrics.start_timing()
+    result = await resolve_search_item(item, details_mode)
+    result["_timing"] = timing.as_dict()
+    return result
+
+
+async def fetch_autocomplete(query):
+    """Asynchronní obdoba app.fetch_autocomplete() (při selhání komunikace vyhodí httpx.HTTPError)."""
+    autocomplete_data = wsgi_app.autocomplete_cache.get(query)
+    if autocomplete_data is not None:
+        return autocomplete_data
+    return await autocomplete_flight.do(PrefixCache.normalize(query), fetch_autocomplete_uncached, query)
+
+
+async def fetch_autocomplete_uncached(query):
+    """Asynchronní obdoba app.fetch_autocomplete_uncached()."""
+    max_retries = 3
+    retry_delay = 0.5  # sekundy
+
+    for attempt in range(max_retries):
+        try:
+            autocomplete_response = await upstream_get(SEARCH_API_URL, kind='autocomplete', params={'query': query})
+            autocomplete_response.raise_for_status()
+            break
+        except httpx.HTTPError as e:
+            if attempt == max_retries - 1:
+                raise
+            await asyncio.sleep(retry_delay)
+            metrics.inc('kalkulacka_upstream_sleep_seconds_total', retry_delay, kind='autocomplete')
+            metrics.add_timing_count('retries')
+    autocomplete_data = autocomplete_response.json()
+
+    if not isinstance(autocomplete_data, list):
+        raise wsgi_app.AutocompleteFormatError("Server vrátil neočekávaný formát autocomplete dat (není seznam).")
+
+    wsgi_app.autocomplete_cache.set(query, autocomplete_data)
+    return autocomplete_data
+
+
+async def generate_results(query, stream_order, details_mode='none', include_timing=False):
+    """Asynchronní generátor NDJSON řádků výsledků vyhledávání."""
+    try:
+        try:
+            autocomplete_data = await fetch_autocomplete(query)
+        except httpx.HTTPError as e:
+            yield json.dumps({"error": f"Chyba při komunikaci s API: {str(e)}"}) + '\n'
+            return
+        except wsgi_app.AutocompleteFormatError as e:
+            yield json.dumps({"error": str(e)}) + '\n'
+            return
+
+        unique_results = unique_autocomplete_items(autocomplete_data)
+
+        resolve_item = timed_search_item if include_timing else resolve_search_item
+        tasks = [asyncio.ensure_future(resolve_item(item, details_mode)) for item in unique_results]
+        try:
+            if stream_order == 'completion':
+                for finished_task in asyncio.as_completed(tasks):
+                    yield json.dumps(await finished_task) + '\n'
+            else:
+                for task in tasks:
+                    yield json.dumps(await task) + '\n'
+        finally:
+            # Klient se mohl odpojit - zrušíme rozpracované dohledávání obrázků
+            for task in tasks:
+                task.cancel()
+
+    except httpx.HTTPError as e:
+        yield json.dumps({"error": f"Chyba při komunikaci s autocomplete API: {e}"}) + '\n'
+    except ValueError as e:
+        yield json.dumps({"error": f"Chyba při parsování JSON odpovědi z autocomplete API: {e}"}) + '\n'
+    except Exception as e:
+        yield json.dumps({"error": f"Nastala neočekávaná chyba: {e}"}) + '\n'
+
+
+@app.route('/search', methods=['POST'])
+async def search_food():
+    """Asynchronní obdoba app.search_food() - streamuje výsledky vyhledávání jako NDJSON."""
+    if request.is_json:
+        data = await request.get_json()
+    else:
+        data = await request.form
+    query = data.get('query')
+    stream_order = data.get('order') or wsgi_app.SEARCH_STREAM_ORDER
+    details_mode = data.get('details') or wsgi_app.SEARCH_DETAILS
+
+    if not query:
+        return jsonify({"error": "Prosím, zadejte hledaný výraz."}), 400
+
+    if stream_order not in wsgi_app.SEARCH_STREAM_ORDERS:
+        return jsonify({"error": f"Neplatné pořadí výsledků: {stream_order}. Povolené hodnoty: {', '.join(wsgi_app.SEARCH_STREAM_ORDERS)}."}), 400
+
+    if details_mode not in wsgi_app.SEARCH_DETAILS_MODES:
+        return jsonify({"error": f"Neplatný režim detailů: {details_mode}. Povolené hodnoty: {', '.join(wsgi_app.SEARCH_DETAILS_MODES)}."}), 400
+
+    prewarm.record('query', PrefixCache.normalize(query))
+    results = generate_results(query, stream_order, details_mode, include_timing=g.timing is not None)
+    return Response(metrics.timed_async_stream('/search', results, g.request_started),
+                    mimetype='application/json-stream')
+
+
+async def scrape_details(url, is_recipe_flag):
+    """Asynchronně načte detailní stránku a parsuje nutriční hodnoty (None při chybě)."""
+    try:
+        response = await upstream_get(url, kind='detail')
+        response.raise_for_status()
+        parse_started = time.perf_counter()
+        scraped_data = await asyncio.to_thread(parse_details_page, response.text, url, is_recipe_flag)
+        metrics.observe('kalkulacka_parse_duration_seconds', time.perf_counter() - parse_started,
+                        page='recept' if is_recipe_flag else 'potravina')
+        return scraped_data
+    except Exception as e:
+        return None
+
+
+async def load_details(slug, food_type):
+    """Asynchronní obdoba app.load_details() - detaily z cache, nebo scrapované z webu (None při neúspěchu)."""
+    cache_key = (slug, food_type)
+    cached_details = await asyncio.to_thread(wsgi_app.details_cache.get, cache_key)
+    if cached_details is not None:
+        return cached_details
+    # Stažení se sdílí jen v rámci třídy priority (viz app.load_details())
+    return await details_flight.do(cache_key + (scheduler.request_class('detail'),), fetch_details, slug, food_type)
+
+
+async def fetch_details(slug, food_type):
+    """Asynchronní obdoba app.fetch_details()."""
+    scraped_data = None
+    for attempt, (target_url, is_recipe_flag) in enumerate(details_page_candidates(slug, food_type)):
+        if attempt:
+            metrics.add_timing_count('retries')
+        scraped_data = await scrape_details(target_url, is_recipe_flag)
+        if has_details(scraped_data):
+            break
+
+    if not has_details(scraped_data):
+        return None
+    details = build_details(scraped_data)
+    await asyncio.to_thread(wsgi_app.details_cache.set, (slug, food_type), details)
+    return details
+
+
+@app.route('/get_details', methods=['POST'])
+async def get_details():
+    """Asynchronní obdoba app.get_details()."""
+    data = await request.get_json()
+    slug = data.get('slug')
+    food_type_from_frontend = data.get('food_type')
+    details_format = data.get('format') or wsgi_app.DETAILS_FORMAT
+    if not slug:
+        return jsonify({"error": "Chybí slug pro získání detailů."}), 400
+    format_error = wsgi_app.details_format_error(details_format)
+    if format_error:
+        return jsonify({"error": format_error}), 400
+
+    details = await load_details(slug, food_type_from_frontend)
+
+    if details is not None:
+        prewarm.record('details', slug, food_type_from_frontend)
+        return jsonify(wsgi_app.format_details(details, details_format))
+    else:
+        return jsonify({"error": f"Nepodařilo se získat detaily pro {slug} po všech pokusech pouze s requests."}), 500
+
+
+async def batch_details_line(index, slug, food_type, details_format='text'):
+    """Asynchronní obdoba app.batch_details_line()."""
+    line = {"index": index, "slug": slug, "food_type": food_type}
+    try:
+        async with details_semaphore:
+            details = await load_details(slug, food_type)
+    except Exception as e:
+        details = None
+    if details is not None:
+        line["details"] = wsgi_app.format_details(details, details_format)
+    else:
+        line["error"] = f"Nepodařilo se získat detaily pro {slug} po všech pokusech pouze s requests."
+    return line
+
+
+@app.route('/get_details_batch', methods=['POST'])
+async def get_details_batch():
+    """Asynchronní obdoba app.get_details_batch()."""
+    payload = await request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    items = payload.get('items')
+    details_format = payload.get('format') or wsgi_app.DETAILS_FORMAT
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Chybí seznam položek pro získání detailů."}), 400
+    if len(items) > wsgi_app.DETAILS_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Příliš mnoho položek v dávce (maximum je {wsgi_app.DETAILS_BATCH_MAX_ITEMS})."}), 400
+    format_error = wsgi_app.details_format_error(details_format)
+    if format_error:
+        return jsonify({"error": format_error}), 400
+
+    async def generate_details():
+        tasks = []
+        try:
+            for index, item in enumerate(items):
+                slug = item.get('slug') if isinstance(item, dict) else None
+                food_type = item.get('food_type') if isinstance(item, dict) else None
+                if not slug:
+                    yield json.dumps({"index": index, "slug": slug, "food_type": food_type,
+                                      "error": "Chybí slug pro získání detailů."}) + '\n'
+                    continue
+                tasks.append(asyncio.ensure_future(batch_details_line(index, slug, food_type, details_format)))
+
+            for finished_task in asyncio.as_completed(tasks):
+                yield json.dumps(await finished_task) + '\n'
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return Response(generate_details(), mimetype='application/json-stream')
+
+
+@app.route('/aggregate_recipe', methods=['POST'])
+async def aggregate_recipe():
+    """Asynchronní obdoba app.aggregate_recipe()."""
+    ingredient_lists, is_batch = wsgi_app.recipe_ingredient_lists((await request.get_json(silent=True)) or {})
+    if ingredient_lists is None:
+        return jsonify({"error": "Chybí seznam ingrediencí receptu."}), 400
+
+    try:
+        results = aggregate_recipes(ingredient_lists)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if is_batch:
+        return jsonify({"recipes": results, "units": NUTRIENT_UNITS})
+    return jsonify(dict(results[0], units=NUTRIENT_UNITS))
+
+
+@app.route('/cache_stats')
+async def cache_stats():
+    """Vrátí počítadla zásahů a minutí cache (pro ladění výkonu)."""
+    # Zámek SQLite cache může držet vlákno, které právě zapisuje na disk - nečekáme na něj v event loopu
+    details_stats, images_stats, barcode_lookups_stats = await asyncio.gather(
+        asyncio.to_thread(wsgi_app.details_cache.stats),
+        asyncio.to_thread(wsgi_app.image_index.stats),
+        asyncio.to_thread(wsgi_app.barcode_cache.stats),
+    )
+    return jsonify({
+        "details": details_stats,
+        "images": images_stats,
+        "autocomplete": wsgi_app.autocomplete_cache.stats(),
+        "barcodes": wsgi_app.barcode_index.stats(),
+        "barcode_lookups": barcode_lookups_stats,
+        "in_flight": {flight.name: flight.stats() for flight in (autocomplete_flight, image_flight, details_flight)},
+        "prewarm": prewarm.stats(),
+        "upstream_priority": upstream_gate.stats(),
+    })
+
+
+async def resolve_barcode_entry(barcode):
+    """Asynchronní obdoba app.resolve_barcode_entry()."""
+    entry = await asyncio.to_thread(wsgi_app.known_barcode, barcode)
+    if entry is not None and entry.get("slug"):
+        return entry
+
+    food_name = wsgi_app.barcode_food_name(barcode, entry)
+    if not food_name:
+        return None
+    entry = autocomplete_barcode_match(await fetch_autocomplete(food_name))
+    if entry is None:
+        await asyncio.to_thread(wsgi_app.barcode_cache.set, barcode, {"slug": None}, ttl=wsgi_app.BARCODE_CACHE_NEGATIVE_TTL)
+        return None
+    await asyncio.to_thread(wsgi_app.barcode_cache.set, barcode, entry)
+    return entry
+
+
+async def resolve_barcode(barcode, details_format):
+    """Asynchronní obdoba app.resolve_barcode()."""
+    try:
+        entry = await resolve_barcode_entry(barcode)
+    except httpx.HTTPError as e:
+        return {"error": f"Chyba při komunikaci s API: {e}"}, 502
+    except wsgi_app.AutocompleteFormatError as e:
+        return {"error": str(e)}, 502
+    except ValueError as e:
+        return {"error": f"Chyba při parsování JSON odpovědi z autocomplete API: {e}"}, 502
+
+    details = await load_details(entry["slug"], entry.get("food_type")) if entry is not None else None
+    return wsgi_app.barcode_result(barcode, entry, details, details_format)
+
+
+@app.route('/search_by_barcode', methods=['POST'])
+async def search_by_barcode():
+    """Asynchronní obdoba app.search_by_barcode()."""
+    data = await request.get_json()
+    barcode = data.get('barcode')
+    details_format = data.get('format') or wsgi_app.DETAILS_FORMAT
+    if not barcode:
+        return jsonify({"error": "Chybí čárový kód pro vyhledávání."}), 400
+    format_error = wsgi_app.details_format_error(details_format)
+    if format_error:
+        return jsonify({"error": format_error}), 400
+
+    payload, status = await resolve_barcode(barcode, details_format)
+    if status == 200:
+        prewarm.record('details', payload["slug"], payload["food_type"])
+    return jsonify(payload), status
+
+
+async def resolve_barcode_line(barcode, indexes, details_format):
+    """Asynchronní obdoba app.resolve_barcode_line()."""
+    try:
+        async with details_semaphore:
+            result = await resolve_barcode(barcode, details_format)
+    except Exception as e:
+        result = ({"error": f"Nastala neočekávaná chyba: {e}"}, 500)
+    return wsgi_app.barcode_batch_line(barcode, indexes, result)
+
+
+@app.route('/search_by_barcode_batch', methods=['POST'])
+async def search_by_barcode_batch():
+    """Asynchronní obdoba app.search_by_barcode_batch()."""
+    payload = await request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    barcodes = payload.get('barcodes')
+    details_format = payload.get('format') or wsgi_app.DETAILS_FORMAT
+    if not isinstance(barcodes, list) or not barcodes:
+        return jsonify({"error": "Chybí seznam čárových kódů pro vyhledávání."}), 400
+    if len(barcodes) > wsgi_app.BARCODE_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Příliš mnoho čárových kódů v dávce (maximum je {wsgi_app.BARCODE_BATCH_MAX_ITEMS})."}), 400
+    format_error = wsgi_app.details_format_error(details_format)
+    if format_error:
+        return jsonify({"error": format_error}), 400
+
+    async def generate_barcodes():
+        tasks = []
+        try:
+            for barcode, indexes in wsgi_app.unique_barcodes(barcodes):
+                if not barcode:
+                    yield json.dumps(wsgi_app.barcode_batch_line(barcode, indexes, ({"error": "Chybí čárový kód pro vyhledávání."}, 400))) + '\n'
+                    continue
+                result = await asyncio.to_thread(wsgi_app.local_barcode_result, barcode, details_format)
+                if result is not None:
+                    yield json.dumps(wsgi_app.barcode_batch_line(barcode, indexes, result)) + '\n'
+                    continue
+                tasks.append(asyncio.ensure_future(resolve_barcode_line(barcode, indexes, details_format)))
+
+            for finished_task in asyncio.as_completed(tasks):
+                yield json.dumps(await finished_task) + '\n'
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return Response(generate_barcodes(), mimetype='application/json-stream')
+
+
+@app.route('/decode_barcode', methods=['POST'])
+async def decode_barcode():
+    """Asynchronní obdoba app.decode_barcode() - dekódování běží ve vlákně, aby neblokovalo event loop."""
+    too_large = wsgi_app.decode_request_too_large(request.content_length, request.mimetype)
+    if too_large:
+        return jsonify({"error": too_large}), 413
+    uploads = (await request.files).getlist('frame')
+    if uploads:
+        frames = [upload.read() for upload in uploads]
+    elif request.mimetype.startswith('image/'):
+        frames = [await request.get_data()]
+    else:
+        frames = []
+
+    payload, status = await asyncio.to_thread(wsgi_app.decode_frames, frames)
+    return jsonify(payload), status
+
+
+if __name__ == '__main__':
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,286 @@
+# barcode_index.py - Kompaktní index čárových kódů EAN -> (slug, food_type, název)
+# Index je jeden binární soubor namapovaný do paměti (mmap), takže ho všechny gunicorn workery
+# sdílejí přes page cache operačního systému. Soubor má tvar:
+#   hlavička | Bloomův filtr | záznamy (EAN jako uint64, offset textu) seřazené podle EAN | texty
+# Neznámé kódy většinou odmítne už Bloomův filtr, ostatní se hledají binárním vyhledáváním (O(log n)).
+import os
+import mmap
+import struct
+import hashlib
+import tempfile
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+# Výchozí cesta k souboru indexu (zapisuje ho import_barcodes.py, čte app.py)
+BARCODE_INDEX_PATH = os.getenv('BARCODE_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'barcodes.idx'))
+
+INDEX_MAGIC = b'KTEAN001'
+# magic, počet záznamů, počet bitů Bloomova filtru, počet hashovacích funkcí
+HEADER = struct.Struct('<8sQQI4x')
+# EAN (jako číslo), offset textu v sekci textů
+RECORD = struct.Struct('<QQ')
+# Délka textu záznamu
+TEXT_LENGTH = struct.Struct('<H')
+# Oddělovač polí v textu záznamu (slug, food_type, název)
+FIELD_SEPARATOR = '\x1f'
+
+# Počet bitů Bloomova filtru na jeden kód a počet hashovacích funkcí (cca 1 % falešně pozitivních)
+BLOOM_BITS_PER_ENTRY = 10
+BLOOM_HASHES = 7
+
+# Jak často (v sekundách) kontrolovat, zda importér nezapsal nový soubor indexu
+INDEX_RELOAD_INTERVAL = 5
+
+
+def ean_checksum_valid(code):
+    """Ověří kontrolní číslici EAN-8 / EAN-13 (váhy 3 a 1 zprava, stejně jako validateEANChecksum())."""
+    if len(code) not in (8, 13) or not code.isdigit():
+        return False
+    # Číslice zprava (bez kontrolní) mají střídavě váhu 3 a 1
+    total = 3 * sum(map(int, code[-2::-2])) + sum(map(int, code[-3::-2]))
+    return (10 - total % 10) % 10 == int(code[-1])
+
+
+def normalize_ean(code):
+    """
+    Vrátí kód jako EAN-8 nebo EAN-13 (bez mezer a pomlček), nebo None, pokud není platný.
+    UPC-A (12 číslic) se doplní nulou na EAN-13, GTIN-14 s úvodní nulou se zkrátí na EAN-13.
+    """
+    if code is None:
+        return None
+    code = ''.join(str(code).split()).replace('-', '')
+    if len(code) == 12:
+        code = '0' + code
+    elif len(code) == 14 and code.startswith('0'):
+        code = code[1:]
+    return code if ean_checksum_valid(code) else None
+
+
+def ean_key(code):
+    """Číselný klíč kódu v indexu. EAN-8 a EAN-13 sdílí prostor GTIN, proto stačí int()."""
+    return int(code)
+
+
+def _bloom_positions(key, bit_count, hash_count):
+    """Pozice bitů kódu v Bloomově filtru (dvojité hashování z jednoho blake2b)."""
+    digest = hashlib.blake2b(key.to_bytes(8, 'little'), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'little')
+    second = int.from_bytes(digest[8:], 'little') | 1
+    return [(first + i * second) % bit_count for i in range(hash_count)]
+
+
+def _encode_text(slug, food_type, name):
+    """Zakóduje text záznamu. Oddělovač polí v názvu se nahradí mezerou, ve slugu a typu je chyba."""
+    if FIELD_SEPARATOR in (slug or '') or FIELD_SEPARATOR in (food_type or ''):
+        raise ValueError(f"Slug ani typ nesmí obsahovat oddělovač polí: {slug!r}")
+    name = (name or '').replace(FIELD_SEPARATOR, ' ')
+    text = FIELD_SEPARATOR.join((slug or '', food_type or '', name)).encode('utf-8')
+    if len(text) > 0xFFFF:
+        raise ValueError(f"Příliš dlouhý záznam pro slug {slug}")
+    return TEXT_LENGTH.pack(len(text)) + text
+
+
+class BarcodeIndexWriter:
+    """
+    Zapisuje index po jednotlivých záznamech s konstantní pamětí (kromě Bloomova filtru).
+    Kódy musí přicházet vzestupně podle ean_key() a bez duplicit. Soubor se nahradí atomicky v close().
+    """
+
+    def __init__(self, path, expected_count):
+        self.path = path
+        self.count = 0
+        self.bloom_bits = max(64, expected_count * BLOOM_BITS_PER_ENTRY)
+        self.bloom = bytearray((self.bloom_bits + 7) // 8)
+        self._last_key = -1
+        directory = os.path.dirname(os.path.abspath(path))
+        self._records = tempfile.TemporaryFile(dir=directory)
+        self._texts = tempfile.TemporaryFile(dir=directory)
+        self._text_offset = 0
+
+    def add(self, code, slug, food_type=None, name=None):
+        """Přidá platný EAN kód (řetězec) se slugem, typem a názvem potraviny."""
+        key = ean_key(code)
+        if key <= self._last_key:
+            raise ValueError(f"Kódy musí být seřazené a unikátní: {code}")
+        self._last_key = key
+        text = _encode_text(slug, food_type, name)
+        self._records.write(RECORD.pack(key, self._text_offset))
+        self._texts.write(text)
+        self._text_offset += len(text)
+        for position in _bloom_positions(key, self.bloom_bits, BLOOM_HASHES):
+            self.bloom[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def close(self):
+        """Sestaví výsledný soubor a atomicky jím nahradí případný starý index."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.barcodes-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(HEADER.pack(INDEX_MAGIC, self.count, self.bloom_bits, BLOOM_HASHES))
+                out.write(self.bloom)
+                for section in (self._records, self._texts):
+                    section.seek(0)
+                    shutil.copyfileobj(section, out)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        finally:
+            self._records.close()
+            self._texts.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._records.close()
+            self._texts.close()
+
+
+def write_index(path, entries):
+    """Zapíše index ze slovníku/iterovatelného {ean: (slug, food_type, name)} (vhodné pro menší data)."""
+    rows = {}
+    for code, (slug, food_type, name) in dict(entries).items():
+        normalized = normalize_ean(code)
+        if normalized is not None:
+            rows[ean_key(normalized)] = (normalized, slug, food_type, name)
+    with BarcodeIndexWriter(path, len(rows)) as writer:
+        for key in sorted(rows):
+            writer.add(*rows[key])
+
+
+# Namapovaný soubor indexu s rozložením sekcí. Po přemapování se nahrazuje celý jedním přiřazením,
+# takže vyhledávání v jiném vlákně nikdy nekombinuje nový počet záznamů nebo offsety se starým mmap.
+_IndexSnapshot = namedtuple('_IndexSnapshot', 'map count bloom_bits bloom_hashes bloom_offset records_offset texts_offset')
+
+
+class BarcodeIndex:
+    """Čtení indexu přes mmap. Soubor se načte líně a po přepsání importérem se znovu namapuje."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._map_pid = None
+        self._file_id = None
+        self._checked_at = 0
+
+        self.lookups = 0
+        self.bloom_rejects = 0
+        self.hits = 0
+
+    @property
+    def count(self):
+        snapshot = self._snapshot
+        return snapshot.count if snapshot is not None else 0
+
+    def _open(self):
+        """Vrátí aktuální _IndexSnapshot (nebo None, pokud index neexistuje nebo je poškozený)."""
+        now = time.monotonic()
+        if self._map_pid == os.getpid() and now - self._checked_at < INDEX_RELOAD_INTERVAL:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                self._snapshot, self._file_id = None, None
+                self._map_pid = os.getpid()
+                return None
+            file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if file_id == self._file_id and self._map_pid == os.getpid():
+                return self._snapshot
+            try:
+                with open(self.path, 'rb') as f:
+                    index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count, bloom_bits, bloom_hashes = HEADER.unpack_from(index_map, 0)
+                if magic != INDEX_MAGIC:
+                    raise ValueError("neznámý formát souboru")
+                records_offset = HEADER.size + (bloom_bits + 7) // 8
+                snapshot = _IndexSnapshot(index_map, count, bloom_bits, bloom_hashes, HEADER.size,
+                                          records_offset, records_offset + count * RECORD.size)
+                if len(index_map) < snapshot.texts_offset:
+                    raise ValueError("soubor je zkrácený")
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Upozornění: Nepodařilo se načíst index čárových kódů {self.path}: {e}")
+                self._snapshot, self._file_id = None, file_id
+                self._map_pid = os.getpid()
+                return None
+            # Nejdřív celý nový stav, pak identita souboru - jiné vlákno vidí buď starý, nebo nový snapshot
+            self._snapshot = snapshot
+            self._file_id, self._map_pid = file_id, os.getpid()
+            return snapshot
+
+    @staticmethod
+    def _might_contain(snapshot, key):
+        index_map = snapshot.map
+        for position in _bloom_positions(key, snapshot.bloom_bits, snapshot.bloom_hashes):
+            if not index_map[snapshot.bloom_offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    @staticmethod
+    def _entry_text(snapshot, text_offset):
+        start = snapshot.texts_offset + text_offset
+        (length,) = TEXT_LENGTH.unpack_from(snapshot.map, start)
+        text = snapshot.map[start + TEXT_LENGTH.size:start + TEXT_LENGTH.size + length].decode('utf-8')
+        return text.split(FIELD_SEPARATOR)
+
+    def lookup(self, code):
+        """
+        Vrátí {"ean", "slug", "food_type", "name"} pro kód, nebo None.
+        Kód se nejprve normalizuje a ověří se jeho kontrolní číslice.
+        """
+        normalized = normalize_ean(code)
+        if normalized is None:
+            return None
+        # Snapshot se načte jednou - mmap, počet i offsety patří ke stejnému souboru
+        snapshot = self._open()
+        if snapshot is None:
+            return None
+        key = ean_key(normalized)
+        self.lookups += 1
+        if not self._might_contain(snapshot, key):
+            self.bloom_rejects += 1
+            return None
+
+        low, high = 0, snapshot.count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            middle_key, text_offset = RECORD.unpack_from(snapshot.map, snapshot.records_offset + middle * RECORD.size)
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle - 1
+            else:
+                slug, food_type, name = self._entry_text(snapshot, text_offset)
+                self.hits += 1
+                return {"ean": normalized, "slug": slug, "food_type": food_type or None, "name": name or None}
+        return None
+
+    def iter_entries(self):
+        """Prochází všechny záznamy vzestupně jako (klíč, slug, food_type, název) - pro importér."""
+        snapshot = self._open()
+        if snapshot is None:
+            return
+        for position in range(snapshot.count):
+            key, text_offset = RECORD.unpack_from(snapshot.map, snapshot.records_offset + position * RECORD.size)
+            slug, food_type, name = self._entry_text(snapshot, text_offset)
+            yield key, slug, food_type or None, name or None
+
+    def stats(self):
+        """Vrátí velikost indexu a počítadla vyhledávání."""
+        snapshot = self._open()
+        return {
+            "path": self.path,
+            "entries": snapshot.count if snapshot is not None else 0,
+            "lookups": self.lookups,
+            "bloom_rejects": self.bloom_rejects,
+            "hits": self.hits,
+        }
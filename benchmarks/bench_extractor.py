@@ -0,0 +1,84 @@
+# bench_extractor.py - Ověření shody a měření rychlosti extractor.py proti referenčnímu parseru
+# Spuštění z kořene repozitáře: python benchmarks/bench_extractor.py [počet_opakování]
+#
+# Pro každou uloženou stránku v benchmarks/pages/ (recept_*.html jsou recepty, ostatní potraviny)
+# nejprve ověří, že extractor.extract_nutrients() vrací přesně stejný slovník jako
+# scraper.parse_nutrients_from_soup() - v režimu receptu i potraviny. Poté změří čas parsování jedné stránky.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bs4 import BeautifulSoup
+from scraper import parse_nutrients_from_soup
+from extractor import extract_nutrients
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+
+def reference_parse(html, is_recipe_page):
+    return parse_nutrients_from_soup(BeautifulSoup(html, 'html.parser'), is_recipe_page=is_recipe_page)
+
+
+def guarded(parse, html, is_recipe_page):
+    """Vrátí výsledek parseru, nebo název výjimky (i ta musí být u obou parserů stejná)."""
+    try:
+        return parse(html, is_recipe_page)
+    except Exception as e:
+        return type(e).__name__
+
+
+def load_pages():
+    pages = []
+    for file_name in sorted(os.listdir(PAGES_DIR)):
+        if file_name.endswith('.html'):
+            with open(os.path.join(PAGES_DIR, file_name), encoding='utf-8') as f:
+                pages.append((file_name, f.read(), file_name.startswith('recept_')))
+    return pages
+
+
+def check_equivalence(pages):
+    mismatches = 0
+    for file_name, html, _ in pages:
+        for is_recipe_page in (False, True):
+            expected = guarded(reference_parse, html, is_recipe_page)
+            actual = guarded(extract_nutrients, html, is_recipe_page)
+            if expected != actual:
+                mismatches += 1
+                print(f"NESHODA {file_name} (recept={is_recipe_page}):")
+                print(f"  očekáváno: {expected}")
+                print(f"  získáno:   {actual}")
+    return mismatches
+
+
+def time_per_page(parse, html, is_recipe_page, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        parse(html, is_recipe_page)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    pages = load_pages()
+
+    mismatches = check_equivalence(pages)
+    if mismatches:
+        print(f"{mismatches} neshod - extractor nevrací stejné výsledky jako referenční parser.")
+        sys.exit(1)
+    print(f"Shoda ověřena na {len(pages)} stránkách (režim receptu i potraviny).\n")
+
+    print(f"{'stránka':<36}{'KB':>6}{'BeautifulSoup ms':>18}{'extractor ms':>14}{'zrychlení':>11}")
+    total_reference = total_fast = 0.0
+    for file_name, html, is_recipe_page in pages:
+        reference_ms = time_per_page(reference_parse, html, is_recipe_page, repeats)
+        fast_ms = time_per_page(extract_nutrients, html, is_recipe_page, repeats)
+        total_reference += reference_ms
+        total_fast += fast_ms
+        print(f"{file_name:<36}{len(html.encode('utf-8')) / 1024:>6.1f}{reference_ms:>18.3f}{fast_ms:>14.3f}{reference_ms / fast_ms:>10.1f}x")
+    print(f"{'průměr':<36}{'':>6}{total_reference / len(pages):>18.3f}{total_fast / len(pages):>14.3f}{total_reference / total_fast:>10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
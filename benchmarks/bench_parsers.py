@@ -0,0 +1,226 @@
+# bench_parsers.py - Mikrobenchmarky parserů nad uloženým korpusem stránek a odpovědí autocomplete API
+# Spuštění z kořene repozitáře:
+#   python benchmarks/bench_parsers.py [--repeats N] [--only NÁZEV] [--output soubor.json] [--compare starší.json]
+#
+# Korpus: benchmarks/pages/*.html (detailní stránky, recept_*.html jsou recepty) a
+# benchmarks/autocomplete/*.json (odpovědi autocomplete API včetně duplicit a položek bez názvu).
+# Pro každý vstup měří:
+#   parse_nutrients_from_soup        - referenční parser (včetně stavby BeautifulSoup stromu)
+#   extract_nutrients                - rychlý lxml parser z extractor.py (pro srovnání)
+#   extract_value_and_unit_from_text - všechny texty, které parser na dané stránce převádí na hodnotu a jednotku
+#   find_image_url                   - hledání obrázku přes BeautifulSoup
+#   image_probe                      - inkrementální hledání obrázku (ImageProbe po 8 KB, jako při stahování)
+#   autocomplete_items               - odstranění duplicit a sestavení řádků výsledků (klasifikace tekutin)
+# Čas je medián / průměr / minimum z N opakování, paměť se měří přes tracemalloc v samostatném běhu:
+# peak_kb = nejvyšší navýšení paměti během volání, retained_kb / retained_blocks = co po volání (a úklidu gc)
+# zůstalo alokované, např. v lru_cache.
+# Výsledky se uloží jako JSON (výchozí benchmarks/results/parsers-<čas>.json), --compare vypíše poměr mediánů.
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bs4 import BeautifulSoup
+import scraper
+from scraper import (parse_nutrients_from_soup, extract_value_and_unit_from_text, find_image_url, ImageProbe,
+                     unique_autocomplete_items, build_search_result)
+from extractor import extract_nutrients
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(BENCHMARKS_DIR, 'pages')
+AUTOCOMPLETE_DIR = os.path.join(BENCHMARKS_DIR, 'autocomplete')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+# Velikost části při simulovaném stahování stránky (jako IMAGE_PROBE_CHUNK_SIZE)
+PROBE_CHUNK_SIZE = 8 * 1024
+
+
+def load_pages():
+    pages = []
+    for file_name in sorted(os.listdir(PAGES_DIR)):
+        if file_name.endswith('.html'):
+            with open(os.path.join(PAGES_DIR, file_name), encoding='utf-8') as f:
+                pages.append((file_name, f.read(), file_name.startswith('recept_')))
+    return pages
+
+
+def load_autocomplete():
+    responses = []
+    for file_name in sorted(os.listdir(AUTOCOMPLETE_DIR)):
+        if file_name.endswith('.json'):
+            with open(os.path.join(AUTOCOMPLETE_DIR, file_name), encoding='utf-8') as f:
+                responses.append((file_name, json.load(f)))
+    return responses
+
+
+def recorded_texts(html, is_recipe_page):
+    """Vrátí texty, které parse_nutrients_from_soup() na stránce předá extract_value_and_unit_from_text()."""
+    texts = []
+
+    def recording(text_content):
+        texts.append(text_content)
+        return extract_value_and_unit_from_text(text_content)
+
+    scraper.extract_value_and_unit_from_text = recording
+    try:
+        parse_nutrients_from_soup(BeautifulSoup(html, 'html.parser'), is_recipe_page=is_recipe_page)
+    finally:
+        scraper.extract_value_and_unit_from_text = extract_value_and_unit_from_text
+    return texts
+
+
+def probe_page(encoded_html):
+    probe = ImageProbe('utf-8')
+    for start in range(0, len(encoded_html), PROBE_CHUNK_SIZE):
+        if probe.feed(encoded_html[start:start + PROBE_CHUNK_SIZE]):
+            break
+    else:
+        probe.finish()
+    return probe.image_url
+
+
+def autocomplete_rows(autocomplete_data):
+    return [build_search_result(item) for item in unique_autocomplete_items(autocomplete_data)]
+
+
+def build_cases(pages, autocomplete_responses):
+    """Vrátí seznam (benchmark, vstup, velikost vstupu v bajtech, funkce bez argumentů)."""
+    cases = []
+    for file_name, html, is_recipe_page in pages:
+        size = len(html.encode('utf-8'))
+        texts = recorded_texts(html, is_recipe_page)
+        encoded_html = html.encode('utf-8')
+        cases += [
+            ('parse_nutrients_from_soup', file_name, size,
+             lambda html=html, is_recipe_page=is_recipe_page:
+                 parse_nutrients_from_soup(BeautifulSoup(html, 'html.parser'), is_recipe_page=is_recipe_page)),
+            ('extract_nutrients', file_name, size,
+             lambda html=html, is_recipe_page=is_recipe_page: extract_nutrients(html, is_recipe_page=is_recipe_page)),
+            ('extract_value_and_unit_from_text', file_name, sum(len(text.encode('utf-8')) for text in texts),
+             lambda texts=texts: [extract_value_and_unit_from_text(text) for text in texts]),
+            ('find_image_url', file_name, size, lambda html=html: find_image_url(html)),
+            ('image_probe', file_name, size, lambda encoded_html=encoded_html: probe_page(encoded_html)),
+        ]
+    for file_name, autocomplete_data in autocomplete_responses:
+        size = len(json.dumps(autocomplete_data, ensure_ascii=False).encode('utf-8'))
+        cases.append(('autocomplete_items', file_name, size,
+                      lambda autocomplete_data=autocomplete_data: autocomplete_rows(autocomplete_data)))
+    return cases
+
+
+def measure(function, repeats):
+    """Změří čas (ms) a paměť (tracemalloc) jednoho volání funkce."""
+    function()  # zahřátí (regulární výrazy, lru_cache, importy)
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    # Paměť se měří zvlášť - tracemalloc výrazně zpomaluje alokace
+    tracemalloc.start()
+    try:
+        before_snapshot = tracemalloc.take_snapshot()
+        before_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        function()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        gc.collect()  # strom BeautifulSoup obsahuje cykly - bez úklidu by vypadal jako trvale alokovaný
+        current_bytes = tracemalloc.get_traced_memory()[0]
+        after_snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after_snapshot.compare_to(before_snapshot, 'filename'))
+
+    return {
+        "median_ms": round(statistics.median(durations), 4),
+        "mean_ms": round(statistics.fmean(durations), 4),
+        "min_ms": round(min(durations), 4),
+        "peak_kb": round((peak_bytes - before_bytes) / 1024, 1),
+        "retained_kb": round((current_bytes - before_bytes) / 1024, 1),
+        "retained_blocks": retained_blocks,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    """Vypíše poměr mediánů proti staršímu běhu (< 1 = zrychlení)."""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    previous_results = {(row["benchmark"], row["input"]): row for row in previous["results"]}
+    print(f"\nSrovnání s {previous_path} (revize {previous['meta'].get('git_revision')}):")
+    print(f"{'benchmark':<34}{'vstup':<32}{'dříve ms':>10}{'nyní ms':>10}{'poměr':>8}{'peak KB':>16}")
+    for row in results:
+        old_row = previous_results.get((row["benchmark"], row["input"]))
+        if old_row is None:
+            continue
+        ratio = row["median_ms"] / old_row["median_ms"] if old_row["median_ms"] else float('nan')
+        peak = f'{old_row["peak_kb"]:.0f} -> {row["peak_kb"]:.0f}'
+        print(f'{row["benchmark"]:<34}{row["input"]:<32}{old_row["median_ms"]:>10.3f}{row["median_ms"]:>10.3f}{ratio:>8.2f}{peak:>16}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mikrobenchmarky parserů nad uloženým korpusem.")
+    parser.add_argument('--repeats', type=int, default=50, help="počet opakování každého měření (výchozí 50)")
+    parser.add_argument('--only', action='append', help="spustit jen daný benchmark (lze opakovat)")
+    parser.add_argument('--output', help="cesta k JSON souboru s výsledky (výchozí benchmarks/results/parsers-<čas>.json)")
+    parser.add_argument('--compare', help="JSON s výsledky staršího běhu pro srovnání")
+    args = parser.parse_args()
+
+    cases = build_cases(load_pages(), load_autocomplete())
+    if args.only:
+        cases = [case for case in cases if case[0] in args.only]
+
+    print(f"{'benchmark':<34}{'vstup':<32}{'KB':>7}{'medián ms':>11}{'peak KB':>9}{'retained KB':>13}")
+    results = []
+    for benchmark, input_name, size, function in cases:
+        row = {"benchmark": benchmark, "input": input_name, "input_bytes": size}
+        row.update(measure(function, args.repeats))
+        results.append(row)
+        print(f"{benchmark:<34}{input_name:<32}{size / 1024:>7.1f}{row['median_ms']:>11.3f}{row['peak_kb']:>9.1f}{row['retained_kb']:>13.1f}")
+
+    summary = {}
+    for row in results:
+        totals = summary.setdefault(row["benchmark"], {"inputs": 0, "median_ms_total": 0.0, "peak_kb_max": 0.0})
+        totals["inputs"] += 1
+        totals["median_ms_total"] = round(totals["median_ms_total"] + row["median_ms"], 4)
+        totals["peak_kb_max"] = max(totals["peak_kb_max"], row["peak_kb"])
+
+    report = {
+        "meta": {
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeats": args.repeats,
+        },
+        "results": results,
+        "summary": summary,
+    }
+    output_path = args.output or os.path.join(RESULTS_DIR, time.strftime('parsers-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nVýsledky uloženy do {output_path}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+# loadtest.py - Zátěžový test celé aplikace (gunicorn nebo hypercorn) proti lokálnímu náhradnímu upstreamu
+# Spuštění z kořene repozitáře:
+#   python benchmarks/loadtest.py [--concurrency 1,8,32] [--duration 20] [--mix search=5,details=3,barcode=2]
+#                                 [--workers 2] [--threads 8] [--server gunicorn|hypercorn]
+#                                 [--latency-ms 80] [--jitter-ms 40] [--error-rate 0.02] [--output soubor.json]
+# Bez --app-url skript spustí benchmarks/standin_upstream.py (ve vlákně) a aplikaci jako podproces
+# nasměrovanou na něj (SEARCH_API_URL, BASE_WEB_URL) s vlastní dočasnou cache a indexem čárových kódů.
+# S --app-url zatěžuje už běžící aplikaci (náhradní server je pak třeba spustit zvlášť).
+#
+# Pro každou úroveň souběžnosti posílá po dobu --duration sekund smíšený provoz /search (NDJSON),
+# /get_details a /search_by_barcode; dotazy a slugy pochází z benchmarks/autocomplete/ a populární
+# položky se opakují častěji (Zipfovo rozdělení), takže se projeví i cache. Cache se mezi úrovněmi nemaže.
+# Vypíše p50/p95/p99 latence, dobu do prvního NDJSON řádku, požadavky za sekundu a počty požadavků
+# na upstream; výsledky uloží jako JSON (výchozí benchmarks/results/loadtest-<čas>.json).
+import os
+import sys
+import json
+import time
+import random
+import socket
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BENCHMARKS_DIR, '..')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import standin_upstream
+from barcode_index import write_index
+
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+# Podíl čárových kódů, které v indexu nejsou (odpověď 404)
+UNKNOWN_BARCODE_RATE = 0.1
+# Jak dlouho čekat na start aplikace
+APP_START_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def ean13(number):
+    """Sestaví EAN-13 z čísla (12 číslic + kontrolní číslice)."""
+    digits = f'{number % 10 ** 9:09d}'
+    body = '859' + digits  # česká předpona GS1
+    total = sum(int(digit) * (3 if position % 2 else 1) for position, digit in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def zipf_weights(count):
+    return [1 / (rank + 1) for rank in range(count)]
+
+
+class Workload:
+    """Dotazy, slugy a čárové kódy pro generovaný provoz (z korpusu autocomplete odpovědí)."""
+
+    def __init__(self):
+        corpus = standin_upstream.Corpus()
+        self.queries = []
+        self.items = []
+        for body in corpus.autocomplete.values():
+            for item in json.loads(body):
+                title = str(item.get('title', '')).strip()
+                if not title or not item.get('url'):
+                    continue
+                self.queries.append(title.lower())
+                self.items.append((item['url'], 'recept' if item.get('type') == 'recipe' else 'potravina', title))
+        # Pevné pořadí, aby populární položky byly stejné v každém běhu
+        random.Random(42).shuffle(self.queries)
+        random.Random(43).shuffle(self.items)
+        self.barcodes = {ean13(int.from_bytes(hashlib.blake2b(slug.encode('utf-8'), digest_size=8).digest(), 'little')):
+                         (slug, food_type, title) for slug, food_type, title in self.items}
+        self.barcode_list = list(self.barcodes)
+        self.query_weights = zipf_weights(len(self.queries))
+        self.item_weights = zipf_weights(len(self.items))
+
+    def query(self, rng):
+        return rng.choices(self.queries, self.query_weights)[0]
+
+    def item(self, rng):
+        return rng.choices(self.items, self.item_weights)[0]
+
+    def barcode(self, rng):
+        if rng.random() < UNKNOWN_BARCODE_RATE:
+            return ean13(rng.randrange(10 ** 9))
+        return rng.choices(self.barcode_list, self.item_weights)[0]
+
+
+def run_search(session, app_url, workload, rng):
+    """Vrátí (status, doba do prvního řádku, chyba v řádcích)."""
+    started = time.perf_counter()
+    first_line = None
+    line_error = False
+    with session.post(f'{app_url}/search', json={'query': workload.query(rng)}, stream=True, timeout=120) as response:
+        for line in response.iter_lines():
+            if first_line is None:
+                first_line = time.perf_counter() - started
+            if line and b'"error"' in line:
+                line_error = True
+    return response.status_code, first_line, line_error
+
+
+def run_details(session, app_url, workload, rng):
+    slug, food_type, _ = workload.item(rng)
+    response = session.post(f'{app_url}/get_details', json={'slug': slug, 'food_type': food_type}, timeout=120)
+    return response.status_code, None, False
+
+
+def run_barcode(session, app_url, workload, rng):
+    response = session.post(f'{app_url}/search_by_barcode', json={'barcode': workload.barcode(rng)}, timeout=120)
+    return response.status_code, None, False
+
+
+OPERATIONS = {'search': run_search, 'details': run_details, 'barcode': run_barcode}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Neznámá operace {name} (povolené: {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values, fraction):
+    """Percentil metodou nejbližšího pořadí (None pro prázdný seznam)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def run_level(app_url, workload, mix, concurrency, duration, seed):
+    """Spustí `concurrency` uživatelů na `duration` sekund a vrátí seznam záznamů (operace, status, latence, TTFB, chyba)."""
+    records = []
+    records_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    operations, weights = list(mix), list(mix.values())
+
+    def user(user_index):
+        rng = random.Random(seed * 1000 + user_index)
+        session = requests.Session()
+        local_records = []
+        while time.perf_counter() < deadline:
+            operation = rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, first_line, line_error = OPERATIONS[operation](session, app_url, workload, rng)
+            except requests.exceptions.RequestException as e:
+                status, first_line, line_error = 'error', None, True
+            local_records.append((operation, status, time.perf_counter() - started, first_line, line_error))
+        with records_lock:
+            records.extend(local_records)
+
+    threads = [threading.Thread(target=user, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - started
+
+
+def summarize(records, elapsed):
+    endpoints = {}
+    for operation in OPERATIONS:
+        rows = [row for row in records if row[0] == operation]
+        if not rows:
+            continue
+        latencies = [row[2] for row in rows]
+        first_lines = [row[3] for row in rows if row[3] is not None]
+        statuses = {}
+        for row in rows:
+            statuses[str(row[1])] = statuses.get(str(row[1]), 0) + 1
+        errors = sum(1 for row in rows if row[1] == 'error' or (isinstance(row[1], int) and row[1] >= 500) or row[4])
+        endpoints[operation] = {
+            "requests": len(rows),
+            "rps": round(len(rows) / elapsed, 2),
+            "errors": errors,
+            "statuses": statuses,
+            "p50_ms": milliseconds(percentile(latencies, 0.50)),
+            "p95_ms": milliseconds(percentile(latencies, 0.95)),
+            "p99_ms": milliseconds(percentile(latencies, 0.99)),
+            "first_line_p50_ms": milliseconds(percentile(first_lines, 0.50)),
+            "first_line_p95_ms": milliseconds(percentile(first_lines, 0.95)),
+            "first_line_p99_ms": milliseconds(percentile(first_lines, 0.99)),
+        }
+    return {"requests": len(records), "rps": round(len(records) / elapsed, 2), "elapsed_s": round(elapsed, 2),
+            "endpoints": endpoints}
+
+
+def upstream_stats(standin_url):
+    try:
+        return requests.get(f'{standin_url}/__stats', timeout=5).json()
+    except (requests.exceptions.RequestException, ValueError):
+        return {}
+
+
+def stats_delta(before, after):
+    return {key: after[key] - before.get(key, 0) for key in sorted(after) if after[key] - before.get(key, 0)}
+
+
+def start_app(args, standin_url, work_dir, workload):
+    """Spustí aplikaci jako podproces nasměrovaný na náhradní upstream a vrátí (proces, URL)."""
+    index_path = os.path.join(work_dir, 'barcodes.idx')
+    write_index(index_path, workload.barcodes)
+    port = free_port()
+    env = dict(os.environ,
+               SEARCH_API_URL=f'{standin_url}/autocomplete/foodstuff-activity-meal',
+               BASE_WEB_URL=standin_url,
+               CACHE_DB_PATH=os.path.join(work_dir, 'cache.sqlite3'),
+               BARCODE_INDEX_PATH=index_path)
+    if args.server == 'hypercorn':
+        command = [sys.executable, '-m', 'hypercorn', 'asgi:app', '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(args.workers)]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(args.workers), '--threads', str(args.threads), '--timeout', '120']
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL,
+                               stderr=None if args.verbose else subprocess.DEVNULL)
+    app_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + APP_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Aplikace skončila při startu (kód {process.returncode}), spusťte s --verbose.")
+        try:
+            if requests.get(f'{app_url}/cache_stats', timeout=1).status_code == 200:
+                return process, app_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Aplikace nenaběhla do {APP_START_TIMEOUT} s.")
+
+
+def print_level(concurrency, summary, upstream):
+    print(f"\nSouběžnost {concurrency}: {summary['requests']} požadavků za {summary['elapsed_s']} s = {summary['rps']} req/s")
+    print(f"{'endpoint':<10}{'req':>7}{'req/s':>9}{'chyby':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'1. řádek p50':>14}{'p95':>8}{'p99':>8}")
+    for operation, row in summary['endpoints'].items():
+        first_line = ''.join(f'{value:>8}' if value is not None else f'{"-":>8}'
+                             for value in (row['first_line_p50_ms'], row['first_line_p95_ms'], row['first_line_p99_ms']))
+        print(f"{operation:<10}{row['requests']:>7}{row['rps']:>9}{row['errors']:>7}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+              f"{row['p99_ms']:>9}      {first_line}")
+    if upstream:
+        print("upstream: " + ', '.join(f'{key}: {count}' for key, count in upstream.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zátěžový test aplikace proti lokálnímu náhradnímu upstreamu.")
+    parser.add_argument('--app-url', help="URL už běžící aplikace (jinak se spustí vlastní instance)")
+    parser.add_argument('--standin-url', help="URL už běžícího náhradního serveru (pro počty požadavků na upstream)")
+    parser.add_argument('--server', choices=('gunicorn', 'hypercorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help="vlákna na gunicorn worker (výchozí 8)")
+    parser.add_argument('--concurrency', default='1,8,32', help="úrovně souběžnosti oddělené čárkou (výchozí 1,8,32)")
+    parser.add_argument('--duration', type=float, default=20, help="délka každé úrovně v sekundách (výchozí 20)")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('search=5,details=3,barcode=2'),
+                        help="poměr operací, např. search=5,details=3,barcode=2")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="cesta k JSON souboru s výsledky (výchozí benchmarks/results/loadtest-<čas>.json)")
+    parser.add_argument('--verbose', action='store_true', help="zobrazit výstup aplikace")
+    standin_upstream.add_arguments(parser)
+    args = parser.parse_args()
+
+    workload = Workload()
+    levels = [int(level) for level in args.concurrency.split(',')]
+    process = None
+    standin_server = None
+    work_dir = tempfile.TemporaryDirectory(prefix='kalkulacka-loadtest-')
+    try:
+        if args.app_url:
+            app_url, standin_url = args.app_url.rstrip('/'), args.standin_url
+        else:
+            standin_server, standin_url = standin_upstream.start_server(args)
+            process, app_url = start_app(args, standin_url, work_dir.name, workload)
+        print(f"Aplikace: {app_url} ({args.server if process else 'externí'}), upstream: {standin_url or 'neznámý'}")
+
+        report_levels = []
+        for level_index, concurrency in enumerate(levels):
+            before = upstream_stats(standin_url) if standin_url else {}
+            records, elapsed = run_level(app_url, workload, args.mix, concurrency, args.duration, args.seed + level_index)
+            upstream = stats_delta(before, upstream_stats(standin_url)) if standin_url else {}
+            summary = summarize(records, elapsed)
+            print_level(concurrency, summary, upstream)
+            report_levels.append(dict(summary, concurrency=concurrency, upstream=upstream))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if standin_server is not None:
+            standin_server.shutdown()
+        work_dir.cleanup()
+
+    report = {
+        "meta": {
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "server": args.server if process else 'external',
+            "workers": args.workers,
+            "threads": args.threads,
+            "mix": args.mix,
+            "duration_s": args.duration,
+            "upstream": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+                         "error_status": args.error_status, "hang_rate": args.hang_rate, "hang_ms": args.hang_ms},
+        },
+        "levels": report_levels,
+    }
+    output_path = args.output or os.path.join(RESULTS_DIR, time.strftime('loadtest-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nVýsledky uloženy do {output_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# standin_upstream.py - Lokální náhradní server za www.kaloricketabulky.cz pro zátěžové testy
+# Spuštění z kořene repozitáře:
+#   python benchmarks/standin_upstream.py [--port 8900] [--latency-ms 80] [--jitter-ms 40] [--error-rate 0.02]
+# Aplikaci pak stačí spustit s SEARCH_API_URL=http://127.0.0.1:8900/autocomplete/foodstuff-activity-meal
+# a BASE_WEB_URL=http://127.0.0.1:8900 (benchmarks/loadtest.py to dělá sám).
+#
+# Obsluhuje:
+#   /autocomplete/...?query=  - uložené odpovědi z benchmarks/autocomplete/ (vybrané podle začátku dotazu)
+#   /potraviny/<slug>, /recepty/<slug> - uložené stránky z benchmarks/pages/; slug položky typu "recipe"
+#                               existuje jen pod /recepty/, ostatní jen pod /potraviny/ (jinak 404 jako na webu)
+#   /file/image/...           - malý obrázek
+#   /__stats                  - počty obsloužených požadavků podle druhu a statusu (JSON)
+# Každá odpověď se zpozdí o latency ± jitter ms; s pravděpodobností error-rate vrátí error-status
+# a s pravděpodobností hang-rate se odpověď zdrží o hang-ms (vyprší timeout klienta).
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import unicodedata
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(BENCHMARKS_DIR, 'pages')
+AUTOCOMPLETE_DIR = os.path.join(BENCHMARKS_DIR, 'autocomplete')
+
+# Nejmenší platný GIF 1x1 (obsah obrázku aplikace nečte, jde jen o odpověď /file/image/)
+IMAGE_BYTES = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+               b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+
+def ascii_text(text):
+    """Malá písmena bez diakritiky ("Rohlík" -> "rohlik")."""
+    return unicodedata.normalize('NFKD', str(text).lower()).encode('ascii', 'ignore').decode('ascii')
+
+
+def stable_choice(key, options):
+    """Deterministický výběr podle klíče - stejný slug dostane vždy stejnou stránku."""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return options[int.from_bytes(digest, 'little') % len(options)]
+
+
+class Corpus:
+    """Uložené odpovědi autocomplete API a detailní stránky."""
+
+    def __init__(self):
+        self.autocomplete = {}
+        for file_name in sorted(os.listdir(AUTOCOMPLETE_DIR)):
+            if file_name.endswith('.json'):
+                with open(os.path.join(AUTOCOMPLETE_DIR, file_name), encoding='utf-8') as f:
+                    self.autocomplete[file_name[:-len('.json')]] = json.dumps(json.load(f), ensure_ascii=False).encode('utf-8')
+        self.food_pages, self.recipe_pages = [], []
+        for file_name in sorted(os.listdir(PAGES_DIR)):
+            if file_name.endswith('.html'):
+                with open(os.path.join(PAGES_DIR, file_name), 'rb') as f:
+                    (self.recipe_pages if file_name.startswith('recept_') else self.food_pages).append(f.read())
+        # Slugy receptů podle položek autocomplete (ostatní slugy jsou potraviny)
+        self.recipe_slugs = set()
+        for body in self.autocomplete.values():
+            for item in json.loads(body):
+                if item.get('type') == 'recipe' and item.get('url'):
+                    self.recipe_slugs.add(item['url'])
+
+    def autocomplete_response(self, query):
+        normalized = ascii_text(query).strip()
+        for name, body in self.autocomplete.items():
+            if normalized and (name.startswith(normalized[:4]) or normalized.startswith(name)):
+                return body
+        return stable_choice(normalized, list(self.autocomplete.values()))
+
+    def page(self, section, slug):
+        """Vrátí HTML stránky, nebo None (404), pokud slug do dané sekce nepatří."""
+        is_recipe = slug in self.recipe_slugs
+        if section == 'recepty' and is_recipe:
+            return stable_choice(slug, self.recipe_pages)
+        if section == 'potraviny' and not is_recipe:
+            return stable_choice(slug, self.food_pages)
+        return None
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive jako skutečný web
+    corpus = None
+    settings = None
+    stats = {}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, kind, status):
+        with self.stats_lock:
+            key = f'{kind} {status}'
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = unquote(url.path).strip('/').split('/')
+        if parts[0] == '__stats':
+            with self.stats_lock:
+                body = json.dumps(self.stats, sort_keys=True).encode('utf-8')
+            return self._send(200, body, 'application/json')
+
+        kind = {'autocomplete': 'autocomplete', 'potraviny': 'page', 'recepty': 'page', 'file': 'image'}.get(parts[0], 'other')
+        settings = self.settings
+        delay = max(0.0, settings.latency_ms + random.uniform(-settings.jitter_ms, settings.jitter_ms)) / 1000
+        if random.random() < settings.hang_rate:
+            delay = settings.hang_ms / 1000
+        time.sleep(delay)
+
+        if random.random() < settings.error_rate:
+            self._count(kind, settings.error_status)
+            return self._send(settings.error_status, b'Service Unavailable', 'text/plain')
+
+        if kind == 'autocomplete':
+            query = parse_qs(url.query).get('query', [''])[0]
+            status, body, content_type = 200, self.corpus.autocomplete_response(query), 'application/json'
+        elif kind == 'page' and len(parts) > 1:
+            page = self.corpus.page(parts[0], '/'.join(parts[1:]))
+            status, body, content_type = (200, page, 'text/html; charset=utf-8') if page else (404, b'Not Found', 'text/plain')
+        elif kind == 'image':
+            status, body, content_type = 200, IMAGE_BYTES, 'image/gif'
+        else:
+            status, body, content_type = 404, b'Not Found', 'text/plain'
+        self._count(kind, status)
+        self._send(status, body, content_type)
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Aplikace zavírá spojení hned po nalezení obrázku - přerušené spojení není chyba
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def add_arguments(parser):
+    """Přidá parametry náhradního serveru (sdílí je i benchmarks/loadtest.py)."""
+    parser.add_argument('--latency-ms', type=float, default=80, help="průměrné zpoždění odpovědi (výchozí 80 ms)")
+    parser.add_argument('--jitter-ms', type=float, default=40, help="náhodný rozptyl zpoždění ± ms (výchozí 40)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="podíl odpovědí s chybou (0-1)")
+    parser.add_argument('--error-status', type=int, default=503, help="HTTP status chybových odpovědí (výchozí 503)")
+    parser.add_argument('--hang-rate', type=float, default=0.0, help="podíl odpovědí zdržených o --hang-ms (0-1)")
+    parser.add_argument('--hang-ms', type=float, default=15000, help="zdržení 'zaseknutých' odpovědí (výchozí 15000 ms)")
+
+
+def start_server(settings, host='127.0.0.1', port=0):
+    """Spustí náhradní server ve vlákně na pozadí a vrátí (server, základní URL)."""
+    handler = type('ConfiguredStandinHandler', (StandinHandler,), {'corpus': Corpus(), 'settings': settings, 'stats': {}})
+    server = StandinServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='standin-upstream', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokální náhradní server za kaloricketabulky.cz.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(args, args.host, args.port)
+    print(f"Náhradní upstream běží na {base_url}")
+    print(f"  SEARCH_API_URL={base_url}/autocomplete/foodstuff-activity-meal")
+    print(f"  BASE_WEB_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
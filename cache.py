@@ -0,0 +1,391 @@
+# cache.py - Dvouúrovňová cache (LRU v paměti + SQLite na disku)
+import os
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Cesta k SQLite souboru sdílenému všemi cache (a všemi gunicorn workery)
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache.sqlite3'))
+
+# Jak často (po kolika zápisech) mazat expirované záznamy a kontrolovat velikost cache na disku
+DISK_SIZE_CHECK_INTERVAL = 100
+# Čas posledního přístupu se na disk zapisuje po dávkách: po tolika zásazích, nebo nejpozději po tolika sekundách
+DISK_TOUCH_BATCH = 100
+DISK_TOUCH_INTERVAL = 60
+
+
+class PersistentCache:
+    """
+    Cache JSON serializovatelných hodnot s LRU vyřazováním v paměti a perzistencí v SQLite.
+    Každý záznam má vlastní TTL, obě úrovně mají limit velikosti v bajtech.
+    Klíčem může být libovolná JSON serializovatelná hodnota (např. tuple (slug, food_type)).
+    """
+
+    def __init__(self, namespace, ttl, max_bytes, max_disk_bytes=None, db_path=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.db_path = db_path or CACHE_DB_PATH
+
+        self._memory = OrderedDict()  # klíč -> (expires_at, hodnota jako JSON text, velikost v bajtech)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self._writes_since_size_check = 0
+        self._touched = {}  # klíč -> čas posledního zásahu na disku, který ještě není zapsaný
+        self._touched_since = None
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # --- SQLite ---
+
+    def _connection(self):
+        """Vrátí SQLite spojení pro aktuální proces (po forku gunicornu se otevře nové)."""
+        if self._db is not None and self._db_pid == os.getpid():
+            return self._db
+        try:
+            db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed_at)')
+            db.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (namespace, expires_at)')
+            db.commit()
+        except sqlite3.Error as e:
+            print(f"Upozornění: Nepodařilo se otevřít cache databázi {self.db_path}: {e}. Používám pouze paměť.")
+            db = None
+        self._db = db
+        self._db_pid = os.getpid()
+        return db
+
+    def _disk_get(self, key_text, now):
+        db = self._connection()
+        if db is None:
+            return None
+        try:
+            row = db.execute('SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?',
+                             (self.namespace, key_text)).fetchone()
+            if row is None:
+                return None
+            value_text, expires_at = row
+            if expires_at <= now:
+                db.execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (self.namespace, key_text))
+                db.commit()
+                return None
+            self._disk_touch(db, key_text, now)
+            return expires_at, value_text
+        except sqlite3.Error as e:
+            print(f"Chyba při čtení z cache databáze: {e}")
+            return None
+
+    def _disk_touch(self, db, key_text, now):
+        """Zaznamená zásah záznamu; čas přístupu se zapíše až s dávkou (zásah tak nečeká na zápis do SQLite)."""
+        self._touched[key_text] = now
+        if self._touched_since is None:
+            self._touched_since = now
+        if len(self._touched) >= DISK_TOUCH_BATCH or now - self._touched_since >= DISK_TOUCH_INTERVAL:
+            self._disk_flush_touched(db)
+            db.commit()
+
+    def _disk_flush_touched(self, db):
+        """Zapíše čekající časy přístupu (volá se v transakci volajícího)."""
+        if not self._touched:
+            return
+        rows = [(accessed_at, self.namespace, key_text) for key_text, accessed_at in self._touched.items()]
+        self._touched.clear()
+        self._touched_since = None
+        db.executemany('UPDATE cache SET accessed_at = MAX(accessed_at, ?) WHERE namespace = ? AND key = ?', rows)
+
+    def _disk_set(self, key_text, value_text, expires_at, now):
+        db = self._connection()
+        if db is None:
+            return
+        try:
+            db.execute('INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?)',
+                       (self.namespace, key_text, value_text, expires_at, now, len(value_text.encode('utf-8'))))
+            self._touched.pop(key_text, None)
+            self._writes_since_size_check += 1
+            # Expirované záznamy se jinak mažou jen při čtení - úklid běží i u cache bez limitu velikosti
+            if self._writes_since_size_check >= DISK_SIZE_CHECK_INTERVAL:
+                self._writes_since_size_check = 0
+                # Vyřazuje se podle času přístupu - čekající zásahy musí být zapsané
+                self._disk_flush_touched(db)
+                self._disk_evict(db, now)
+            db.commit()
+        except sqlite3.Error as e:
+            print(f"Chyba při zápisu do cache databáze: {e}")
+
+    def _disk_evict(self, db, now):
+        """Smaže expirované záznamy a poté nejdéle nepoužité, dokud cache na disku nepřekračuje limit (je-li nastaven)."""
+        db.execute('DELETE FROM cache WHERE namespace = ? AND expires_at <= ?', (self.namespace, now))
+        if not self.max_disk_bytes:
+            return
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?', (self.namespace,)).fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        freed = 0
+        rows = db.execute('SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed_at', (self.namespace,)).fetchall()
+        stale_keys = []
+        for key_text, size in rows:
+            if total - freed <= self.max_disk_bytes:
+                break
+            stale_keys.append((self.namespace, key_text))
+            freed += size
+        db.executemany('DELETE FROM cache WHERE namespace = ? AND key = ?', stale_keys)
+
+    # --- Paměť ---
+
+    def _memory_put(self, key_text, expires_at, value_text):
+        size = len(value_text.encode('utf-8'))
+        self._memory_drop(key_text)
+        if size > self.max_bytes:
+            return
+        self._memory[key_text] = (expires_at, value_text, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _memory_drop(self, key_text):
+        previous = self._memory.pop(key_text, None)
+        if previous is not None:
+            self._memory_bytes -= previous[2]
+
+    # --- Veřejné API ---
+
+    def get(self, key, default=None):
+        """Vrátí uloženou hodnotu nebo default, pokud chybí nebo vypršela."""
+        key_text = json.dumps(key, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key_text)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key_text)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return json.loads(entry[1])
+                self._memory_drop(key_text)
+
+            disk_entry = self._disk_get(key_text, now)
+            if disk_entry is not None:
+                expires_at, value_text = disk_entry
+                self._memory_put(key_text, expires_at, value_text)
+                self.hits += 1
+                self.disk_hits += 1
+                return json.loads(value_text)
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Uloží hodnotu do paměti i na disk. ttl (v sekundách) přepíše výchozí TTL cache."""
+        key_text = json.dumps(key, ensure_ascii=False)
+        value_text = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._memory_put(key_text, expires_at, value_text)
+            self._disk_set(key_text, value_text, expires_at, now)
+
+    def expires_at(self, key):
+        """Vrátí unixový čas vypršení záznamu, nebo None, pokud chybí (nezapočítává se do zásahů)."""
+        key_text = json.dumps(key, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key_text)
+            if entry is not None and entry[0] > now:
+                return entry[0]
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute('SELECT expires_at FROM cache WHERE namespace = ? AND key = ?',
+                                 (self.namespace, key_text)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Chyba při čtení z cache databáze: {e}")
+                return None
+            return row[0] if row is not None and row[0] > now else None
+
+    def delete(self, key):
+        """Odstraní záznam z obou úrovní cache."""
+        key_text = json.dumps(key, ensure_ascii=False)
+        with self._lock:
+            self._memory_drop(key_text)
+            db = self._connection()
+            if db is not None:
+                try:
+                    db.execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (self.namespace, key_text))
+                    db.commit()
+                except sqlite3.Error as e:
+                    print(f"Chyba při mazání z cache databáze: {e}")
+
+    def stats(self):
+        """Vrátí počítadla zásahů/minutí a obsazenost paměťové úrovně."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "namespace": self.namespace,
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class _TrieNode:
+    __slots__ = ('children', 'key')
+
+    def __init__(self):
+        self.children = {}
+        self.key = None  # normalizovaný dotaz, pokud v tomto uzlu končí uložený záznam
+
+
+class PrefixCache:
+    """
+    Paměťová cache odpovědí autocomplete API s vyhledáváním podle nejdelšího prefixu (trie).
+    Zpřesněný dotaz ("mlék" -> "mléko") se zodpovídá lokálně jen za předpokladu sémantiky přesného
+    podřetězce: výsledek odpovídá dotazu, pokud každé jeho slovo (bez diakritiky) je podřetězcem názvu.
+    Při ní jsou výsledky delšího dotazu podmnožinou výsledků kratšího a lokální filtr úplné odpovědi
+    (API vrátilo méně položek, než kolik jich maximálně vrací) dá totéž co API. Odpověď, ve které je
+    i jen jedna položka mimo tuto sémantiku (API hledá i přibližně - "mleko" najde "MLÉČNÉ ŘEZY"),
+    se pro zpřesňování nepoužije. Zkouší se postupně kratší uložené prefixy; pokud žádný nevyhovuje,
+    jde dotaz na API.
+    """
+
+    def __init__(self, ttl, max_entries, result_limit=0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Nejvyšší pozorovaný počet výsledků jedné odpovědi = odhad limitu API (lze zadat předem)
+        self.result_limit = result_limit
+
+        self._root = _TrieNode()
+        self._entries = OrderedDict()  # normalizovaný dotaz -> (expires_at, výsledky, zda lze lokálně filtrovat)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query):
+        """Normalizuje dotaz: malá písmena, oříznuté a sloučené mezery."""
+        return ' '.join(str(query).lower().split())
+
+    @staticmethod
+    def fold(text):
+        """Malá písmena bez diakritiky ("Mléko kozí" -> "mleko kozi") - API diakritiku nerozlišuje."""
+        decomposed = unicodedata.normalize('NFKD', str(text).lower())
+        return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+    @classmethod
+    def matches(cls, query, item):
+        """Sémantika přesného podřetězce: každé slovo dotazu se musí objevit v názvu (bez diakritiky)."""
+        title = cls.fold(item.get('title', ''))
+        return all(word in title for word in cls.fold(query).split())
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        node = self._root
+        path = []
+        for char in key:
+            path.append((node, char))
+            node = node.children.get(char)
+            if node is None:
+                return
+        node.key = None
+        # Uklidíme prázdné větve trie
+        for parent, char in reversed(path):
+            child = parent.children[char]
+            if child.key is not None or child.children:
+                break
+            del parent.children[char]
+
+    def get(self, query):
+        """Vrátí seznam výsledků pro dotaz, nebo None, pokud je nutné zeptat se API."""
+        key = self.normalize(query)
+        now = time.time()
+        with self._lock:
+            node = self._root
+            prefixes = []
+            for char in key:
+                node = node.children.get(char)
+                if node is None:
+                    break
+                if node.key is not None:
+                    prefixes.append(node.key)
+
+            # Od nejdelšího prefixu ke kratším; prošlé záznamy cestou uklidíme
+            for prefix in reversed(prefixes):
+                expires_at, results, filterable = self._entries[prefix]
+                if expires_at <= now:
+                    self._remove(prefix)
+                elif prefix == key:
+                    self._entries.move_to_end(prefix)
+                    self.hits += 1
+                    return list(results)
+                elif filterable and self.result_limit and len(results) < self.result_limit:
+                    self._entries.move_to_end(prefix)
+                    self.prefix_hits += 1
+                    return [item for item in results if self.matches(key, item)]
+
+            self.misses += 1
+            return None
+
+    def set(self, query, results):
+        """Uloží odpověď API pro dotaz."""
+        key = self.normalize(query)
+        with self._lock:
+            self.result_limit = max(self.result_limit, len(results))
+            self._remove(key)
+            node = self._root
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+            node.key = key
+            filterable = all(isinstance(item, dict) and self.matches(key, item) for item in results)
+            self._entries[key] = (time.time() + self.ttl, list(results), filterable)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def expires_at(self, query):
+        """Vrátí čas vypršení odpovědi přesně pro tento dotaz, nebo None (nezapočítává se do zásahů)."""
+        with self._lock:
+            entry = self._entries.get(self.normalize(query))
+            return entry[0] if entry is not None and entry[0] > time.time() else None
+
+    def stats(self):
+        """Vrátí počítadla přesných zásahů, zásahů přes prefix a minutí."""
+        with self._lock:
+            lookups = self.hits + self.prefix_hits + self.misses
+            return {
+                "hits": self.hits,
+                "prefix_hits": self.prefix_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.prefix_hits) / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "result_limit": self.result_limit,
+            }
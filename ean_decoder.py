@@ -0,0 +1,188 @@
+# ean_decoder.py - Dekódování čárových kódů EAN-13 / EAN-8 ze snímku kamery na serveru
+# Snímek se převede na stupně šedi a prochází se po vodorovných (a pro otočený kód svislých) řádcích.
+# Binarizace, převod na délky pruhů a porovnání číslic se vzory probíhá vektorově v numpy
+# pro všechny možné začátky kódu v řádku najednou. Kontrolní číslice se ověřuje stejně jako validateEANChecksum().
+import io
+
+from barcode_index import ean_checksum_valid
+
+try:
+    import numpy
+    from numpy.lib.stride_tricks import sliding_window_view
+    from PIL import Image, UnidentifiedImageError
+except ImportError:
+    numpy = None
+
+# Šířky čtyř pruhů číslic v modulech (sada L; sada R má stejné šířky, sada G obrácené)
+DIGIT_WIDTHS = [
+    (3, 2, 1, 1), (2, 2, 2, 1), (2, 1, 2, 2), (1, 4, 1, 1), (1, 1, 3, 2),
+    (1, 2, 3, 1), (1, 1, 1, 4), (1, 3, 1, 2), (1, 2, 1, 3), (3, 1, 1, 2),
+]
+# Parita levých číslic EAN-13 (L = lichá, G = sudá) určuje první číslici kódu
+FIRST_DIGIT_BY_PARITY = {
+    'LLLLLL': '0', 'LLGLGG': '1', 'LLGGLG': '2', 'LLGGGL': '3', 'LGLLGG': '4',
+    'LGGLLG': '5', 'LGGGLL': '6', 'LGLGLG': '7', 'LGLGGL': '8', 'LGGLGL': '9',
+}
+
+# Rozložení kódu v pruzích: (počet pruhů celkem, počet modulů, číslic na polovinu)
+EAN13_LAYOUT = (59, 95, 6)
+EAN8_LAYOUT = (43, 67, 4)
+
+# Největší šířka snímku, se kterou se pracuje (větší se zmenší)
+MAX_FRAME_WIDTH = 1280
+# Nejvyšší počet pixelů snímku po zmenšení při načtení (draft() zmenšuje jen JPEG); větší se odmítnou
+MAX_FRAME_PIXELS = 24_000_000
+# Počet procházených řádků v každé orientaci
+SCANLINES = 24
+# Největší povolená průměrná odchylka šířky pruhu číslice od vzoru (v modulech)
+MAX_DIGIT_ERROR = 0.45
+# Povolená odchylka šířky pruhů ohraničení (start, střed, konec) od jednoho modulu
+GUARD_TOLERANCE = 0.6
+# Nejmenší rozdíl jasu (absolutně a vůči nejkontrastnějšímu místu řádku), při kterém se hledají pruhy
+MIN_CONTRAST = 40
+MIN_RELATIVE_CONTRAST = 0.3
+
+
+def decoder_available():
+    """Zda jsou nainstalované knihovny potřebné pro dekódování (numpy a Pillow)."""
+    return numpy is not None
+
+
+def _patterns():
+    widths = numpy.array(DIGIT_WIDTHS, dtype=float)
+    # Levá polovina EAN-13: 0-9 = sada L, 10-19 = sada G
+    return widths, numpy.concatenate([widths, widths[:, ::-1]])
+
+
+def load_frame(data):
+    """Načte JPEG/PNG snímek jako 2D pole jasu (float32). Při neplatném obrázku vyhodí ValueError."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft('L', (MAX_FRAME_WIDTH, MAX_FRAME_WIDTH))  # JPEG se rovnou dekóduje zmenšený
+        # Hlavička určuje rozměry ještě před dekódováním - obří PNG/GIF se odmítne bez alokace pixelů
+        if image.width * image.height > MAX_FRAME_PIXELS:
+            raise ValueError(f"Příliš velký obrázek: {image.width}x{image.height} px")
+        image = image.convert('L')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"Neplatný obrázek: {e}")
+    if image.width > MAX_FRAME_WIDTH:
+        image = image.resize((MAX_FRAME_WIDTH, max(1, image.height * MAX_FRAME_WIDTH // image.width)))
+    return numpy.asarray(image, dtype=numpy.float32)
+
+
+def binarize(rows):
+    """
+    Převede řádky jasu (2D pole) na True = tmavý pruh. Práh je střed mezi lokálním minimem a maximem
+    (posuvné okno), takže nevadí nerovnoměrné osvětlení; v oblastech s malým kontrastem (šum na pozadí)
+    se žádné pruhy nehledají.
+    """
+    # Řádek se lineárně zdvojnásobí - hrany pruhů pak mají poloviční krok, což pomáhá u úzkých modulů
+    upsampled = numpy.empty((rows.shape[0], rows.shape[1] * 2 - 1), dtype=numpy.float32)
+    upsampled[:, 0::2] = rows
+    upsampled[:, 1::2] = (rows[:, :-1] + rows[:, 1:]) / 2
+    # Lehké vyhlazení šumu před prahováním
+    smoothed = upsampled.copy()
+    smoothed[:, 1:-1] = (upsampled[:, :-2] + 2 * upsampled[:, 1:-1] + upsampled[:, 2:]) / 4
+    width = smoothed.shape[1]
+    window = max(31, width // 16) | 1
+    padded = numpy.pad(smoothed, ((0, 0), (window // 2, window // 2)), mode='edge')
+    neighbourhood = sliding_window_view(padded, window, axis=1)
+    local_min = neighbourhood.min(axis=2)
+    local_max = neighbourhood.max(axis=2)
+    local_contrast = local_max - local_min
+    row_contrast = local_contrast.max(axis=1, keepdims=True)
+    min_contrast = numpy.maximum(MIN_CONTRAST, row_contrast * MIN_RELATIVE_CONTRAST)
+    return (smoothed < (local_min + local_max) / 2) & (local_contrast >= min_contrast)
+
+
+def run_lengths(bits):
+    """Vrátí (délky úseků, zda je úsek tmavý) pro jeden binarizovaný řádek."""
+    boundaries = numpy.flatnonzero(bits[1:] != bits[:-1]) + 1
+    starts = numpy.concatenate(([0], boundaries))
+    lengths = numpy.diff(numpy.concatenate((starts, [bits.size])))
+    return lengths, bits[starts]
+
+
+def _guards_ok(modules, columns):
+    return (numpy.abs(modules[:, columns] - 1) <= GUARD_TOLERANCE).all(axis=1)
+
+
+def _match_digits(groups, patterns):
+    """Pro skupiny 4 pruhů (n, číslic, 4) vrátí (index nejlepšího vzoru, průměrnou odchylku)."""
+    normalized = groups / groups.sum(axis=2, keepdims=True) * 7
+    errors = numpy.abs(normalized[:, :, None, :] - patterns[None, None, :, :]).sum(axis=3)
+    best = errors.argmin(axis=2)
+    return best, numpy.take_along_axis(errors, best[:, :, None], axis=2)[:, :, 0] / 4
+
+
+def decode_runs(lengths, dark, layout):
+    """Najde v pruzích jednoho řádku všechny kódy daného rozložení (EAN-13 nebo EAN-8)."""
+    run_count, module_count, half_digits = layout
+    if lengths.size < run_count + 1:
+        return []
+    windows = sliding_window_view(lengths.astype(float), run_count)
+    # Kód začíná tmavým pruhem, před ním je světlý klidový okraj
+    candidates = numpy.flatnonzero(dark[1:windows.shape[0]]) + 1
+    if candidates.size == 0:
+        return []
+    windows = windows[candidates]
+    module = windows.sum(axis=1) / module_count
+    modules = windows / module[:, None]
+
+    middle = 3 + 4 * half_digits
+    guard_columns = [0, 1, 2] + list(range(middle, middle + 5)) + [run_count - 3, run_count - 2, run_count - 1]
+    quiet_zone = lengths[candidates - 1] >= 3 * module
+    valid = _guards_ok(modules, guard_columns) & quiet_zone
+    if not valid.any():
+        return []
+    windows = windows[valid]
+
+    right_widths, left_widths = _patterns()
+    if half_digits == 4:
+        left_widths = right_widths
+    left = windows[:, 3:middle].reshape(-1, half_digits, 4)
+    right = windows[:, middle + 5:run_count - 3].reshape(-1, half_digits, 4)
+    left_best, left_error = _match_digits(left, left_widths)
+    right_best, right_error = _match_digits(right, right_widths)
+    good = (left_error.max(axis=1) <= MAX_DIGIT_ERROR) & (right_error.max(axis=1) <= MAX_DIGIT_ERROR)
+
+    codes = []
+    for left_digits, right_digits in zip(left_best[good], right_best[good]):
+        if half_digits == 6:
+            parity = ''.join('G' if digit >= 10 else 'L' for digit in left_digits)
+            first_digit = FIRST_DIGIT_BY_PARITY.get(parity)
+            if first_digit is None:
+                continue
+            code = first_digit + ''.join(str(digit % 10) for digit in left_digits)
+        else:
+            code = ''.join(str(digit) for digit in left_digits)
+        code += ''.join(str(digit) for digit in right_digits)
+        if ean_checksum_valid(code):
+            codes.append(code)
+    return codes
+
+
+def decode_frame(pixels):
+    """
+    Vrátí seznam kódů nalezených ve snímku (2D pole jasu), seřazený podle počtu řádků, na kterých byl přečten.
+    Prochází vodorovné i svislé řádky v obou směrech (kód vzhůru nohama).
+    """
+    votes = {}
+    for oriented in (pixels, pixels.T):
+        height = oriented.shape[0]
+        row_indexes = numpy.linspace(height * 0.1, height * 0.9, num=min(SCANLINES, height)).astype(int)
+        bits = binarize(oriented[row_indexes])
+        for row_bits in bits:
+            for direction in (row_bits, row_bits[::-1]):
+                lengths, dark = run_lengths(direction)
+                for layout in (EAN13_LAYOUT, EAN8_LAYOUT):
+                    for code in decode_runs(lengths, dark, layout):
+                        votes[code] = votes.get(code, 0) + 1
+        if votes:
+            break
+    return sorted(votes, key=votes.get, reverse=True)
+
+
+def decode_image(data):
+    """Dekóduje EAN kódy z JPEG/PNG dat. Vyhodí ValueError, pokud data nejsou obrázek."""
+    return decode_frame(load_frame(data))
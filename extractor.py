@@ -0,0 +1,204 @@
+# extractor.py - Rychlá extrakce nutričních hodnot z detailní stránky pomocí lxml
+# Vrací přesně stejný slovník jako scraper.parse_nutrients_from_soup(), ale místo stavby
+# BeautifulSoup stromu a opakovaných find/find_all prochází jen energii a řádky bloku 'block-background'.
+# Bez nainstalovaného lxml se použije referenční parser z scraper.py.
+import time
+
+from bs4 import BeautifulSoup
+
+import metrics
+from scraper import DETAILS_TEMPLATE, extract_value_and_unit_from_text, parse_nutrients_from_soup, assign_nutrients
+
+try:
+    import lxml.html
+    from lxml.etree import ParserError
+except ImportError:
+    lxml = None
+
+# Elementy, jejichž text BeautifulSoup.get_text() nevrací (Script, Stylesheet, TemplateString, ruby)
+SKIPPED_TEXT_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+# XPath výrazy odpovídající hledání v parse_nutrients_from_soup()
+RECIPE_KCAL_XPATH = '//span[@ng-if="data.energy==null"]'
+RECIPE_KJ_XPATH = '//span[@ng-if="data.energyAlt==null"]'
+KCAL_INPUT_XPATH = '//input[@id="calculatedEnergyValueInit"]'
+ENERGY_SUM_XPATH = '//div[contains(@class, "text-sum")]'
+SUBTITLE_XPATH = '//div[contains(concat(" ", normalize-space(@class), " "), " text-subtitle ")]'
+NUTRIENT_BLOCK_XPATH = '//div[@flex="50"][contains(concat(" ", normalize-space(@class), " "), " block-background ")]'
+ICON_XPATH = './/md-icon[contains(concat(" ", normalize-space(@class), " "), " material-icons ")]'
+FLEX_AUTO_XPATH = './/div[contains(concat(" ", normalize-space(@class), " "), " flex-auto ")]'
+
+NUTRIENT_ROW_CLASSES = ['text-subtitle', 'text-nutrient', 'text-desc']
+
+
+def _iter_strings(element):
+    """Prochází textové řetězce elementu ve stejném rozsahu jako BeautifulSoup.get_text()."""
+    if element.tag in SKIPPED_TEXT_TAGS:
+        return
+    if element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str): # komentáře a instrukce nemají textový tag
+            yield from _iter_strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def get_text(element, strip=False):
+    """Obdoba Tag.get_text() / Tag.get_text(strip=True)."""
+    if strip:
+        return ''.join(text.strip() for text in _iter_strings(element))
+    return ''.join(_iter_strings(element))
+
+
+def _classes(element):
+    return (element.get('class') or '').split()
+
+
+def _first(elements):
+    return elements[0] if elements else None
+
+
+def _parse_energy(root, scraped_data, is_recipe_page):
+    """Doplní total_kcal a total_kj stejně jako energetická část parse_nutrients_from_soup()."""
+    if is_recipe_page:
+        for xpath, key, unit in ((RECIPE_KCAL_XPATH, "total_kcal", "kcal"), (RECIPE_KJ_XPATH, "total_kj", "kJ")):
+            scraped_data[key] = "N/A"
+            span = _first(root.xpath(xpath))
+            if span is None:
+                continue
+            parent_div = next(span.iterancestors('div'), None)
+            if parent_div is None:
+                continue
+            parsed = extract_value_and_unit_from_text(get_text(parent_div, strip=True))
+            if parsed["value"] != "N/A":
+                scraped_data[key] = f"{parsed['value'].replace('.', ',')} {unit}"
+        return
+
+    kcal_input = _first(root.xpath(KCAL_INPUT_XPATH))
+    if kcal_input is not None and kcal_input.get('value'):
+        scraped_data["total_kcal"] = f"{kcal_input.get('value')} kcal"
+    else:
+        energy_sum_div = _first(root.xpath(ENERGY_SUM_XPATH))
+        if energy_sum_div is not None:
+            scraped_data["total_kcal"] = get_text(energy_sum_div, strip=True)
+
+    kj_div = None
+    for div in root.xpath(SUBTITLE_XPATH):
+        div_text = get_text(div)
+        if 'kJ' in div_text or 'Energetická hodnota' in div_text:
+            kj_div = div
+            break
+
+    scraped_data["total_kj"] = "N/A"
+    if kj_div is not None:
+        parsed_kj = extract_value_and_unit_from_text(get_text(kj_div, strip=True))
+        if parsed_kj["value"] != "N/A":
+            scraped_data["total_kj"] = f"{parsed_kj['value'].replace('.', ',')} kJ"
+
+
+def extract_nutrients(html, is_recipe_page=False):
+    """
+    Vrátí nutriční hodnoty z HTML detailní stránky - stejný výsledek jako
+    parse_nutrients_from_soup(BeautifulSoup(html, 'html.parser'), is_recipe_page).
+    """
+    if lxml is None:
+        return _extract_with_soup(html, is_recipe_page)
+
+    scraped_data = {key: "N/A" for key in DETAILS_TEMPLATE.keys() if key not in ["source_url", "total_kcal", "total_kj"]}
+
+    parse_started = time.perf_counter()
+    try:
+        root = lxml.html.document_fromstring(html)
+    except ParserError:
+        # Prázdný dokument - BeautifulSoup by v něm také nic nenašel
+        root = lxml.html.document_fromstring('<html></html>')
+    except ValueError:
+        # Např. řetězec s XML deklarací kódování, který lxml nepřijme - použijeme referenční parser
+        return _extract_with_soup(html, is_recipe_page)
+    extract_started = time.perf_counter()
+    metrics.add_timing('parse', extract_started - parse_started)
+    try:
+        return _extract_from_tree(root, scraped_data, is_recipe_page)
+    finally:
+        metrics.add_timing('extract', time.perf_counter() - extract_started)
+
+
+def _extract_with_soup(html, is_recipe_page):
+    """Referenční cesta přes BeautifulSoup (bez lxml), se stejným měřením fází parse / extract."""
+    parse_started = time.perf_counter()
+    soup = BeautifulSoup(html, 'html.parser')
+    extract_started = time.perf_counter()
+    metrics.add_timing('parse', extract_started - parse_started)
+    try:
+        return parse_nutrients_from_soup(soup, is_recipe_page=is_recipe_page)
+    finally:
+        metrics.add_timing('extract', time.perf_counter() - extract_started)
+
+
+def _extract_from_tree(root, scraped_data, is_recipe_page):
+    """Doplní do scraped_data nutriční hodnoty z lxml stromu stránky a vrátí ho."""
+    try:
+        _parse_energy(root, scraped_data, is_recipe_page)
+    except Exception as e:
+        pass
+
+    main_nutrient_block = _first(root.xpath(NUTRIENT_BLOCK_XPATH))
+    if main_nutrient_block is None:
+        return scraped_data
+
+    temp_nutrients = {}
+    current_main_nutrient = None
+
+    for row in main_nutrient_block:
+        if row.tag != 'div':
+            continue
+        row_classes = _classes(row)
+        if not any(cls in row_class for row_class in row_classes for cls in NUTRIENT_ROW_CLASSES):
+            continue
+
+        row_text_raw = get_text(row, strip=True)
+
+        if 'text-subtitle' in row_classes:
+            icon_tag = _first(row.xpath(ICON_XPATH))
+            if icon_tag is not None:
+                icon_tag.drop_tree() # Text za ikonou (tail) zůstává, stejně jako u extract()
+
+            flex_auto_div = _first(row.xpath(FLEX_AUTO_XPATH))
+            nutrient_name = get_text(flex_auto_div, strip=True) if flex_auto_div is not None else row_text_raw.strip()
+
+            if any(k in nutrient_name for k in ['Bílkoviny', 'Sacharidy', 'Tuky', 'Vláknina', 'Sůl', 'Vápník', 'Sodík', 'Voda', 'PHE']):
+                current_main_nutrient = nutrient_name
+                # Stejně jako find_all('div')[-1] vyhodí IndexError, pokud řádek neobsahuje žádný div
+                value_div_candidate = row.xpath('.//div')[-1]
+                temp_nutrients[current_main_nutrient] = {"value": get_text(value_div_candidate, strip=True), "rdi": "N/A"}
+
+        elif 'text-nutrient' in row_classes:
+            direct_div_children = [child for child in row if child.tag == 'div']
+
+            sub_nutrient_name = "N/A"
+            value_text = "N/A"
+
+            if len(direct_div_children) >= 2:
+                sub_nutrient_name = get_text(direct_div_children[0], strip=True)
+                value_text = get_text(direct_div_children[-1], strip=True)
+
+            if sub_nutrient_name and sub_nutrient_name != "N/A":
+                temp_nutrients[sub_nutrient_name] = {"value": value_text, "rdi": "N/A"}
+
+        elif 'text-desc' in row_classes:
+            if 'Doporučený denní příjem' in row_text_raw:
+                if current_main_nutrient and current_main_nutrient in temp_nutrients:
+                    rdi_value_text = row_text_raw.replace('Doporučený denní příjem:', '').strip()
+                    if rdi_value_text:
+                        temp_nutrients[current_main_nutrient]["rdi"] = rdi_value_text
+
+    assign_nutrients(scraped_data, temp_nutrients)
+    return scraped_data
+
+
+def parse_details_page(html, url, is_recipe_page=False):
+    """Parsuje HTML detailní stránky a vrátí nutriční hodnoty včetně source_url."""
+    scraped_data = extract_nutrients(html, is_recipe_page=is_recipe_page)
+    scraped_data["source_url"] = url
+    return scraped_data
@@ -0,0 +1,335 @@
+# import_barcodes.py - Offline import čárových kódů z exportů produktů (CSV/TSV/JSONL, i .gz) do indexu
+# Spuštění: python import_barcodes.py export.csv.gz [další soubory] [--index barcodes.idx] [--full]
+#
+# Export se čte proudově a řadí se po dávkách (--chunk-rows) do dočasných souborů, které se pak slévají
+# (externí řazení), takže paměť nezávisí na velikosti exportu. Kódy se normalizují na EAN-8/EAN-13
+# a ověří se jejich kontrolní číslice; u duplicit vyhrává poslední výskyt.
+# Řádek s ověřeným slugem z kaloricketabulky.cz (sloupec slug) a food_type ('potravina' nebo 'recept') se uloží
+# přímo. Řádek jen s názvem produktu (např. export Open Food Facts) se uloží bez slugu a aplikace ho při prvním
+# vyhledání dohledá přes autocomplete API (app.resolve_barcode_entry()) - slug se z názvu ani URL neodhaduje,
+# protože by vedl na neexistující stránku. Řádky bez slugu i názvu se přeskočí.
+# Bez --full se export slévá se stávajícím indexem: změněné a nové kódy se přepíší/přidají, ostatní zůstanou.
+# Pokud se nic nezměnilo, soubor indexu se nepřepisuje (workery ho nemusí znovu mapovat).
+import os
+import sys
+import csv
+import gzip
+import json
+import heapq
+import re
+import time
+import argparse
+import tempfile
+
+from barcode_index import (BarcodeIndex, BarcodeIndexWriter, BARCODE_INDEX_PATH, FIELD_SEPARATOR,
+                           normalize_ean, ean_key)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Sloupce, ve kterých se hledá kód, název, slug a typ (první neprázdný vyhrává)
+CODE_FIELDS = ('code', 'ean', 'barcode', 'gtin')
+NAME_FIELDS = ('product_name_cs', 'product_name', 'name', 'title')
+SLUG_FIELDS = ('slug',)
+TYPE_FIELDS = ('food_type',)
+# Typy stránek kaloricketabulky.cz, na které může kód vést
+FOOD_TYPES = ('potravina', 'recept')
+
+# Počet řádků řazených v paměti najednou
+DEFAULT_CHUNK_ROWS = 200000
+
+# Šířka klíče a pořadového čísla v dočasných souborech - řetězcové řazení pak odpovídá číselnému
+KEY_WIDTH = 14
+SEQUENCE_WIDTH = 12
+
+# Import menší než 1/LOOKUP_COMPARE_RATIO indexu se porovnává vyhledáváním místo procházení celého indexu
+LOOKUP_COMPARE_RATIO = 50
+
+
+def open_dump(path):
+    """Otevře export jako text (soubory .gz se dekomprimují proudově)."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace', newline='')
+    return open(path, 'r', encoding='utf-8', errors='replace', newline='')
+
+
+def dump_format(path):
+    """Určí formát exportu podle přípony: 'jsonl', 'tsv' nebo 'csv'."""
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if name.endswith('.tsv'):
+        return 'tsv'
+    return 'csv'
+
+
+def iter_rows(path):
+    """Proudově prochází řádky exportu jako slovníky."""
+    file_format = dump_format(path)
+    with open_dump(path) as f:
+        if file_format == 'jsonl':
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(row, dict):
+                    yield row
+        else:
+            csv.field_size_limit(2 ** 31 - 1)
+            # Exporty Open Food Facts jsou oddělené tabulátorem i s příponou .csv
+            header = f.readline()
+            delimiter = '\t' if file_format == 'tsv' or header.count('\t') > header.count(',') else ','
+            fieldnames = next(csv.reader([header], delimiter=delimiter))
+            yield from csv.DictReader(f, fieldnames=fieldnames, delimiter=delimiter)
+
+
+# Slug kaloricketabulky.cz ("mleko-polotucne-1-5"), ne URL ani název produktu
+SLUG_PATTERN = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+
+
+def first_value(row, fields):
+    for field in fields:
+        value = row.get(field)
+        if value:
+            return str(value).strip()
+    return None
+
+
+def row_target(row):
+    """Vrátí (slug, food_type) řádku, nebo None, pokud chybí nebo nemají platný tvar."""
+    slug = first_value(row, SLUG_FIELDS)
+    food_type = first_value(row, TYPE_FIELDS)
+    if not slug or not SLUG_PATTERN.fullmatch(slug) or food_type not in FOOD_TYPES:
+        return None
+    return slug, food_type
+
+
+def row_entry(row):
+    """
+    Vrátí (klíč, slug, food_type, název) pro řádek exportu. None znamená chybějící nebo neplatný kód,
+    False řádek bez ověřeného slugu a typu (viz row_target()) i bez názvu. Řádek jen s názvem
+    má prázdný slug a food_type - dohledá se až při vyhledání kódu.
+    """
+    code = normalize_ean(first_value(row, CODE_FIELDS))
+    if code is None:
+        return None
+    name = first_value(row, NAME_FIELDS)
+    if name:
+        # Název nesmí obsahovat konce řádků ani oddělovač polí dočasných souborů
+        name = ' '.join(name.replace(FIELD_SEPARATOR, ' ').split())
+    slug, food_type = row_target(row) or ('', None)
+    if not slug and not name:
+        return False
+    return ean_key(code), slug, food_type, name
+
+
+def entry_line(key, sequence, slug, food_type, name):
+    fields = (slug, food_type or '', name or '')
+    return f"{key:0{KEY_WIDTH}d}{FIELD_SEPARATOR}{sequence:0{SEQUENCE_WIDTH}d}{FIELD_SEPARATOR}{FIELD_SEPARATOR.join(fields)}\n"
+
+
+def parse_line(line):
+    key, sequence, slug, food_type, name = line.rstrip('\n').split(FIELD_SEPARATOR)
+    return int(key), int(sequence), slug, food_type or None, name or None
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.invalid = 0
+        self.unresolved = 0
+        self.name_only = 0
+        self.bytes = 0
+        self.started_at = time.perf_counter()
+
+
+def spill_sorted_chunks(paths, chunk_rows, temp_dir, stats):
+    """Načte exporty a zapíše seřazené dávky do dočasných souborů. Vrací seznam jejich cest."""
+    chunk_paths = []
+    chunk = []
+    sequence = 0
+
+    def spill():
+        chunk.sort()
+        fd, chunk_path = tempfile.mkstemp(dir=temp_dir, prefix='chunk-', suffix='.txt')
+        with os.fdopen(fd, 'w', encoding='utf-8') as out:
+            out.writelines(chunk)
+        chunk_paths.append(chunk_path)
+        chunk.clear()
+
+    for path in paths:
+        stats.bytes += os.path.getsize(path)
+        for row in iter_rows(path):
+            stats.rows += 1
+            entry = row_entry(row)
+            if entry is None:
+                stats.invalid += 1
+                continue
+            if entry is False:
+                stats.unresolved += 1
+                continue
+            sequence += 1
+            key, slug, food_type, name = entry
+            if not slug:
+                stats.name_only += 1
+            chunk.append(entry_line(key, sequence, slug, food_type, name))
+            if len(chunk) >= chunk_rows:
+                spill()
+    if chunk:
+        spill()
+    return chunk_paths
+
+
+def iter_chunk_file(chunk_path):
+    with open(chunk_path, 'r', encoding='utf-8') as f:
+        yield from f
+
+
+def iter_deduplicated(chunk_paths):
+    """Slévá seřazené dávky a vrací (klíč, slug, food_type, název) - u duplicitního kódu poslední výskyt."""
+    previous = None
+    for line in heapq.merge(*(iter_chunk_file(chunk_path) for chunk_path in chunk_paths)):
+        key, _, slug, food_type, name = parse_line(line)
+        if previous is not None and previous[0] != key:
+            yield previous
+        previous = (key, slug, food_type, name)
+    if previous is not None:
+        yield previous
+
+
+def iter_merged(existing, imported, counts):
+    """
+    Slévá stávající index s importovanými záznamy (oba seřazené podle klíče).
+    Importovaný záznam přepíše stávající; do counts se počítají přidané, změněné a nezměněné kódy.
+    """
+    existing = iter(existing)
+    imported = iter(imported)
+    old = next(existing, None)
+    new = next(imported, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            counts['kept'] += 1
+            yield old
+            old = next(existing, None)
+        elif old is None or new[0] < old[0]:
+            counts['added'] += 1
+            yield new
+            new = next(imported, None)
+        else:
+            counts['changed' if old != new else 'unchanged'] += 1
+            yield new
+            old = next(existing, None)
+            new = next(imported, None)
+
+
+def count_changes(existing_index, imported, imported_count, counts):
+    """
+    Porovná importované záznamy se stávajícím indexem a vrátí True, pokud je co zapsat.
+    Malý doplňkový import se porovná vyhledáním každého kódu (O(m log n)), takže nemusí
+    procházet celý index; velký import se slévá sekvenčně.
+    """
+    if imported_count * LOOKUP_COMPARE_RATIO > existing_index.count:
+        for _ in iter_merged(existing_index.iter_entries(), imported, counts):
+            pass
+        return bool(counts['added'] or counts['changed'])
+
+    for key, slug, food_type, name in imported:
+        entry = existing_index.lookup(code_text(key))
+        if entry is None:
+            counts['added'] += 1
+        elif (entry['slug'], entry['food_type'], entry['name']) != (slug, food_type, name):
+            counts['changed'] += 1
+        else:
+            counts['unchanged'] += 1
+    counts['kept'] = existing_index.count - counts['changed'] - counts['unchanged']
+    return bool(counts['added'] or counts['changed'])
+
+
+def code_text(key):
+    """Vrátí kód z klíče indexu (EAN-8, pokud se do něj vejde, jinak EAN-13)."""
+    return str(key).zfill(8) if key < 10 ** 8 else str(key).zfill(13)
+
+
+def write_entries(index_path, entries, expected_count):
+    """Zapíše záznamy do nového indexu; vrací jejich počet."""
+    with BarcodeIndexWriter(index_path, expected_count) as writer:
+        for key, slug, food_type, name in entries:
+            writer.add(code_text(key), slug, food_type, name)
+    return writer.count
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux vrací kB, macOS bajty
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_import(paths, index_path, full=False, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Provede import a vrátí slovník se statistikami."""
+    stats = ImportStats()
+    counts = {'added': 0, 'changed': 0, 'unchanged': 0, 'kept': 0}
+    index_dir = os.path.dirname(os.path.abspath(index_path))
+    with tempfile.TemporaryDirectory(dir=index_dir, prefix='.barcode-import-') as temp_dir:
+        chunk_paths = spill_sorted_chunks(paths, chunk_rows, temp_dir, stats)
+        existing_index = None if full else BarcodeIndex(index_path)
+        existing_count = existing_index.stats()['entries'] if existing_index is not None else 0
+        if not existing_count:
+            existing_index = None
+
+        # Nejprve jen spočítáme změny, abychom zbytečně nepřepisovali nezměněný index
+        written = existing_count
+        needs_write = existing_index is None or count_changes(existing_index, iter_deduplicated(chunk_paths),
+                                                                 stats.rows - stats.invalid - stats.unresolved, counts)
+
+        if needs_write:
+            counts = dict.fromkeys(counts, 0)
+            existing_entries = existing_index.iter_entries() if existing_index is not None else ()
+            entries = iter_merged(existing_entries, iter_deduplicated(chunk_paths), counts)
+            written = write_entries(index_path, entries, existing_count + stats.rows - stats.invalid - stats.unresolved)
+
+    elapsed = time.perf_counter() - stats.started_at
+    return {
+        "rows": stats.rows,
+        "invalid_rows": stats.invalid,
+        "unresolved_rows": stats.unresolved,
+        "name_only_rows": stats.name_only,
+        "entries": written,
+        "written": needs_write,
+        **counts,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(stats.rows / elapsed) if elapsed else None,
+        "mb_per_second": round(stats.bytes / 1024 / 1024 / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import čárových kódů z exportů produktů do indexu barcode_index.")
+    parser.add_argument('dumps', nargs='+', help="soubory CSV/TSV/JSONL (volitelně .gz)")
+    parser.add_argument('--index', default=BARCODE_INDEX_PATH, help="cílový soubor indexu")
+    parser.add_argument('--full', action='store_true', help="sestavit index znovu jen z exportu (bez slévání se stávajícím)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="počet řádků řazených v paměti najednou")
+    args = parser.parse_args()
+
+    result = run_import(args.dumps, args.index, full=args.full, chunk_rows=args.chunk_rows)
+    print(f"Řádků: {result['rows']} (neplatných {result['invalid_rows']}, bez slugu i názvu {result['unresolved_rows']}, "
+          f"jen s názvem {result['name_only_rows']}), kódů v indexu: {result['entries']}")
+    if result['unresolved_rows']:
+        print(f"Upozornění: {result['unresolved_rows']} řádků nemá slug a food_type ({', '.join(FOOD_TYPES)}) ani název "
+              f"produktu a byly přeskočeny.")
+    print(f"Přidáno {result['added']}, změněno {result['changed']}, beze změny {result['unchanged']}, ponecháno {result['kept']}"
+          + ("" if result['written'] else " - index je aktuální, nepřepisuje se"))
+    print(f"Čas: {result['seconds']} s, {result['rows_per_second']} řádků/s, {result['mb_per_second']} MB/s, "
+          f"špičková RSS: {result['peak_rss_mb']} MB")
+
+
+if __name__ == '__main__':
+    main()
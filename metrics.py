@@ -0,0 +1,456 @@
+# metrics.py - Metriky aplikace ve formátu Prometheus (endpoint /metrics) a časy fází jednoho požadavku
+# Každý worker sčítá hodnoty v paměti a vlákno na pozadí je jednou za METRICS_FLUSH_INTERVAL sekund
+# přičte do SQLite (stejný soubor jako cache). /metrics pak vrací součet za všechny gunicorn/hypercorn workery.
+# Histogramy se ukládají jako kumulativní počítadla (_bucket, _sum, _count), takže se dají prostě sčítat.
+# Okamžité hodnoty (gauge) zapisuje každý worker jako vlastní řádek s PID a časem zápisu; /metrics sčítá jen
+# řádky běžících workerů obnovené během METRICS_GAUGE_TTL, takže hodnoty násilně ukončeného workeru nezůstanou.
+import os
+import sqlite3
+import threading
+import time
+import atexit
+import contextvars
+from urllib.parse import urlsplit
+
+from cache import CACHE_DB_PATH
+
+# SQLite soubor se sdílenými počítadly (výchozí je soubor cache)
+METRICS_DB_PATH = os.getenv('METRICS_DB_PATH', CACHE_DB_PATH)
+# Jak často (v sekundách) worker zapisuje své přírůstky do SQLite
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+# Po kolika sekundách bez obnovy se okamžité hodnoty workeru přestanou započítávat
+METRICS_GAUGE_TTL = float(os.getenv('METRICS_GAUGE_TTL', str(10 * METRICS_FLUSH_INTERVAL)))
+
+# Horní hranice košů histogramů v sekundách
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Routy, jejichž doba zpracování se měří
+TIMED_ROUTES = ('/search', '/get_details', '/search_by_barcode')
+
+# Název metriky -> (typ, popis)
+METRICS = {
+    'kalkulacka_request_duration_seconds': ('histogram', 'Doba zpracování požadavku (u streamu až do posledního řádku).'),
+    'kalkulacka_stream_first_line_seconds': ('histogram', 'Doba od přijetí požadavku do odeslání prvního NDJSON řádku.'),
+    'kalkulacka_upstream_requests_total': ('counter', 'Požadavky na kaloricketabulky.cz podle druhu, sekce a HTTP statusu.'),
+    'kalkulacka_upstream_duration_seconds': ('histogram', 'Doba do přijetí hlaviček odpovědi kaloricketabulky.cz.'),
+    'kalkulacka_upstream_bytes_total': ('counter', 'Stažené bajty z kaloricketabulky.cz podle druhu požadavku.'),
+    'kalkulacka_upstream_sleep_seconds_total': ('counter', 'Čas strávený čekáním před opakováním požadavku.'),
+    'kalkulacka_upstream_queue_seconds': ('histogram', 'Čekání na společný rozpočet požadavků (ratelimit.py).'),
+    'kalkulacka_upstream_deferred_total': ('counter', 'Požadavky odložené kvůli vyčerpanému rozpočtu.'),
+    'kalkulacka_parse_duration_seconds': ('histogram', 'Doba parsování detailní stránky.'),
+    'kalkulacka_cache_lookups_total': ('counter', 'Vyhledávání v cache podle výsledku.'),
+    'kalkulacka_cache_hit_ratio': ('gauge', 'Podíl zásahů cache ze všech vyhledávání (od vzniku databáze metrik).'),
+    'kalkulacka_upstream_priority_wait_seconds': ('histogram', 'Čekání na volné místo pro požadavek na web podle třídy priority.'),
+    'kalkulacka_upstream_queue_depth': ('gauge', 'Požadavky na web čekající na volné místo podle třídy priority.'),
+    'kalkulacka_upstream_in_flight': ('gauge', 'Rozpracované požadavky na web podle třídy priority.'),
+    'kalkulacka_prewarm_refreshes_total': ('counter', 'Obnovy populárních záznamů cache na pozadí podle výsledku.'),
+}
+
+# Nevyexportované přírůstky tohoto workeru: (název, štítky, le) -> hodnota
+_pending = {}
+_pending_lock = threading.Lock()
+_pending_pid = None
+# Zdroje počítadel cache: název cache -> funkce vracející {výsledek: kumulativní počet}
+_cache_sources = {}
+_cache_seen = {}
+# Okamžité hodnoty workeru: (název, štítek) -> funkce vracející {hodnota štítku: hodnota}
+_gauge_sources = {}
+# Naposledy zapsané okamžité hodnoty tohoto workeru a čas zápisu
+_gauges_written = (None, 0.0)
+
+_db = None
+_db_pid = None
+_db_lock = threading.Lock()
+
+
+def _labels_text(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _ensure_worker():
+    """Po forku zahodí přírůstky zděděné od rodiče a spustí vlastní zapisovací vlákno."""
+    global _pending_pid
+    if _pending_pid == os.getpid():
+        return
+    with _pending_lock:
+        if _pending_pid == os.getpid():
+            return
+        _pending.clear()
+        _pending_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def _add(name, labels, value, le=''):
+    _pending[(name, labels, le)] = _pending.get((name, labels, le), 0) + value
+
+
+def inc(name, value=1, **labels):
+    """Přičte hodnotu k počítadlu."""
+    _ensure_worker()
+    labels_text = _labels_text(labels)
+    with _pending_lock:
+        _add(name, labels_text, value)
+
+
+def observe(name, seconds, **labels):
+    """Zaznamená hodnotu do histogramu (koše DURATION_BUCKETS)."""
+    _ensure_worker()
+    labels_text = _labels_text(labels)
+    with _pending_lock:
+        for bound in DURATION_BUCKETS:
+            if seconds <= bound:
+                _add(name + '_bucket', labels_text, 1, le=str(bound))
+        _add(name + '_bucket', labels_text, 1, le='+Inf')
+        _add(name + '_sum', labels_text, seconds)
+        _add(name + '_count', labels_text, 1)
+
+
+def upstream_section(url):
+    """Sekce webu, na kterou požadavek míří ('potraviny', 'recepty', 'autocomplete', ...)."""
+    parts = urlsplit(url).path.strip('/').split('/')
+    return parts[0] if parts and parts[0] else '/'
+
+
+def observe_upstream(kind, url, status, seconds, downloaded_bytes=0):
+    """Zaznamená jeden požadavek na upstream; status je HTTP kód nebo 'error' při chybě spojení."""
+    section = upstream_section(url)
+    inc('kalkulacka_upstream_requests_total', kind=kind, section=section, status=status)
+    observe('kalkulacka_upstream_duration_seconds', seconds, kind=kind, section=section, status=status)
+    if downloaded_bytes:
+        inc('kalkulacka_upstream_bytes_total', downloaded_bytes, kind=kind)
+
+
+def observe_request(route, status, seconds):
+    observe('kalkulacka_request_duration_seconds', seconds, route=route, status=status)
+
+
+def register_cache(name, counts):
+    """Přidá cache do metrik. counts() vrací kumulativní počty vyhledávání, např. {'hit': 10, 'miss': 2}."""
+    _cache_sources[name] = counts
+
+
+def register_gauge(name, label, values):
+    """
+    Přidá okamžitou hodnotu workeru (např. hloubku fronty). values() vrací {hodnota štítku: hodnota};
+    do SQLite se zapisuje jako řádek workeru, takže /metrics ukazuje součet za běžící workery.
+    """
+    _gauge_sources[(name, label)] = values
+
+
+def timed_stream(route, lines, started):
+    """Obalí generátor NDJSON řádků a změří dobu do prvního řádku a celkovou dobu streamu."""
+    first = True
+    try:
+        for line in lines:
+            if first:
+                observe('kalkulacka_stream_first_line_seconds', time.perf_counter() - started, route=route)
+                first = False
+            yield line
+    finally:
+        close = getattr(lines, 'close', None)
+        if close is not None:
+            close()
+        observe_request(route, 200, time.perf_counter() - started)
+
+
+async def timed_async_stream(route, lines, started):
+    """Asynchronní obdoba timed_stream()."""
+    first = True
+    try:
+        async for line in lines:
+            if first:
+                observe('kalkulacka_stream_first_line_seconds', time.perf_counter() - started, route=route)
+                first = False
+            yield line
+    finally:
+        await lines.aclose()
+        observe_request(route, 200, time.perf_counter() - started)
+
+
+# --- Časy fází jednoho požadavku (Server-Timing, _timing v NDJSON) ---
+
+# Fáze v pořadí, v jakém se vypisují v hlavičce Server-Timing
+TIMING_STAGES = ('queue', 'upstream', 'parse', 'extract')
+
+# Měření aktuálního požadavku (nebo řádku /search); None = měření je vypnuté
+_current_timing = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """
+    Součty časů fází a počítadla (opakování, stažené bajty) jednoho požadavku.
+    Do jednoho měření mohou zapisovat i vlákna, kterým se předal kontext (asyncio.to_thread).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def server_timing(self):
+        """Hodnota hlavičky Server-Timing (milisekundy), např. 'upstream;dur=120.5, parse;dur=3.1, total;dur=130.2'."""
+        with self._lock:
+            parts = [f'{stage};dur={self.durations[stage] * 1000:.1f}' for stage in TIMING_STAGES if stage in self.durations]
+        parts.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(parts)
+
+    def as_dict(self):
+        """Objekt _timing pro NDJSON řádek: milisekundy fází, počet opakování a stažené bajty."""
+        with self._lock:
+            result = {f'{stage}_ms': round(self.durations.get(stage, 0.0) * 1000, 1) for stage in TIMING_STAGES}
+            result['retries'] = self.counts.get('retries', 0)
+            result['bytes'] = self.counts.get('bytes', 0)
+        return result
+
+
+def start_timing(enabled=True):
+    """Zahájí měření fází v aktuálním kontextu (vlákně / asyncio tasku) a vrátí ho; enabled=False měření vypne."""
+    timing = RequestTiming() if enabled else None
+    _current_timing.set(timing)
+    return timing
+
+
+def add_timing(stage, seconds):
+    """Přičte čas fáze k měření aktuálního požadavku (pokud nějaké běží)."""
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+def add_timing_count(name, value=1):
+    """Přičte hodnotu k počítadlu ('retries', 'bytes') měření aktuálního požadavku."""
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.count(name, value)
+
+
+# --- Sdílené úložiště ---
+
+def _connection():
+    global _db, _db_pid
+    if _db is not None and _db_pid == os.getpid():
+        return _db
+    try:
+        db = sqlite3.connect(METRICS_DB_PATH, timeout=5, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS metrics (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                le TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (name, labels, le)
+            )
+        """)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS gauges (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                value REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (name, labels, pid)
+            )
+        """)
+        # Starší verze sčítaly okamžité hodnoty do tabulky počítadel - ty by zůstaly navždy
+        gauge_names = [name for name, (metric_type, _) in METRICS.items() if metric_type == 'gauge']
+        db.execute(f'DELETE FROM metrics WHERE name IN ({",".join("?" * len(gauge_names))})', gauge_names)
+        db.commit()
+    except sqlite3.Error as e:
+        print(f"Upozornění: Nepodařilo se otevřít databázi metrik {METRICS_DB_PATH}: {e}. Metriky jsou jen za tento worker.")
+        db = None
+    _db, _db_pid = db, os.getpid()
+    return db
+
+
+def _collect_cache_counts():
+    """Převede kumulativní počítadla cache na přírůstky od minulého zápisu."""
+    for name, counts in list(_cache_sources.items()):
+        try:
+            current = counts()
+        except Exception as e:
+            continue
+        for result, count in current.items():
+            delta = count - _cache_seen.get((name, result), 0)
+            _cache_seen[(name, result)] = count
+            if delta > 0:
+                inc('kalkulacka_cache_lookups_total', delta, cache=name, result=result)
+
+
+def _collect_gauges():
+    """Vrátí okamžité hodnoty tohoto workeru jako {(název, štítky): hodnota}."""
+    gauges = {}
+    for (name, label), values in list(_gauge_sources.items()):
+        try:
+            current = values()
+        except Exception as e:
+            continue
+        for label_value, value in current.items():
+            gauges[(name, _labels_text({label: label_value}))] = value
+    return gauges
+
+
+def _gauges_due(gauges, now):
+    """Zda se mají okamžité hodnoty zapsat - změnily se, nebo by řádky workeru brzy přestaly platit."""
+    written, written_at = _gauges_written
+    return gauges != written or now - written_at >= METRICS_GAUGE_TTL / 3
+
+
+def _write_gauges(db, gauges, now):
+    """Přepíše řádky okamžitých hodnot tohoto workeru a smaže řádky workerů, které se dlouho neozvaly."""
+    pid = os.getpid()
+    db.execute('DELETE FROM gauges WHERE pid = ? OR updated_at < ?', (pid, now - METRICS_GAUGE_TTL))
+    db.executemany('INSERT INTO gauges (name, labels, pid, value, updated_at) VALUES (?, ?, ?, ?, ?)',
+                   [(name, labels, pid, value, now) for (name, labels), value in gauges.items()])
+
+
+def flush():
+    """Zapíše přírůstky a okamžité hodnoty tohoto workeru do SQLite. Při chybě databáze zůstanou přírůstky v paměti."""
+    global _gauges_written
+    _ensure_worker()
+    _collect_cache_counts()
+    gauges = _collect_gauges()
+    now = time.time()
+    with _db_lock:
+        write_gauges = _gauges_due(gauges, now)
+        with _pending_lock:
+            if not _pending and not write_gauges:
+                return
+            rows = [(name, labels, le, value) for (name, labels, le), value in _pending.items()]
+            _pending.clear()
+        db = _connection()
+        try:
+            if db is None:
+                raise sqlite3.Error("databáze není dostupná")
+            db.executemany('INSERT INTO metrics (name, labels, le, value) VALUES (?, ?, ?, ?) '
+                           'ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value', rows)
+            if write_gauges:
+                _write_gauges(db, gauges, now)
+            db.commit()
+            if write_gauges:
+                _gauges_written = (gauges, now)
+        except sqlite3.Error as e:
+            if db is not None:
+                print(f"Chyba při zápisu metrik: {e}")
+            with _pending_lock:
+                for name, labels, le, value in rows:
+                    _add(name, labels, value, le)
+
+
+def _flush_loop():
+    pid = os.getpid()
+    while pid == os.getpid():
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _final_flush():
+    flush()
+    # Ukončený worker už nic nezpracovává - jeho okamžité hodnoty se nemají započítávat
+    with _db_lock:
+        db = _connection() if _pending_pid == os.getpid() else None
+        if db is None:
+            return
+        try:
+            db.execute('DELETE FROM gauges WHERE pid = ?', (os.getpid(),))
+            db.commit()
+        except sqlite3.Error as e:
+            print(f"Chyba při zápisu metrik: {e}")
+
+
+atexit.register(_final_flush)
+
+
+def _read_rows():
+    """Vrátí všechny řádky (název, štítky, le, hodnota) - ze SQLite, nebo jen z paměti tohoto workeru."""
+    flush()
+    with _db_lock:
+        db = _connection()
+        if db is not None:
+            try:
+                rows = db.execute('SELECT name, labels, le, value FROM metrics').fetchall()
+                gauge_rows = db.execute('SELECT name, labels, pid, value FROM gauges WHERE updated_at >= ?',
+                                        (time.time() - METRICS_GAUGE_TTL,)).fetchall()
+                return rows + _sum_live_gauges(gauge_rows)
+            except sqlite3.Error as e:
+                print(f"Chyba při čtení metrik: {e}")
+    with _pending_lock:
+        rows = [(name, labels, le, value) for (name, labels, le), value in _pending.items()]
+    return rows + [(name, labels, '', value) for (name, labels), value in _collect_gauges().items()]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # proces existuje, jen mu nesmíme posílat signály
+    return True
+
+
+def _sum_live_gauges(gauge_rows):
+    """Sečte okamžité hodnoty workerů, které ještě běží, na řádky (název, štítky, '', součet)."""
+    alive = {pid: _pid_alive(pid) for pid in {row[2] for row in gauge_rows}}
+    sums = {}
+    for name, labels, pid, value in gauge_rows:
+        if alive[pid]:
+            sums[(name, labels)] = sums.get((name, labels), 0) + value
+    return [(name, labels, '', value) for (name, labels), value in sums.items()]
+
+
+def _base_name(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def _sort_key(row):
+    name, labels, le, _ = row
+    return (_base_name(name), labels, name, float(le) if le else 0.0)
+
+
+def render():
+    """Vrátí všechny metriky (součet za všechny workery) v textovém formátu Prometheus."""
+    rows = sorted(_read_rows(), key=_sort_key)
+
+    # Podíl zásahů se počítá z agregovaných počítadel, aby byl správně napříč workery
+    lookups = {}
+    for name, labels, le, value in rows:
+        if name == 'kalkulacka_cache_lookups_total':
+            label_values = dict(part.split('=', 1) for part in labels.split(','))
+            cache_label = label_values['cache']
+            hits, total = lookups.get(cache_label, (0, 0))
+            is_hit = label_values['result'] != '"miss"'
+            lookups[cache_label] = (hits + (value if is_hit else 0), total + value)
+    rows += [('kalkulacka_cache_hit_ratio', f'cache={cache_label}', '', hits / total)
+             for cache_label, (hits, total) in sorted(lookups.items()) if total]
+
+    lines = []
+    described = set()
+    for name, labels, le, value in rows:
+        base_name = _base_name(name)
+        if base_name not in described:
+            described.add(base_name)
+            metric_type, help_text = METRICS.get(base_name, ('untyped', ''))
+            lines.append(f'# HELP {base_name} {help_text}')
+            lines.append(f'# TYPE {base_name} {metric_type}')
+        if le:
+            labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+        value_text = repr(float(value)) if value != int(value) else str(int(value))
+        lines.append(f'{name}{{{labels}}} {value_text}' if labels else f'{name} {value_text}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,172 @@
+# nutrition.py - Výpočty nad nutričními hodnotami (číselný formát detailů, agregace receptů)
+# Hodnoty z /get_details ("12,5 g") se převedou na čísla stejně jako parseValueAndUnit() ve frontendu
+# a součty se počítají jako jedna maticová operace (ingredience x nutrienty). Bez numpy se použije čistý Python.
+import re
+import math
+from functools import lru_cache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Nutrienty sčítané v receptu (stejné klíče jako aggregatedNutrients v showRecipeDetailsModal())
+AGGREGATED_NUTRIENT_KEYS = (
+    "total_kcal", "total_kj", "protein", "carbs", "sugar", "fat",
+    "saturated_fat", "trans_fat", "monounsaturated_fat", "polyunsaturated_fat",
+    "cholesterol", "fiber", "salt", "calcium", "sodium", "water", "phe"
+)
+
+# Základní jednotky nutrientů v číselném formátu (kalkulačka je uvádí na webu v mg u cholesterolu, minerálů a PHE)
+NUTRIENT_UNITS = {key: "g" for key in AGGREGATED_NUTRIENT_KEYS}
+NUTRIENT_UNITS.update({"total_kcal": "kcal", "total_kj": "kJ", "cholesterol": "mg", "calcium": "mg", "sodium": "mg", "phe": "mg"})
+
+# Doporučený denní příjem je uváděn ve stejné jednotce jako nutrient
+RDI_KEYS = {"protein_rdi": "protein", "carbs_rdi": "carbs", "fat_rdi": "fat", "fiber_rdi": "fiber"}
+DETAILS_UNITS = dict(NUTRIENT_UNITS, **{rdi_key: NUTRIENT_UNITS[key] for rdi_key, key in RDI_KEYS.items()})
+
+# Převod hmotnostních jednotek na gramy (ostatní jednotky se nepřevádějí)
+MASS_UNIT_GRAMS = {"kg": 1000, "g": 1, "mg": 0.001, "µg": 0.000001, "μg": 0.000001, "mcg": 0.000001}
+
+# Jednotky množství ingredience, které se přepočítávají na gramy / mililitry
+AMOUNT_UNIT_FACTORS = {"kg": 1000, "l": 1000}
+
+NUMBER_PATTERN = re.compile(r'(\d+\.?\d*)(.*)')
+WHITESPACE_PATTERN = re.compile(r'\s')
+
+
+def parse_value_and_unit(value):
+    """Vrátí (číslo, jednotka) z hodnoty typu "12,5 g" (obdoba parseValueAndUnit()), nebo (None, '')."""
+    if isinstance(value, bool):
+        return None, ''
+    if isinstance(value, (int, float)):
+        # JSON může obsahovat NaN/Infinity - taková hodnota se bere jako chybějící
+        return (float(value), '') if math.isfinite(value) else (None, '')
+    if not isinstance(value, str) or not value or value == "N/A":
+        return None, ''
+    return _parse_text_value(value)
+
+
+@lru_cache(maxsize=8192)
+def _parse_text_value(value):
+    # Stejné texty ("0 g", "0,1 g") se v receptech opakují, proto se výsledek pamatuje
+    cleaned = WHITESPACE_PATTERN.sub('', value).replace(',', '.', 1)
+    match = NUMBER_PATTERN.search(cleaned)
+    return (float(match.group(1)), match.group(2)) if match else (None, '')
+
+
+def parse_quantity(value, base_unit):
+    """
+    Vrátí hodnotu jako float v základní jednotce base_unit, nebo None.
+    Hmotnostní jednotky se převádějí (např. "1,2 g" -> 1200.0 pro mg), hodnota bez jednotky nebo
+    s jinou jednotkou (kcal, kJ) se vrací tak, jak je.
+    """
+    number, unit = parse_value_and_unit(value)
+    if number is None:
+        return None
+    if unit in MASS_UNIT_GRAMS and base_unit in MASS_UNIT_GRAMS and unit != base_unit:
+        return round(number * MASS_UNIT_GRAMS[unit] / MASS_UNIT_GRAMS[base_unit], 6)
+    return number
+
+
+def numeric_details(details):
+    """
+    Převede odpověď /get_details na číselný formát: hodnoty jako float v jednotkách DETAILS_UNITS,
+    None místo "N/A" a mapa jednotek pod klíčem 'units'.
+    """
+    result = {key: parse_quantity(details.get(key), unit) for key, unit in DETAILS_UNITS.items()}
+    result["source_url"] = details.get("source_url")
+    result["units"] = DETAILS_UNITS
+    return result
+
+
+def ingredient_base_amount(ingredient):
+    """
+    Vrátí množství ingredience v gramech (mililitrech); kg a l se násobí 1000.
+    Nečíselné množství je 0; pokud množství po převodu jednotky není konečné číslo ("nan", 1e999,
+    "1e308" kg), vyhodí ValueError.
+    """
+    try:
+        amount = float(ingredient.get('amount') or 0)
+    except (TypeError, ValueError):
+        amount = 0.0
+    except OverflowError:  # celé číslo mimo rozsah float
+        amount = math.inf
+    base_amount = amount * AMOUNT_UNIT_FACTORS.get(ingredient.get('unit'), 1)
+    if not math.isfinite(base_amount):
+        raise ValueError(f"Neplatné množství ingredience: {ingredient.get('amount')!r}")
+    return base_amount
+
+
+def _ingredient_rows(recipes):
+    """
+    Převede recepty na řádky matice: (index receptu, množství v g, hodnoty nutrientů na 100 g).
+    Chybějící nebo neplatné hodnoty jsou 0, ingredience bez nutritionalDetails se přeskakují.
+    """
+    recipe_indexes, amounts, values = [], [], []
+    for recipe_index, ingredients in enumerate(recipes):
+        for ingredient in ingredients:
+            if not isinstance(ingredient, dict):
+                continue
+            details = ingredient.get('nutritionalDetails')
+            if not isinstance(details, dict):
+                continue
+            recipe_indexes.append(recipe_index)
+            amounts.append(ingredient_base_amount(ingredient))
+            values.append([parse_quantity(details.get(key), NUTRIENT_UNITS[key]) or 0.0 for key in AGGREGATED_NUTRIENT_KEYS])
+    return recipe_indexes, amounts, values
+
+
+def _sum_rows(recipe_count, recipe_indexes, amounts, values):
+    """Vrátí (součty nutrientů, součty množství) pro každý recept."""
+    if numpy is not None:
+        # Přetečení se kontroluje až na výsledcích (aggregate_recipes()), numpy o něm nemusí varovat
+        with numpy.errstate(over='ignore', invalid='ignore'):
+            return _sum_rows_numpy(recipe_count, recipe_indexes, amounts, values)
+
+    totals = [[0.0] * len(AGGREGATED_NUTRIENT_KEYS) for _ in range(recipe_count)]
+    weights = [0.0] * recipe_count
+    for recipe_index, amount, row in zip(recipe_indexes, amounts, values):
+        factor = amount / 100
+        recipe_totals = totals[recipe_index]
+        for column, value in enumerate(row):
+            recipe_totals[column] += value * factor
+        weights[recipe_index] += amount
+    return totals, weights
+
+
+def _sum_rows_numpy(recipe_count, recipe_indexes, amounts, values):
+    totals = numpy.zeros((recipe_count, len(AGGREGATED_NUTRIENT_KEYS)))
+    weights = numpy.zeros(recipe_count)
+    if amounts:
+        index_array = numpy.asarray(recipe_indexes, dtype=numpy.intp)
+        amount_array = numpy.asarray(amounts, dtype=float)
+        # Hodnoty jsou na 100 g: každý řádek matice se vynásobí faktorem množství / 100 a sečte po receptech
+        weighted = numpy.asarray(values, dtype=float) * (amount_array / 100)[:, None]
+        numpy.add.at(totals, index_array, weighted)
+        numpy.add.at(weights, index_array, amount_array)
+    return totals.tolist(), weights.tolist()
+
+
+def aggregate_recipes(recipes):
+    """
+    Sečte nutriční hodnoty ingrediencí pro každý recept (seznam seznamů ingrediencí).
+    Ingredience má tvar {"amount": ..., "unit": "g"|"kg"|"ml"|"l", "nutritionalDetails": {...}}.
+    Vrací pro každý recept celkové hodnoty, hodnoty na 100 g a celkovou hmotnost v gramech.
+    Při nekonečném nebo NaN množství ingredience a při přetečení součtů vyhodí ValueError
+    (výsledek musí jít zapsat jako platný JSON).
+    """
+    totals, weights = _sum_rows(len(recipes), *_ingredient_rows(recipes))
+    results = []
+    for recipe_totals, weight in zip(totals, weights):
+        results.append({
+            "total_amount": round(weight, 2),
+            "totals": {key: round(value, 4) for key, value in zip(AGGREGATED_NUTRIENT_KEYS, recipe_totals)},
+            "per_100g": {key: round(value / weight * 100, 4) for key, value in zip(AGGREGATED_NUTRIENT_KEYS, recipe_totals)}
+                        if weight > 0 else None,
+        })
+        result = results[-1]
+        numbers = [result["total_amount"], *result["totals"].values(), *(result["per_100g"] or {}).values()]
+        if not all(math.isfinite(number) for number in numbers):
+            raise ValueError("Součty nutričních hodnot receptu jsou mimo rozsah čísel (příliš velké množství nebo hodnoty).")
+    return results
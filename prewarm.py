@@ -0,0 +1,287 @@
+# prewarm.py - Obnova populárních záznamů cache na pozadí (stale-while-revalidate)
+# Routy zaznamenávají, které dotazy a potraviny uživatelé chtějí (record()). Počty se jednou za sekundu
+# přičtou do SQLite (stejný soubor jako cache), takže popularita je společná všem workerům a s časem
+# slábne (poločas PREWARM_HALF_LIFE). Vlákno na pozadí každých PREWARM_INTERVAL sekund projde
+# nejpopulárnější klíče a ty, které v cache chybí nebo brzy vyprší, obnoví dřív, než na ně narazí uživatel.
+# Obnovy sdílených cache (SQLite) dělá jen jeden worker (zámek s platností v SQLite), obnovy paměťových
+# cache každý worker pro sebe. Mezi dvěma obnovami vlákno čeká, aby počet požadavků na web zůstal omezený;
+# držitel zámku ho před každou obnovou sdílené cache prodlouží a při jeho ztrátě sdílené obnovy ukončí.
+# Obnova odložená kvůli vyčerpanému rozpočtu požadavků (ratelimit.py) se nepočítá jako chyba a zkusí se
+# v dalším cyklu.
+import os
+import json
+import sqlite3
+import threading
+import time
+import atexit
+
+from cache import CACHE_DB_PATH
+import metrics
+import ratelimit
+import scheduler
+
+# Zapnutí obnovy na pozadí (popularita se zaznamenává vždy)
+PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# SQLite soubor s popularitou klíčů (výchozí je soubor cache)
+PREWARM_DB_PATH = os.getenv('PREWARM_DB_PATH', CACHE_DB_PATH)
+# Jak často (v sekundách) se hledají záznamy k obnově
+PREWARM_INTERVAL = float(os.getenv('PREWARM_INTERVAL', '60'))
+# Kolik nejpopulárnějších klíčů každého druhu se udržuje v cache
+PREWARM_TOP = int(os.getenv('PREWARM_TOP', '100'))
+# Záznam se obnoví, pokud v cache chybí nebo vyprší dříve než za tolik sekund
+PREWARM_REFRESH_AHEAD = float(os.getenv('PREWARM_REFRESH_AHEAD', str(10 * 60)))
+# Nejvyšší počet obnov za minutu v jednom workeru (každá obnova jsou 1-3 požadavky na web)
+PREWARM_MAX_PER_MINUTE = float(os.getenv('PREWARM_MAX_PER_MINUTE', '30'))
+# Poločas popularity v sekundách a skóre, pod kterým se klíč zapomene
+PREWARM_HALF_LIFE = float(os.getenv('PREWARM_HALF_LIFE', str(6 * 60 * 60)))
+PREWARM_MIN_SCORE = float(os.getenv('PREWARM_MIN_SCORE', '0.5'))
+# Po neúspěšné obnově se klíč znovu zkusí nejdříve za tolik sekund
+PREWARM_RETRY_AFTER = float(os.getenv('PREWARM_RETRY_AFTER', str(60 * 60)))
+
+# Druh klíče -> (funkce vracející čas vypršení záznamu nebo None, obnovovací funkce, zda je cache sdílená workery)
+_kinds = {}
+
+# Nezapsané přírůstky popularity tohoto workeru: (druh, klíč jako JSON) -> počet
+_pending = {}
+_pending_lock = threading.Lock()
+_pending_pid = None
+
+_db = None
+_db_pid = None
+_db_lock = threading.Lock()
+
+# Klíč -> čas neúspěšné obnovy (jen tento worker)
+_failed = {}
+_stats = {"cycles": 0, "refreshed": 0, "failed": 0, "deferred": 0, "last_cycle": None}
+
+
+def register(kind, expires_at, refresh, shared=True):
+    """
+    Přidá druh klíče. expires_at(*klíč) vrátí unixový čas vypršení záznamu v cache (None = chybí),
+    refresh(*klíč) záznam stáhne a uloží (výjimka nebo False = neúspěch). shared=False znamená cache
+    v paměti workeru - obnovuje ji pak každý worker sám.
+    """
+    _kinds[kind] = (expires_at, refresh, shared)
+
+
+def record(kind, *key):
+    """Započítá jeden požadavek uživatele na klíč."""
+    _ensure_worker()
+    key_text = json.dumps(key, ensure_ascii=False)
+    with _pending_lock:
+        _pending[(kind, key_text)] = _pending.get((kind, key_text), 0) + 1
+
+
+def _ensure_worker():
+    """Po forku zahodí přírůstky zděděné od rodiče a spustí vlákno obnovy tohoto workeru."""
+    global _pending_pid
+    if _pending_pid == os.getpid():
+        return
+    with _pending_lock:
+        if _pending_pid == os.getpid():
+            return
+        _pending.clear()
+        _failed.clear()
+        _pending_pid = os.getpid()
+    threading.Thread(target=_prewarm_loop, name='prewarm', daemon=True).start()
+
+
+# --- Sdílené úložiště ---
+
+def _connection():
+    global _db, _db_pid
+    if _db is not None and _db_pid == os.getpid():
+        return _db
+    try:
+        db = sqlite3.connect(PREWARM_DB_PATH, timeout=5, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS popularity (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                score REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+        """)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS prewarm_lease (
+                name TEXT PRIMARY KEY,
+                pid INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        db.commit()
+    except sqlite3.Error as e:
+        print(f"Upozornění: Nepodařilo se otevřít databázi popularity {PREWARM_DB_PATH}: {e}. Obnova cache na pozadí je vypnutá.")
+        db = None
+    _db, _db_pid = db, os.getpid()
+    return db
+
+
+def _decayed(score, updated_at, now):
+    return score * 0.5 ** (max(0.0, now - updated_at) / PREWARM_HALF_LIFE)
+
+
+def flush():
+    """Přičte přírůstky popularity tohoto workeru do SQLite (se zeslábnutím starého skóre)."""
+    with _pending_lock:
+        if not _pending:
+            return
+        rows = list(_pending.items())
+        _pending.clear()
+    now = time.time()
+    with _db_lock:
+        db = _connection()
+        if db is None:
+            return
+        try:
+            with db:
+                for (kind, key_text), count in rows:
+                    row = db.execute('SELECT score, updated_at FROM popularity WHERE kind = ? AND key = ?',
+                                     (kind, key_text)).fetchone()
+                    score = count + (_decayed(row[0], row[1], now) if row else 0.0)
+                    db.execute('INSERT OR REPLACE INTO popularity (kind, key, score, updated_at) VALUES (?, ?, ?, ?)',
+                               (kind, key_text, score, now))
+        except sqlite3.Error as e:
+            print(f"Chyba při zápisu popularity: {e}")
+
+
+atexit.register(flush)
+
+
+def hot_keys(kind, limit=PREWARM_TOP):
+    """Vrátí nejpopulárnější klíče druhu jako seznam (klíč jako tuple, skóre), od nejpopulárnějšího."""
+    now = time.time()
+    with _db_lock:
+        db = _connection()
+        if db is None:
+            return []
+        try:
+            rows = db.execute('SELECT key, score, updated_at FROM popularity WHERE kind = ?', (kind,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Chyba při čtení popularity: {e}")
+            return []
+    scored = sorted(((_decayed(score, updated_at, now), key_text) for key_text, score, updated_at in rows), reverse=True)
+    return [(tuple(json.loads(key_text)), score) for score, key_text in scored[:limit] if score >= PREWARM_MIN_SCORE]
+
+
+def _forget_cold(now):
+    """Smaže klíče, jejichž popularita zeslábla pod PREWARM_MIN_SCORE."""
+    with _db_lock:
+        db = _connection()
+        if db is None:
+            return
+        try:
+            rows = db.execute('SELECT kind, key, score, updated_at FROM popularity').fetchall()
+            cold = [(kind, key_text) for kind, key_text, score, updated_at in rows
+                    if _decayed(score, updated_at, now) < PREWARM_MIN_SCORE]
+            with db:
+                db.executemany('DELETE FROM popularity WHERE kind = ? AND key = ?', cold)
+        except sqlite3.Error as e:
+            print(f"Chyba při úklidu popularity: {e}")
+
+
+def _acquire_lease(now):
+    """Zda tento worker obnovuje sdílené cache (zámek platí tři intervaly, držitel ho prodlužuje)."""
+    with _db_lock:
+        db = _connection()
+        if db is None:
+            return False
+        try:
+            with db:
+                cursor = db.execute('INSERT INTO prewarm_lease (name, pid, expires_at) VALUES (?, ?, ?) '
+                                    'ON CONFLICT (name) DO UPDATE SET pid = excluded.pid, expires_at = excluded.expires_at '
+                                    'WHERE prewarm_lease.pid = excluded.pid OR prewarm_lease.expires_at <= ?',
+                                    ('shared', os.getpid(), now + 3 * PREWARM_INTERVAL, now))
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Chyba při získávání zámku obnovy cache: {e}")
+            return False
+
+
+# --- Obnova ---
+
+def _needs_refresh(kind, key, now):
+    expires_at, _, _ = _kinds[kind]
+    failed_at = _failed.get((kind, key))
+    if failed_at is not None and now - failed_at < PREWARM_RETRY_AFTER:
+        return False
+    expires = expires_at(*key)
+    return expires is None or expires - now < PREWARM_REFRESH_AHEAD
+
+
+def _refresh(kind, key):
+    _, refresh, _ = _kinds[kind]
+    error = None
+    # Obnova na pozadí má nejnižší prioritu, aby nezdržovala požadavky uživatelů
+    with scheduler.priority('enrichment'), ratelimit.track_deferrals() as deferred:
+        try:
+            ok = refresh(*key) is not False
+        except Exception as e:
+            error, ok = e, False
+    if ok:
+        _failed.pop((kind, key), None)
+        _stats["refreshed"] += 1
+        result = 'ok'
+    elif deferred[0]:
+        # Rozpočet požadavků byl vyčerpaný - nejde o chybu záznamu, zkusí se v dalším cyklu
+        _stats["deferred"] += 1
+        result = 'deferred'
+    else:
+        if error is not None:
+            print(f"Chyba při obnově {kind} {key}: {error}")
+        _failed[(kind, key)] = time.time()
+        _stats["failed"] += 1
+        result = 'error'
+    metrics.inc('kalkulacka_prewarm_refreshes_total', kind=kind, result=result)
+
+
+def run_cycle():
+    """Jednou projde populární klíče a obnoví ty, které chybí nebo brzy vyprší. Vrací počet obnov."""
+    flush()
+    now = time.time()
+    _forget_cold(now)
+    is_leader = _acquire_lease(now)
+    due = []
+    for kind, (_, _, shared) in list(_kinds.items()):
+        if shared and not is_leader:
+            continue
+        due += [(kind, key) for key, score in hot_keys(kind) if _needs_refresh(kind, key, now)]
+
+    gap = 60 / PREWARM_MAX_PER_MINUTE if PREWARM_MAX_PER_MINUTE > 0 else 0
+    refreshed = 0
+    for kind, key in due:
+        shared = _kinds[kind][2]
+        if shared and not is_leader:
+            continue
+        if refreshed and gap:
+            time.sleep(gap)
+        # Cyklus může trvat déle než platnost zámku - bez prodloužení by stejné klíče obnovoval i jiný worker
+        if shared and not _acquire_lease(time.time()):
+            is_leader = False
+            continue
+        _refresh(kind, key)
+        refreshed += 1
+    _stats["cycles"] += 1
+    _stats["last_cycle"] = now
+    return refreshed
+
+
+def _prewarm_loop():
+    pid = os.getpid()
+    next_cycle = time.time() + PREWARM_INTERVAL
+    while pid == os.getpid():
+        time.sleep(1)
+        flush()
+        if PREWARM_ENABLED and time.time() >= next_cycle:
+            try:
+                run_cycle()
+            except Exception as e:
+                print(f"Chyba při obnově cache na pozadí: {e}")
+            next_cycle = time.time() + PREWARM_INTERVAL
+
+
+def stats():
+    """Vrátí stav obnovy v tomto workeru (pro /cache_stats)."""
+    return dict(_stats, enabled=PREWARM_ENABLED, kinds=sorted(_kinds), retry_pending=len(_failed))
@@ -0,0 +1,222 @@
+# ratelimit.py - Společný rozpočet požadavků na www.kaloricketabulky.cz pro všechny workery na stroji
+# Token bucket pro každý druh požadavku ('autocomplete', 'image', 'detail') je uložený v SQLite (stejný soubor
+# jako cache), takže limit platí pro součet všech gunicorn/hypercorn workerů, ne pro každý zvlášť.
+# Worker si ze sdíleného rozpočtu bere volné tokeny po dávkách (UPSTREAM_RATE_BATCH) a nevyužité po
+# UPSTREAM_RATE_BATCH_TTL sekundách propadnou, takže většina požadavků SQLite vůbec nezapisuje.
+# Dokud rozpočet stačí, požadavek odejde hned. Obrázky (doplněk výsledků) na rozpočet nečekají nikdy -
+# při vyčerpání se odloží (řádek vyhledávání zůstane bez obrázku). Autocomplete a detaily si rezervují
+# další volný token a počkají nejvýše UPSTREAM_*_MAX_WAIT sekund, jinak se odloží také.
+# Požadavky třídy 'enrichment' (scheduler.py - obrázky, detaily k řádkům vyhledávání, obnova cache) nečekají
+# nikdy a berou jen tokeny nad rezervou UPSTREAM_ENRICHMENT_RESERVE, takže interaktivní požadavky stejného
+# druhu nestojí ve frontě za doplňováním výsledků.
+import os
+import sqlite3
+import threading
+import time
+import asyncio
+import contextlib
+import contextvars
+
+from cache import CACHE_DB_PATH
+import metrics
+import scheduler
+
+# SQLite soubor se stavem rozpočtů (výchozí je soubor cache)
+RATE_LIMIT_DB_PATH = os.getenv('RATE_LIMIT_DB_PATH', CACHE_DB_PATH)
+
+# Povolený počet požadavků za sekundu pro celý stroj podle druhu (0 = bez omezení)
+UPSTREAM_RATES = {
+    'autocomplete': float(os.getenv('UPSTREAM_AUTOCOMPLETE_RATE', '10')),
+    'image': float(os.getenv('UPSTREAM_IMAGE_RATE', '20')),
+    'detail': float(os.getenv('UPSTREAM_DETAIL_RATE', '10')),
+}
+# Kolik sekund rozpočtu lze vyčerpat naráz (špička po klidném období)
+UPSTREAM_RATE_BURST = float(os.getenv('UPSTREAM_RATE_BURST', '2'))
+# Nejdelší čekání ve frontě v sekundách, jinak se požadavek odloží; obrázky nečekají
+UPSTREAM_MAX_WAITS = {
+    'autocomplete': float(os.getenv('UPSTREAM_AUTOCOMPLETE_MAX_WAIT', '2')),
+    'image': float(os.getenv('UPSTREAM_IMAGE_MAX_WAIT', '0')),
+    'detail': float(os.getenv('UPSTREAM_DETAIL_MAX_WAIT', '2')),
+}
+# Kolik volných tokenů si worker vezme najednou a jak dlouho (v sekundách) je smí použít
+UPSTREAM_RATE_BATCH = int(os.getenv('UPSTREAM_RATE_BATCH', '4'))
+UPSTREAM_RATE_BATCH_TTL = float(os.getenv('UPSTREAM_RATE_BATCH_TTL', '1'))
+# Podíl špičky rozpočtu, který třída 'enrichment' nechává pro vyšší třídy
+UPSTREAM_ENRICHMENT_RESERVE = float(os.getenv('UPSTREAM_ENRICHMENT_RESERVE', '0.5'))
+
+_db = None
+_db_pid = None
+_db_lock = threading.Lock()
+# Rozpočty jen pro tento worker, pokud SQLite není dostupné: druh -> (tokeny, čas)
+_fallback = {}
+# Tokeny vybrané ze sdíleného rozpočtu pro tento worker: druh -> [počet, platnost do]
+_batches = {}
+_batches_lock = threading.Lock()
+_batches_pid = None
+# Počítadlo odložených požadavků pro blok track_deferrals() (seznam s jedním číslem, sdílený i s vlákny to_thread)
+_deferrals = contextvars.ContextVar('upstream_deferrals', default=None)
+
+
+def _connection():
+    global _db, _db_pid
+    if _db is not None and _db_pid == os.getpid():
+        return _db
+    try:
+        # Transakce se řídí ručně (BEGIN IMMEDIATE), aby čtení a zápis rozpočtu proběhly atomicky
+        db = sqlite3.connect(RATE_LIMIT_DB_PATH, timeout=5, check_same_thread=False, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                kind TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+    except sqlite3.Error as e:
+        print(f"Upozornění: Nepodařilo se otevřít databázi rozpočtů {RATE_LIMIT_DB_PATH}: {e}. Limit platí jen pro tento worker.")
+        db = None
+    _db, _db_pid = db, os.getpid()
+    return db
+
+
+def _take(state, now, rate, burst, max_wait, batch, floor=0.0):
+    """
+    Doplní tokeny od posledního stavu a vezme jeden (při dostatku až batch volných), přičemž
+    floor tokenů nechá ležet. Vrací (nový stav, čekání, počet vzatých tokenů), nebo None,
+    pokud by čekání překročilo max_wait.
+    """
+    tokens = burst if state is None else min(burst, state[0] + (now - state[1]) * rate)
+    if tokens - floor >= 1:
+        taken = max(1, min(batch, int(tokens - floor)))
+        return (tokens - taken, now), 0.0, taken
+    wait = (1 + floor - tokens) / rate
+    if wait > max_wait:
+        return None
+    return (tokens - 1, now), wait, 1
+
+
+def _reserve_shared(db, kind, now, rate, burst, max_wait, batch, floor):
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        state = db.execute('SELECT tokens, updated_at FROM rate_buckets WHERE kind = ?', (kind,)).fetchone()
+        taken = _take(state, now, rate, burst, max_wait, batch, floor)
+        if taken is not None:
+            db.execute('INSERT OR REPLACE INTO rate_buckets (kind, tokens, updated_at) VALUES (?, ?, ?)',
+                       (kind, taken[0][0], taken[0][1]))
+        db.execute('COMMIT')
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    return taken
+
+
+def _take_batched(kind):
+    """Vezme token z dávky tohoto workeru bez přístupu k SQLite. Vrací True při úspěchu."""
+    global _batches_pid
+    with _batches_lock:
+        if _batches_pid != os.getpid():
+            _batches.clear()  # dávky rodiče po forku nepatří tomuto workeru
+            _batches_pid = os.getpid()
+        batch = _batches.get(kind)
+        if batch is None or batch[0] < 1 or batch[1] <= time.time():
+            return False
+        batch[0] -= 1
+        return True
+
+
+@contextlib.contextmanager
+def track_deferrals():
+    """Blok, ve kterém se počítají požadavky odložené kvůli rozpočtu; vrací seznam [počet]."""
+    deferred = [0]
+    token = _deferrals.set(deferred)
+    try:
+        yield deferred
+    finally:
+        _deferrals.reset(token)
+
+
+def _record(kind, wait):
+    if wait is None:
+        metrics.inc('kalkulacka_upstream_deferred_total', kind=kind)
+        deferred = _deferrals.get()
+        if deferred is not None:
+            deferred[0] += 1
+    else:
+        metrics.observe('kalkulacka_upstream_queue_seconds', wait, kind=kind)
+        metrics.add_timing('queue', wait)
+
+
+def reserve(kind, priority_class=None):
+    """
+    Rezervuje jeden požadavek druhu kind. Vrátí počet sekund, které je nutné počkat (0 = hned),
+    nebo None, pokud by čekání překročilo UPSTREAM_MAX_WAITS - pak se nic nerezervuje.
+    priority_class (výchozí scheduler.request_class(kind)) 'enrichment' nečeká a nesahá pod rezervu.
+    Při prázdné dávce workeru zapisuje do SQLite, z event loopu ji proto volejte přes asyncio.to_thread.
+    """
+    rate = UPSTREAM_RATES.get(kind, 0)
+    if rate <= 0:
+        return 0.0
+    enrichment = (priority_class or scheduler.request_class(kind)) == 'enrichment'
+    # Dávku workeru spotřebovávají jen vyšší třídy, doplňování si bere tokeny zvlášť nad rezervou
+    if not enrichment and _take_batched(kind):
+        _record(kind, 0.0)
+        return 0.0
+    burst = max(1.0, rate * UPSTREAM_RATE_BURST)
+    max_wait = 0.0 if enrichment else UPSTREAM_MAX_WAITS.get(kind, 0)
+    # Rezerva nesmí zabrat celou špičku, jinak by se doplňování při malém rozpočtu nedostalo nikdy na řadu
+    floor = min(UPSTREAM_ENRICHMENT_RESERVE * burst, burst - 1) if enrichment else 0.0
+    batch = 1 if enrichment else UPSTREAM_RATE_BATCH
+    now = time.time()
+    with _db_lock:
+        db = _connection()
+        taken = None
+        shared = False
+        if db is not None:
+            try:
+                taken = _reserve_shared(db, kind, now, rate, burst, max_wait, batch, floor)
+                shared = True
+            except sqlite3.Error as e:
+                print(f"Chyba při čtení rozpočtu požadavků: {e}")
+        if not shared:
+            taken = _take(_fallback.get(kind), now, rate, burst, max_wait, 1, floor)
+            if taken is not None:
+                _fallback[kind] = taken[0]
+
+    wait = None
+    if taken is not None:
+        _, wait, count = taken
+        if count > 1:
+            with _batches_lock:
+                _batches[kind] = [count - 1, now + UPSTREAM_RATE_BATCH_TTL]
+    _record(kind, wait)
+    return wait
+
+
+def acquire(kind, priority_class=None):
+    """
+    Vezme token z rozpočtu. Vrátí False, pokud se má požadavek odložit. Čeká se jen u autocomplete
+    a detailů mimo třídu 'enrichment', a to nejvýše UPSTREAM_*_MAX_WAIT sekund na už rezervovaný token.
+    """
+    wait = reserve(kind, priority_class)
+    if wait is None:
+        return False
+    if wait > 0:
+        time.sleep(wait)
+    return True
+
+
+async def acquire_async(kind, priority_class=None):
+    """Asynchronní obdoba acquire() - přístup k SQLite ani čekání neblokují event loop."""
+    if UPSTREAM_RATES.get(kind, 0) <= 0:
+        return True
+    priority_class = priority_class or scheduler.request_class(kind)
+    if priority_class != 'enrichment' and _take_batched(kind):
+        _record(kind, 0.0)
+        return True
+    wait = await asyncio.to_thread(reserve, kind, priority_class)
+    if wait is None:
+        return False
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return True
@@ -0,0 +1,196 @@
+# scheduler.py - Přednost interaktivních požadavků na web před doplňováním výsledků
+# Požadavky na www.kaloricketabulky.cz se dělí do tříd podle priority:
+#   'interactive'  - detaily potraviny a čárové kódy (/get_details, /search_by_barcode, dávky)
+#   'autocomplete' - dotazy autocomplete API
+#   'enrichment'   - dohledávání obrázků k výsledkům vyhledávání a obnova cache na pozadí (prewarm.py)
+# Worker pouští najednou nejvýše UPSTREAM_MAX_IN_FLIGHT požadavků. Čekající se obsluhují podle třídy
+# (v rámci třídy podle příchodu) a každá nižší třída nechává UPSTREAM_RESERVED_SLOTS míst volných pro
+# třídy nad sebou, takže detail nečeká na obrázky ani při velké zátěži vyhledávání.
+# Hloubka fronty a čekání podle třídy jsou v /metrics a /cache_stats.
+import os
+import heapq
+import itertools
+import threading
+import time
+import asyncio
+import contextlib
+import contextvars
+
+import metrics
+
+PRIORITY_CLASSES = ('interactive', 'autocomplete', 'enrichment')
+# Výchozí třída podle druhu požadavku v upstream.get()
+KIND_CLASSES = {'detail': 'interactive', 'autocomplete': 'autocomplete', 'image': 'enrichment'}
+
+# Nejvyšší počet souběžných požadavků na web v jednom workeru (výchozí = velikost poolu spojení)
+UPSTREAM_MAX_IN_FLIGHT = int(os.getenv('UPSTREAM_MAX_IN_FLIGHT', os.getenv('UPSTREAM_POOL_MAXSIZE', '16')))
+# Počet míst, která každá nižší třída nechává volná pro třídy nad sebou
+UPSTREAM_RESERVED_SLOTS = int(os.getenv('UPSTREAM_RESERVED_SLOTS', '4'))
+
+# Třída nastavená volajícím (např. detaily načítané kvůli řádku vyhledávání jsou doplněk)
+_current_class = contextvars.ContextVar('upstream_priority_class', default=None)
+
+
+def request_class(kind):
+    """Třída priority pro požadavek druhu kind (přednost má třída nastavená přes priority())."""
+    return _current_class.get() or KIND_CLASSES.get(kind, 'interactive')
+
+
+@contextlib.contextmanager
+def priority(priority_class):
+    """Požadavky na web uvnitř bloku patří do dané třídy."""
+    token = _current_class.set(priority_class)
+    try:
+        yield
+    finally:
+        _current_class.reset(token)
+
+
+class _PriorityGate:
+    """Společná část synchronní a asynchronní brány: limity tříd, fronta a počítadla."""
+
+    def __init__(self, name, capacity, reserved):
+        self.name = name
+        self.capacity = capacity
+        self.reserved = reserved
+        self._queue = []  # halda (pořadí třídy, pořadové číslo, třída, čekající)
+        self._sequence = itertools.count()
+        self.in_flight = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.waiting = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.started = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.queued = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.wait_seconds = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+
+    def limit(self, priority_class):
+        """Kolik požadavků smí běžet, aby třída mohla začít (nižší třídy nechávají místa vyšším)."""
+        return max(1, self.capacity - self.reserved * PRIORITY_CLASSES.index(priority_class))
+
+    def _can_start(self, priority_class):
+        return sum(self.in_flight.values()) < self.limit(priority_class)
+
+    def _ahead(self, priority_class):
+        """Zda ve frontě čeká někdo se stejnou nebo vyšší prioritou."""
+        rank = PRIORITY_CLASSES.index(priority_class)
+        return any(self.waiting[cls] for cls in PRIORITY_CLASSES[:rank + 1])
+
+    def _record(self, priority_class, wait):
+        self.started[priority_class] += 1
+        if wait:
+            self.queued[priority_class] += 1
+            self.wait_seconds[priority_class] += wait
+        metrics.observe('kalkulacka_upstream_priority_wait_seconds', wait, priority=priority_class)
+        metrics.add_timing('queue', wait)
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "reserved_slots": self.reserved,
+            "classes": {cls: {
+                "limit": self.limit(cls),
+                "in_flight": self.in_flight[cls],
+                "waiting": self.waiting[cls],
+                "started": self.started[cls],
+                "queued": self.queued[cls],
+                "wait_seconds": round(self.wait_seconds[cls], 4),
+            } for cls in PRIORITY_CLASSES},
+        }
+
+
+class PriorityGate(_PriorityGate):
+    """Brána pro vlákna (WSGI worker)."""
+
+    def __init__(self, name, capacity, reserved):
+        super().__init__(name, capacity, reserved)
+        self._lock = threading.Lock()
+
+    def acquire(self, priority_class):
+        started = time.perf_counter()
+        with self._lock:
+            if not self._ahead(priority_class) and self._can_start(priority_class):
+                self.in_flight[priority_class] += 1
+                self._record(priority_class, 0.0)
+                return
+            ready = threading.Event()
+            heapq.heappush(self._queue, (PRIORITY_CLASSES.index(priority_class), next(self._sequence), priority_class, ready))
+            self.waiting[priority_class] += 1
+        ready.wait()
+        with self._lock:
+            self._record(priority_class, time.perf_counter() - started)
+
+    def release(self, priority_class):
+        with self._lock:
+            self.in_flight[priority_class] -= 1
+            # Nejvyšší čekající nemůže začít - nižší třídy mají nižší limit, takže nemohou ani ony
+            while self._queue and self._can_start(self._queue[0][2]):
+                _, _, waiting_class, ready = heapq.heappop(self._queue)
+                self.waiting[waiting_class] -= 1
+                self.in_flight[waiting_class] += 1
+                ready.set()
+
+    @contextlib.contextmanager
+    def slot(self, kind):
+        """Blok s jedním místem pro požadavek druhu kind."""
+        priority_class = request_class(kind)
+        self.acquire(priority_class)
+        try:
+            yield
+        finally:
+            self.release(priority_class)
+
+    def stats(self):
+        with self._lock:
+            return super().stats()
+
+
+class AsyncPriorityGate(_PriorityGate):
+    """Brána pro asyncio (ASGI); používá se jen z jednoho event loopu."""
+
+    async def acquire(self, priority_class):
+        if not self._ahead(priority_class) and self._can_start(priority_class):
+            self.in_flight[priority_class] += 1
+            self._record(priority_class, 0.0)
+            return
+        started = time.perf_counter()
+        ready = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (PRIORITY_CLASSES.index(priority_class), next(self._sequence), priority_class, ready))
+        self.waiting[priority_class] += 1
+        try:
+            await ready
+        except asyncio.CancelledError:
+            if ready.done() and not ready.cancelled():
+                self.release(priority_class)  # místo už bylo přidělené
+            else:
+                ready.cancel()
+                self.waiting[priority_class] -= 1
+            raise
+        self._record(priority_class, time.perf_counter() - started)
+
+    def release(self, priority_class):
+        self.in_flight[priority_class] -= 1
+        while self._queue:
+            _, _, waiting_class, ready = self._queue[0]
+            if ready.done():  # čekající task byl zrušen
+                heapq.heappop(self._queue)
+                continue
+            if not self._can_start(waiting_class):
+                break
+            heapq.heappop(self._queue)
+            self.waiting[waiting_class] -= 1
+            self.in_flight[waiting_class] += 1
+            ready.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, kind):
+        """Asynchronní obdoba PriorityGate.slot()."""
+        priority_class = request_class(kind)
+        await self.acquire(priority_class)
+        try:
+            yield
+        finally:
+            self.release(priority_class)
+
+
+def register_metrics(gate):
+    """Přidá hloubku fronty a počet běžících požadavků brány do /metrics (součet za workery)."""
+    metrics.register_gauge('kalkulacka_upstream_queue_depth', 'priority', lambda: dict(gate.waiting))
+    metrics.register_gauge('kalkulacka_upstream_in_flight', 'priority', lambda: dict(gate.in_flight))
@@ -0,0 +1,462 @@
+# scraper.py - Zpracování dat z www.kaloricketabulky.cz (bez síťové komunikace)
+# Funkce jsou sdílené WSGI (app.py) i ASGI (asgi.py) verzí aplikace.
+# parse_nutrients_from_soup() je referenční (pomalejší) parser - rychlá varianta je v extractor.py.
+import re
+import codecs
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+from upstream import BASE_WEB_URL
+
+# Výchozí podoba odpovědi /get_details
+DETAILS_TEMPLATE = {
+    "total_kcal": "N/A", "total_kj": "N/A", "protein": "N/A", "protein_rdi": "N/A",
+    "carbs": "N/A", "carbs_rdi": "N/A", "sugar": "N/A", "fat": "N/A", "fat_rdi": "N/A",
+    "saturated_fat": "N/A", "trans_fat": "N/A", "monounsaturated_fat": "N/A",
+    "polyunsaturated_fat": "N/A", "cholesterol": "N/A", "fiber": "N/A", "fiber_rdi": "N/A",
+    "salt": "N/A", "calcium": "N/A", "sodium": "N/A", "water": "N/A", "phe": "N/A",
+    "source_url": None
+}
+
+# Makroživiny přidávané do řádků výsledků vyhledávání (režim 'macros')
+SEARCH_MACRO_KEYS = ('protein', 'carbs', 'fat')
+
+# Klíčová slova, podle kterých se energie ve výsledcích vyhledávání vztahuje na 100 ml místo 100 g
+LIQUID_KEYWORDS = ['mléko', 'kefír', 'jogurtový nápoj', 'džus', 'šťáva', 'voda', 'nápoj', 'limonáda', 'sirup', 'polévka', 'vývar']
+
+
+def unique_autocomplete_items(autocomplete_data):
+    """Odstraní z odpovědi autocomplete API položky bez názvu a duplicitní názvy."""
+    # Přidáme filtr pro odstranění duplicitních výsledků
+    seen_names = set()
+    unique_results = []
+
+    for item in autocomplete_data:
+        food_name = item.get("title", "Neznámá potravina").strip()
+
+        # Přeskočíme prázdné názvy
+        if not food_name:
+            continue
+
+        # Normalizujeme název pro lepší porovnávání
+        normalized_name = food_name.lower()
+
+        # Přeskočíme duplicitní výsledky
+        if normalized_name in seen_names:
+            continue
+
+        seen_names.add(normalized_name)
+        unique_results.append(item)
+
+    return unique_results
+
+
+def build_search_result(item, image_url=None, food_type=None):
+    """Sestaví jeden NDJSON řádek výsledku vyhledávání z položky autocomplete API."""
+    food_name = item.get("title", "Neznámá potravina")
+    food_value = item.get('value', 'N/A')
+
+    is_liquid = False
+    for keyword in LIQUID_KEYWORDS:
+        if keyword in food_name.lower():
+            is_liquid = True
+            break
+
+    energy_unit_suffix = "kcal"
+    if is_liquid:
+        energy_unit_suffix = "kcal/100 ml"
+    else:
+        energy_unit_suffix = "kcal/100 g"
+
+    food_calories = f"{food_value} {energy_unit_suffix}"
+
+    return {
+        "name": food_name,
+        "calories": food_calories,
+        "image_url": image_url,
+        "slug": item.get('url'), # Still send the original slug for get_details
+        "food_type": food_type # Send the determined food_type
+    }
+
+
+def autocomplete_barcode_match(autocomplete_data):
+    """
+    Vrátí záznam {slug, food_type, name} první použitelné položky autocomplete API
+    (dohledání potraviny ke kódu podle názvu), nebo None.
+    """
+    for item in unique_autocomplete_items(autocomplete_data):
+        if item.get('url'):
+            return {"slug": item.get('url'), "food_type": None, "name": item.get('title')}
+    return None
+
+
+def search_result_details(details, details_mode):
+    """Vrátí pole s nutričními hodnotami, která se přidají do řádku výsledku vyhledávání."""
+    fields = {key: details.get(key) if details else None for key in SEARCH_MACRO_KEYS}
+    if details_mode == 'full':
+        fields["details"] = details
+    return fields
+
+
+def decode_page(content, encoding):
+    """Dekóduje tělo odpovědi stejně jako requests Response.text (neplatné znaky nahradí)."""
+    try:
+        return str(content, encoding or 'utf-8', errors='replace')
+    except LookupError:
+        return str(content, 'utf-8', errors='replace')
+
+
+def image_page_candidates(slug):
+    """Vrátí detailní stránky (url, food_type), na kterých se hledá obrázek - v pořadí priority."""
+    potential_image_urls_and_types = []
+
+    # Priorita: 1. /recepty/, 2. /potraviny/
+    potential_image_urls_and_types.append((urljoin(BASE_WEB_URL, '/recepty/' + slug.lstrip('/')), 'recept'))
+    potential_image_urls_and_types.append((urljoin(BASE_WEB_URL, '/potraviny/' + slug.lstrip('/')), 'potravina'))
+
+    # Remove duplicates while preserving order
+    unique_urls_and_types = []
+    seen_urls = set()
+    for url, type_val in potential_image_urls_and_types:
+        if url not in seen_urls:
+            unique_urls_and_types.append((url, type_val))
+            seen_urls.add(url)
+    return unique_urls_and_types
+
+
+def image_url_from_src(src):
+    """Vrátí URL náhledu obrázku podle jeho src na detailní stránce."""
+    return f"{BASE_WEB_URL}{src}?w=100"
+
+
+def find_image_url(html):
+    """Najde na detailní stránce první obrázek z /file/image/ a vrátí URL jeho náhledu, nebo None."""
+    detail_soup = BeautifulSoup(html, 'html.parser')
+    img_tag = detail_soup.find('img', src=lambda src: src and src.startswith('/file/image/'))
+
+    if img_tag and img_tag.get('src'):
+        return image_url_from_src(img_tag['src'])
+    return None
+
+
+class ImageTagScanner(HTMLParser):
+    """
+    Inkrementální hledání prvního <img src="/file/image/...">.
+    Používá stejný tokenizer (html.parser) jako BeautifulSoup, takže ignoruje komentáře i obsah skriptů.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.image_src = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.image_src is None and tag == 'img':
+            src = dict(attrs).get('src')
+            if src and src.startswith('/file/image/'):
+                self.image_src = src
+
+
+class ImageProbe:
+    """
+    Hledá obrázek v těle odpovědi po částech, jak přicházejí ze sítě.
+    feed() vrátí True, jakmile je obrázek nalezen nebo je překročen limit stažených bajtů (max_bytes=None
+    znamená bez limitu), volající pak může spojení hned zavřít. Výsledek je stejný jako find_image_url()
+    nad celou stránkou.
+    """
+
+    def __init__(self, encoding=None, max_bytes=None):
+        try:
+            decoder_factory = codecs.getincrementaldecoder(encoding or 'utf-8')
+        except LookupError:
+            decoder_factory = codecs.getincrementaldecoder('utf-8')
+        self._decoder = decoder_factory(errors='replace')
+        self._scanner = ImageTagScanner()
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    @property
+    def image_url(self):
+        if self._scanner.image_src:
+            return image_url_from_src(self._scanner.image_src)
+        return None
+
+    def feed(self, chunk):
+        """Zpracuje další část odpovědi (bytes). Vrací True, pokud už není třeba číst dál."""
+        self.bytes_read += len(chunk)
+        if self._scanner.image_src:
+            return True
+        self._scanner.feed(self._decoder.decode(chunk))
+        if self._scanner.image_src:
+            return True
+        return self.max_bytes is not None and self.bytes_read >= self.max_bytes
+
+    def finish(self):
+        """Zpracuje zbytek dat po konci odpovědi (např. poslední nedokončený tag)."""
+        if self._scanner.image_src is None:
+            self._scanner.feed(self._decoder.decode(b'', final=True))
+            self._scanner.close()
+
+
+def details_page_candidates(slug, food_type):
+    """
+    Vrátí detailní stránky (url, is_recipe), ze kterých se zkouší získat nutriční hodnoty.
+    Bez známého food_type se zkusí nejprve /potraviny/ a poté /recepty/.
+    """
+    if food_type == 'potravina':
+        return [(urljoin(BASE_WEB_URL, '/potraviny/' + slug.lstrip('/')), False)]
+    if food_type == 'recept':
+        return [(urljoin(BASE_WEB_URL, '/recepty/' + slug.lstrip('/')), True)]
+    # Fallback if food_type is not explicitly provided or recognized
+    return [(urljoin(BASE_WEB_URL, '/potraviny/' + slug.lstrip('/')), False),
+            (urljoin(BASE_WEB_URL, '/recepty/' + slug.lstrip('/')), True)]
+
+
+def has_details(scraped_data):
+    """Zda se ze stránky podařilo získat alespoň energetickou hodnotu."""
+    return bool(scraped_data) and scraped_data.get("total_kcal") != "N/A"
+
+
+def build_details(scraped_data):
+    """Doplní výsledek scrapování do úplné odpovědi /get_details."""
+    details = dict(DETAILS_TEMPLATE)
+    details.update(scraped_data)
+    return details
+
+
+def extract_value_and_unit_from_text(text_content):
+    """
+    Pomocná funkce pro extrakci číselné hodnoty a jednotky z textového řetězce.
+    Odstraní mezery a nahradí desetinnou čárku tečkou.
+    Prioritizuje jednotky hmotnosti/energie před procenty.
+    """
+    if not isinstance(text_content, str):
+        return {"value": "N/A", "unit": ""}
+
+    # Regex to find a number which can include spaces as thousand separators
+    # and a comma or dot as a decimal separator, followed by a unit.
+    # \d+ : one or more digits
+    # (?:[\s\u00A0]\d{3})* : non-capturing group for optional thousand separators (space or non-breaking space followed by 3 digits)
+    # (?:[.,]\d+)? : non-capturing group for optional decimal part (comma or dot followed by digits)
+    # \s* : optional whitespace before unit
+    # (g|mg|kJ|kcal) : the unit
+    match_non_percentage = re.search(r'(\d+(?:[\s\u00A0]\d{3})*(?:[.,]\d+)?)\s*(g|mg|kJ|kcal)', text_content, re.IGNORECASE)
+
+    if match_non_percentage:
+        value_part_raw = match_non_percentage.group(1)
+        unit_part = match_non_percentage.group(2)
+
+        # Clean the raw value part: remove all spaces (thousand separators) and replace comma with dot for float conversion
+        value_part_cleaned = value_part_raw.replace(' ', '').replace('\u00A0', '').replace(',', '.')
+
+        # Validate if it's actually a number after cleaning
+        try:
+            float(value_part_cleaned) # Try converting to float to ensure it's a valid number
+            return {"value": value_part_cleaned, "unit": unit_part}
+        except ValueError:
+            pass # Not a valid number, fall through to percentage or N/A
+
+    # If not a g/mg/kJ/kcal unit, check for percentage (as before)
+    match_percentage = re.search(r'(\d+\.?\d*)\s*(%)', text_content, re.IGNORECASE)
+    if match_percentage:
+        value_part = match_percentage.group(1)
+        unit_part = match_percentage.group(2)
+        return {"value": "N/A", "unit": ""} # Changed to N/A for % values as per user's previous request to only show g/mg/kJ/kcal
+
+    return {"value": "N/A", "unit": ""}
+
+
+def parse_nutrients_from_soup(soup_obj, is_recipe_page=False):
+    """Parsuje nutriční hodnoty z BeautifulSoup objektu."""
+    scraped_data = {key: "N/A" for key in DETAILS_TEMPLATE.keys() if key not in ["source_url", "total_kcal", "total_kj"]}
+
+    # --- Energetická hodnota (kcal, kJ) ---
+    try:
+        if is_recipe_page:
+            # Pro recepty: Hledáme span s ng-if="data.energy==null" pro kcal
+            kcal_span = soup_obj.find('span', attrs={'ng-if': 'data.energy==null'})
+            if kcal_span:
+                parent_div = kcal_span.find_parent('div')
+                if parent_div:
+                    full_kcal_text = parent_div.get_text(strip=True)
+                    parsed_kcal = extract_value_and_unit_from_text(full_kcal_text)
+                    if parsed_kcal["value"] != "N/A":
+                        scraped_data["total_kcal"] = f"{parsed_kcal['value'].replace('.', ',')} kcal"
+                    else:
+                        scraped_data["total_kcal"] = "N/A"
+                else:
+                    scraped_data["total_kcal"] = "N/A"
+            else:
+                scraped_data["total_kcal"] = "N/A"
+
+            # Pro recepty: Hledáme span s ng-if="data.energyAlt==null" pro kJ
+            kj_span = soup_obj.find('span', attrs={'ng-if': 'data.energyAlt==null'})
+            if kj_span:
+                parent_div = kj_span.find_parent('div')
+                if parent_div:
+                    full_kj_text = parent_div.get_text(strip=True)
+                    parsed_kj = extract_value_and_unit_from_text(full_kj_text)
+                    if parsed_kj["value"] != "N/A":
+                        scraped_data["total_kj"] = f"{parsed_kj['value'].replace('.', ',')} kJ"
+                    else:
+                        scraped_data["total_kj"] = "N/A"
+                else:
+                    scraped_data["total_kj"] = "N/A"
+            else:
+                scraped_data["total_kj"] = "N/A"
+
+        else: # Pro potraviny
+            kcal_input = soup_obj.find('input', id='calculatedEnergyValueInit')
+            if kcal_input and kcal_input.get('value'):
+                scraped_data["total_kcal"] = f"{kcal_input['value']} kcal"
+            else:
+                energy_sum_div = soup_obj.find('div', class_=lambda x: x and ('text-sum' in x or 'text-sum-xs' in x))
+                if energy_sum_div:
+                    scraped_data["total_kcal"] = energy_sum_div.get_text(strip=True)
+
+            kj_div = None
+            all_subtitle_divs = soup_obj.find_all('div', class_='text-subtitle')
+            for div in all_subtitle_divs:
+                if 'kJ' in div.get_text() or 'Energetická hodnota' in div.get_text():
+                    kj_div = div
+                    break
+
+            if kj_div:
+                kj_text_raw = kj_div.get_text(strip=True)
+                parsed_kj = extract_value_and_unit_from_text(kj_text_raw)
+                if parsed_kj["value"] != "N/A":
+                    scraped_data["total_kj"] = f"{parsed_kj['value'].replace('.', ',')} kJ"
+                else:
+                    scraped_data["total_kj"] = "N/A"
+            else:
+                scraped_data["total_kj"] = "N/A"
+
+    except Exception as e:
+        pass
+
+
+    # --- Hledání všech živin (hlavních i podkategorií) ---
+    # Find the main content block where nutrients are listed
+    main_nutrient_block = soup_obj.find('div', class_='block-background', attrs={'flex': '50'})
+    if not main_nutrient_block:
+        return scraped_data # Return what we have (energy values)
+
+    # Find all direct children of this block that are potential nutrient rows
+    # These are divs with classes 'text-subtitle', 'text-nutrient', or 'text-desc'
+    # We need to be careful with text-desc as it can be RDI or a sub-nutrient value
+    nutrient_rows = main_nutrient_block.find_all('div', recursive=False, class_=lambda x: x and any(cls in x for cls in ['text-subtitle', 'text-nutrient', 'text-desc']))
+
+    temp_nutrients = {} # Store {nutrient_name: {value_text, rdi_text}}
+    current_main_nutrient = None # To link RDI to the correct main nutrient
+
+    for i, row in enumerate(nutrient_rows):
+        row_text_raw = row.get_text(strip=True)
+
+        # Check if it's a main nutrient label (text-subtitle with an icon or specific keywords)
+        if 'text-subtitle' in row.get('class', []):
+            # Remove md-icon tag before getting text to clean nutrient name
+            icon_tag = row.find('md-icon', class_='material-icons')
+            if icon_tag:
+                icon_tag.extract() # Remove the icon tag from the soup object
+
+            nutrient_name = row.find('div', class_='flex-auto').get_text(strip=True) if row.find('div', class_='flex-auto') else row_text_raw.strip()
+
+            # Check for specific keywords to confirm it's a main nutrient label
+            if any(k in nutrient_name for k in ['Bílkoviny', 'Sacharidy', 'Tuky', 'Vláknina', 'Sůl', 'Vápník', 'Sodík', 'Voda', 'PHE']):
+                current_main_nutrient = nutrient_name
+
+                # The value is typically in the last div child of this row
+                value_div_candidate = row.find_all('div')[-1]
+                value_text = "N/A"
+                if value_div_candidate:
+                    # Get all text content from the value_div_candidate
+                    value_text = value_div_candidate.get_text(strip=True)
+
+                temp_nutrients[current_main_nutrient] = {"value": value_text, "rdi": "N/A"}
+            else:
+                pass
+
+        # Check if it's a sub-nutrient (text-nutrient)
+        elif 'text-nutrient' in row.get('class', []):
+            # Find all direct div children of the current row
+            direct_div_children = row.find_all('div', recursive=False)
+
+            sub_nutrient_name = "N/A"
+            value_text = "N/A"
+
+            if len(direct_div_children) >= 2:
+                # The first div child should contain the name
+                sub_nutrient_name = direct_div_children[0].get_text(strip=True)
+                # The last div child should contain the value
+                value_text = direct_div_children[-1].get_text(strip=True)
+
+            if sub_nutrient_name and sub_nutrient_name != "N/A": # Ensure we actually got a name
+                temp_nutrients[sub_nutrient_name] = {"value": value_text, "rdi": "N/A"}
+            else:
+                pass
+
+        # Check if it's an RDI (text-desc)
+        elif 'text-desc' in row.get('class', []): # Removed "Doporučený denní příjem" from condition to catch all text-desc
+            # Check if it's an RDI row
+            if 'Doporučený denní příjem' in row_text_raw:
+                if current_main_nutrient and current_main_nutrient in temp_nutrients:
+                    # The RDI value is usually directly within this 'text-desc' div, or its last child div
+                    rdi_value_text = row_text_raw.replace('Doporučený denní příjem:', '').strip()
+                    if rdi_value_text:
+                        temp_nutrients[current_main_nutrient]["rdi"] = rdi_value_text
+                else:
+                    pass
+            else:
+                pass
+
+
+    # Now, populate scraped_data from temp_nutrients
+    assign_nutrients(scraped_data, temp_nutrients)
+    return scraped_data
+
+
+def assign_nutrients(scraped_data, temp_nutrients):
+    """Převede nalezené řádky živin {název: {value, rdi}} na klíče odpovědi /get_details."""
+    for nutrient_name, data in temp_nutrients.items():
+        parsed_value = extract_value_and_unit_from_text(data['value'])
+        display_value = f"{parsed_value['value'].replace('.', ',')} {parsed_value['unit']}".strip() if parsed_value['value'] != "N/A" else "N/A"
+
+        parsed_rdi = extract_value_and_unit_from_text(data['rdi'])
+        rdi_display_value = f"{parsed_rdi['value'].replace('.', ',')} {parsed_rdi['unit']}".strip() if parsed_rdi['value'] != "N/A" else "N/A"
+
+
+        # Assign values based on name_text
+        if "Bílkoviny" in nutrient_name:
+            scraped_data["protein"] = display_value
+            scraped_data["protein_rdi"] = rdi_display_value
+        elif "Sacharidy" in nutrient_name:
+            scraped_data["carbs"] = display_value
+            scraped_data["carbs_rdi"] = rdi_display_value
+        elif "Cukry" in nutrient_name:
+            scraped_data["sugar"] = display_value
+        elif "Tuky" in nutrient_name:
+            scraped_data["fat"] = display_value
+            scraped_data["fat_rdi"] = rdi_display_value
+        elif "Nasycené mastné kyseliny" in nutrient_name:
+            scraped_data["saturated_fat"] = display_value
+        elif "Trans mastné kyseliny" in nutrient_name:
+            scraped_data["trans_fat"] = display_value
+        elif "Mononenasycené" in nutrient_name:
+            scraped_data["monounsaturated_fat"] = display_value
+        elif "Polynenasycené" in nutrient_name:
+            scraped_data["polyunsaturated_fat"] = display_value
+        elif "Cholesterol" in nutrient_name:
+            scraped_data["cholesterol"] = display_value
+        elif "Vláknina" in nutrient_name:
+            scraped_data["fiber"] = display_value
+            scraped_data["fiber_rdi"] = rdi_display_value
+        elif "Sůl" in nutrient_name:
+            scraped_data["salt"] = display_value
+        elif "Vápník" in nutrient_name:
+            scraped_data["calcium"] = display_value
+        elif "Sodík" in nutrient_name:
+            scraped_data["sodium"] = display_value
+        elif "Voda" in nutrient_name:
+            scraped_data["water"] = display_value
+        elif "PHE" in nutrient_name:
+            scraped_data["phe"] = display_value
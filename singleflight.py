@@ -0,0 +1,99 @@
+# singleflight.py - Sdílení rozpracovaného stahování mezi souběžnými požadavky (single-flight)
+# Když více požadavků ve stejném workeru současně potřebuje stejný autocomplete dotaz, stejnou
+# detailní stránku nebo stejný obrázek, stahuje a parsuje se jen jednou a ostatní počkají na výsledek.
+# Zátěž upstreamu při špičce tak roste s počtem různých položek, ne s počtem uživatelů.
+# Výsledek dostanou všichni čekající stejný objekt - volající ho nesmí měnit.
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Single-flight pro vlákna (WSGI worker, ThreadPoolExecutor)."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0  # volání, která opravdu stahovala
+        self.shared = 0   # volání, která počkala na výsledek jiného
+
+    def do(self, key, function, *args):
+        """
+        Vrátí function(*args). Probíhá-li už volání se stejným klíčem, počká na jeho výsledek
+        (nebo vyhodí stejnou výjimku) místo vlastního volání.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                is_leader = True
+            else:
+                self.shared += 1
+                is_leader = False
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    Single-flight pro asyncio (ASGI). Stahování běží jako samostatný task, takže když se
+    klient, který ho spustil, odpojí, ostatní čekající výsledek stejně dostanou.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = {}
+
+        self.leaders = 0
+        self.shared = 0
+
+    def _finished(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # výjimku už mohl převzít čekající; jinak by asyncio hlásilo "never retrieved"
+
+    async def do(self, key, function, *args):
+        """Asynchronní obdoba SingleFlight.do() - function je korutinová funkce."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda finished_task: self._finished(key, finished_task))
+            self.leaders += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._tasks)}
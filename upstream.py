@@ -0,0 +1,125 @@
+# upstream.py - Sdílený HTTP klient pro komunikaci s www.kaloricketabulky.cz
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import ratelimit
+import scheduler
+
+#  URL pro autocomplete API KalorickýchTabulky.cz
+# (obě URL lze přepsat v prostředí, např. pro zátěžový test proti benchmarks/standin_upstream.py)
+SEARCH_API_URL = os.getenv('SEARCH_API_URL', "https://www.kaloricketabulky.cz/autocomplete/foodstuff-activity-meal")
+# Základní URL pro detailní stránky a obrázky
+BASE_WEB_URL = os.getenv('BASE_WEB_URL', "https://www.kaloricketabulky.cz").rstrip('/')
+
+# Výchozí HTTP hlavičky pro simulaci prohlížeče
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Referer': 'https://www.kaloricketabulky.cz/'
+}
+
+# Počet hostitelů, pro které se drží pool spojení
+UPSTREAM_POOL_CONNECTIONS = int(os.getenv('UPSTREAM_POOL_CONNECTIONS', '4'))
+# Maximální počet otevřených (keep-alive) spojení na jednoho hostitele
+UPSTREAM_POOL_MAXSIZE = int(os.getenv('UPSTREAM_POOL_MAXSIZE', '16'))
+# Pokud jsou všechna spojení obsazená, počkat na volné (True) místo otevírání dalších
+UPSTREAM_POOL_BLOCK = os.getenv('UPSTREAM_POOL_BLOCK', 'true').lower() in ('1', 'true', 'yes')
+
+# Timeouty (připojení, čtení) v sekundách podle druhu požadavku
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+UPSTREAM_TIMEOUTS = {
+    'autocomplete': (UPSTREAM_CONNECT_TIMEOUT, float(os.getenv('UPSTREAM_AUTOCOMPLETE_TIMEOUT', '10'))),
+    'image': (UPSTREAM_CONNECT_TIMEOUT, float(os.getenv('UPSTREAM_IMAGE_TIMEOUT', '5'))),
+    'detail': (UPSTREAM_CONNECT_TIMEOUT, float(os.getenv('UPSTREAM_DETAIL_TIMEOUT', '10'))),
+}
+
+
+
+class RateLimited(requests.exceptions.RequestException):
+    """Společný rozpočet požadavků je vyčerpaný a požadavek se odkládá (ratelimit.py)."""
+
+
+# Souběžné požadavky workeru na web s předností interaktivních (scheduler.py)
+upstream_gate = scheduler.PriorityGate('upstream', scheduler.UPSTREAM_MAX_IN_FLIGHT, scheduler.UPSTREAM_RESERVED_SLOTS)
+scheduler.register_metrics(upstream_gate)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Vrátí sdílenou requests.Session pro aktuální proces.
+    Každý gunicorn worker má vlastní session (po forku se vytvoří nová), spojení se recyklují přes keep-alive.
+    """
+    global _session, _session_pid
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            adapter = HTTPAdapter(pool_connections=UPSTREAM_POOL_CONNECTIONS,
+                                  pool_maxsize=UPSTREAM_POOL_MAXSIZE,
+                                  pool_block=UPSTREAM_POOL_BLOCK)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+    return _session
+
+
+def _release_on_close(response, priority_class):
+    """Uvolní místo v upstream_gate, až volající zavře streamovanou odpověď (jen jednou)."""
+    close = response.close
+    released = []
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released:
+                released.append(True)
+                upstream_gate.release(priority_class)
+
+    response.close = close_and_release
+
+
+def get(url, kind='detail', **kwargs):
+    """
+    Provede GET požadavek přes sdílenou session.
+    kind ('autocomplete', 'image', 'detail') určuje timeout, pokud není předán explicitně, a rozpočet
+    v ratelimit.py; při vyčerpaném rozpočtu vyhodí RateLimited. Místo v upstream_gate se drží
+    do přijetí odpovědi, u stream=True až do zavření odpovědi (with upstream.get(...) as response).
+    Doba do přijetí odpovědi a HTTP status se zaznamenají do metrik; u stream=True stažené bajty
+    a čas čtení těla počítá volající (metrics.inc('kalkulacka_upstream_bytes_total', ...), metrics.add_timing()).
+    """
+    kwargs.setdefault('timeout', UPSTREAM_TIMEOUTS[kind])
+    priority_class = scheduler.request_class(kind)
+    if not ratelimit.acquire(kind, priority_class):
+        raise RateLimited(f"Vyčerpaný rozpočet požadavků ({kind}), požadavek odložen: {url}")
+    upstream_gate.acquire(priority_class)
+    started = time.perf_counter()
+    try:
+        response = get_session().get(url, **kwargs)
+    except BaseException as e:
+        upstream_gate.release(priority_class)
+        if isinstance(e, requests.exceptions.RequestException):
+            metrics.observe_upstream(kind, url, 'error', time.perf_counter() - started)
+        raise
+    if kwargs.get('stream'):
+        _release_on_close(response, priority_class)
+    else:
+        upstream_gate.release(priority_class)
+    downloaded_bytes = 0 if kwargs.get('stream') else len(response.content)
+    elapsed = time.perf_counter() - started
+    metrics.observe_upstream(kind, url, response.status_code, elapsed, downloaded_bytes)
+    if not kwargs.get('stream'):
+        metrics.add_timing('upstream', elapsed)
+        metrics.add_timing_count('bytes', downloaded_bytes)
+    return response